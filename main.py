@@ -2,60 +2,28 @@
 import sys
 from pathlib import Path
 import os
+import subprocess
 import threading
 import asyncio
 import logging
 import tkinter as tk
 from tkinter import messagebox, ttk, filedialog, simpledialog
 import traceback
-import cohere
 
 # Third-party imports
 import warnings
 warnings.filterwarnings("ignore", category=FutureWarning, module="huggingface_hub.file_download")
 from dotenv import load_dotenv, set_key
-from sentence_transformers import SentenceTransformer
-import google.generativeai as genai
 
 # Local imports
+# Feature modules pull in heavy dependencies (torch, sentence_transformers, spaCy, tensorflow,
+# the LLM SDKs), so each is imported by the method that starts the feature rather than here.
 from src.api_model import create_erag_api, get_available_models, update_settings, EragAPI
-from src.talk2doc import RAGSystem
-from src.embeddings_utils import compute_and_save_embeddings, load_or_compute_embeddings
-from src.create_graph import create_knowledge_graph, create_knowledge_graph_from_raw
+from src.embedding_store import embeddings_exist
 from src.settings import settings
-from src.search_utils import SearchUtils
-from src.create_knol import KnolCreator
-from src.web_sum import WebSum
-from src.web_rag import WebRAG
-from src.route_query import RouteQuery
-from src.talk2model import Talk2Model
-from src.create_sum import run_create_sum
-from src.talk2url import Talk2URL
-from src.talk2git import Talk2Git
-from src.create_q import run_create_q
 from src.server import ServerManager
-from src.gen_a import run_gen_a
 from src.look_and_feel import error, success, warning, info, highlight
-from src.talk2sd import Talk2SD
-from src.x_da import ExploratoryDataAnalysis
 from src.file_processing import upload_multiple_files, FileProcessor
-from src.self_knol import SelfKnolCreator
-from src.ax_da_b1 import AdvancedExploratoryDataAnalysisB1
-from src.ax_da_b2 import AdvancedExploratoryDataAnalysisB2
-from src.i_da import InnovativeDataAnalysis
-from src.ax_da_b3 import AdvancedExploratoryDataAnalysisB3
-from src.ax_da_b4 import AdvancedExploratoryDataAnalysisB4
-from src.fn_processing import process_financial_data
-from src.f_da import FinancialExploratoryDataAnalysis
-from src.ax_da_b5 import AdvancedExploratoryDataAnalysisB5
-from src.ax_da_b6 import AdvancedExploratoryDataAnalysisB6
-from src.ax_da_b7 import AdvancedExploratoryDataAnalysisB7
-from src.merge_sd import merge_structured_data
-from src.code_editor import CodeEditor
-from src.textbook_generator import TextbookGenerator, SupervisorTextbookGenerator
-from src.textbook_rag import RagTextbookGenerator
-from src.text_analysis import run_text_analysis
-from src.check_dq import DataQualityChecker
 
 
 # Add the project root directory to the Python path
@@ -103,7 +71,6 @@ class ERAGGUI:
         self.api_type_var.set("ollama")  # Default to ollama
         self.model_var = tk.StringVar(master)
         self.rag_system = None
-        self.model = SentenceTransformer(settings.model_name)
         self.db_embeddings = None
         self.db_indexes = None
         self.db_content = None
@@ -400,6 +367,7 @@ class ERAGGUI:
                                 f"Embedding model: {embedding_model}")
 
     def update_model_list(self, event=None):
+        import google.generativeai as genai
         api_type = self.api_type_var.get()
         
         if api_type == "llama":
@@ -537,6 +505,7 @@ class ERAGGUI:
        
 
     def run_code_editor(self):
+        from src.code_editor import CodeEditor
         try:
             api_type = self.api_type_var.get()
             worker_model = self.model_var.get()
@@ -563,6 +532,7 @@ class ERAGGUI:
 
 
     def run_talk2model(self):
+        from src.talk2model import Talk2Model
         try:
             api_type = self.api_type_var.get()
             model = self.model_var.get()
@@ -712,19 +682,30 @@ class ERAGGUI:
         self.create_settings_fields(upload_frame, [
             ("Chunk Size", "file_chunk_size"),
             ("Overlap Size", "file_overlap_size"),
+            ("Ingest Workers (0 = auto)", "ingest_workers"),
         ])
 
         self.create_settings_fields(embeddings_frame, [
             ("Batch Size", "batch_size"),
             ("Embeddings File Path", "embeddings_file_path"),
+            ("Embedding Dtype", "embedding_dtype"),
             ("DB File Path", "db_file_path"),
+            ("Vector Index Type", "vector_index_type"),
+            ("Vector Index Min Size", "vector_index_min_size"),
+            ("IVF Probes", "ivf_nprobe"),
+            ("HNSW ef Search", "hnsw_ef_search"),
+            ("Ollama Embedding Batch Size", "ollama_embedding_batch_size"),
+            ("Ollama Embedding Workers", "ollama_embedding_workers"),
         ])
 
         self.create_settings_fields(graph_frame, [
             ("Graph Chunk Size", "graph_chunk_size"),
             ("Graph Overlap Size", "graph_overlap_size"),
             ("NLP Model", "nlp_model"),
+            ("NLP Batch Size", "nlp_batch_size"),
+            ("NLP Processes (0 = auto)", "nlp_n_process"),
             ("Similarity Threshold", "similarity_threshold"),
+            ("Similarity Block Size", "similarity_block_size"),
             ("Min Entity Occurrence", "min_entity_occurrence"),
             ("Knowledge Graph File Path", "knowledge_graph_file_path"),
         ])
@@ -744,6 +725,8 @@ class ERAGGUI:
             ("Semantic Weight", "semantic_weight"),
             ("Graph Weight", "graph_weight"),
             ("Text Weight", "text_weight"),
+            ("RRF k", "rrf_k"),
+            ("Fusion Candidates", "fusion_candidates"),
         ])
 
         # Create checkboxes for boolean settings
@@ -777,6 +760,7 @@ class ERAGGUI:
             ("Summary Size", "summarization_summary_size"),
             ("Combining Number", "summarization_combining_number"),
             ("Final Chunk Size", "summarization_final_chunk_size"),
+            ("Summarization Workers", "summarization_workers"),
         ])
 
         self.create_settings_fields(question_gen_frame, [
@@ -784,6 +768,7 @@ class ERAGGUI:
             ("Question Chunk Levels", "question_chunk_levels"),
             ("Excluded Question Levels", "excluded_question_levels"),
             ("Questions Per Chunk", "questions_per_chunk"),  # New field for questions per chunk
+            ("Question Workers", "question_workers"),
         ])
 
          # API Settings
@@ -801,12 +786,36 @@ class ERAGGUI:
             ("Max History Length", "max_history_length"),
             ("Conversation Context Size", "conversation_context_size"),
             ("Update Threshold", "update_threshold"),
+            ("Query Cache Size", "query_cache_size"),
+            ("Query Cache TTL (s)", "query_cache_ttl"),
+            ("Query Cache Similarity", "query_cache_similarity"),
+            ("LLM Cache Max Temperature", "llm_cache_max_temperature"),
+            ("Model Idle Timeout (s)", "model_idle_timeout"),
+            ("Route Local Threshold", "route_local_threshold"),
+            ("Route Web Threshold", "route_web_threshold"),
+            ("Route Semantic Weight", "route_semantic_weight"),
+            ("Route Deep Query Words", "route_deep_query_words"),
         ])
 
         self.create_settings_fields(rerank_frame, [
             ("Re-rank Top K", "rerank_top_k"),
+            ("Re-rank Method (embedding/cross_encoder/llm)", "rerank_method"),
+            ("Cross-Encoder Model", "cross_encoder_model"),
+            ("Re-rank Lexical Weight", "rerank_lexical_weight"),
+            ("Re-rank Batch Size", "rerank_batch_size"),
         ])
 
+        self.create_checkbox(api_frame, "Pre-warm Route Query", "route_prewarm",
+                             len(api_frame.grid_slaves()), 0)
+        self.create_checkbox(api_frame, "Route Query Pre-router", "route_prerouter_enabled",
+                             len(api_frame.grid_slaves()), 0)
+        self.create_checkbox(api_frame, "Cache Talk2Doc Answers", "query_cache_enabled",
+                             len(api_frame.grid_slaves()), 0)
+        self.create_checkbox(api_frame, "Stream Chat Output", "stream_output",
+                             len(api_frame.grid_slaves()), 0)
+        self.create_checkbox(api_frame, "Cache LLM Responses", "llm_cache_enabled",
+                             len(api_frame.grid_slaves()), 0)
+
          # Add this new checkbox
         self.create_checkbox(xdas_frame, "Save Results to TXT", "save_results_to_txt", 
                              len(xdas_frame.grid_slaves()), 0)
@@ -991,6 +1000,7 @@ class ERAGGUI:
         self.dataset_output_file_var.set(os.path.basename(settings.dataset_output_file))
 
     def run_route_query(self):
+        from src.route_query import RouteQuery
         try:
             api_type = self.api_type_var.get()
             model = self.model_var.get()
@@ -1039,6 +1049,7 @@ class ERAGGUI:
             messagebox.showerror("Error", f"An error occurred while starting the summarization process: {str(e)}")
 
     def _create_sum_thread(self, file_path, api_type, erag_api):
+        from src.create_sum import run_create_sum
         try:
             result = run_create_sum(file_path, api_type, erag_api)
             print(result)
@@ -1049,6 +1060,7 @@ class ERAGGUI:
             messagebox.showerror("Error", error_message)
 
     def create_knol(self):
+        from src.create_knol import KnolCreator
         try:
             api_type = self.api_type_var.get()
             worker_model = self.model_var.get()
@@ -1101,6 +1113,8 @@ class ERAGGUI:
 
 
     def execute_embeddings(self):
+        from src.embeddings_utils import load_or_compute_embeddings
+        from src.model_registry import get_sentence_transformer
         try:
             # Ensure we're using the correct path from settings
             db_file_path = settings.db_file_path
@@ -1113,13 +1127,14 @@ class ERAGGUI:
             if settings.default_embedding_class == "ollama":
                 model = create_erag_api(settings.api_type, embedding_class=settings.default_embedding_class, embedding_model=settings.default_embedding_model)
             else:
-                model = SentenceTransformer(settings.default_embedding_model)
+                model = get_sentence_transformer(settings.default_embedding_model)
 
             # Process db.txt
             self.db_embeddings, self.db_indexes, self.db_content = load_or_compute_embeddings(
                 model, 
                 db_file_path, 
-                settings.embeddings_file_path
+                settings.embeddings_file_path,
+                settings.default_embedding_model
             )
             messagebox.showinfo("Success", f"Embeddings computed and saved successfully to {settings.embeddings_file_path}. Shape: {self.db_embeddings.shape}")
 
@@ -1127,8 +1142,9 @@ class ERAGGUI:
             messagebox.showerror("Error", f"An error occurred while computing embeddings: {str(e)}")
 
     def create_knowledge_graph(self):
+        from src.create_graph import create_knowledge_graph
         try:
-            if not os.path.exists(settings.db_file_path) or not os.path.exists(settings.embeddings_file_path):
+            if not os.path.exists(settings.db_file_path) or not embeddings_exist(settings.embeddings_file_path):
                 messagebox.showwarning("Warning", f"{settings.db_file_path} or {settings.embeddings_file_path} not found. Please upload documents and execute embeddings first.")
                 return
 
@@ -1144,6 +1160,7 @@ class ERAGGUI:
             messagebox.showerror("Error", f"An error occurred while creating the knowledge graph: {str(e)}")
 
     def create_self_knol(self):
+        from src.self_knol import SelfKnolCreator
         try:
             api_type = self.api_type_var.get()
             worker_model = self.model_var.get()
@@ -1184,6 +1201,7 @@ class ERAGGUI:
 
 
     def create_knowledge_graph_from_raw(self):
+        from src.create_graph import create_knowledge_graph_from_raw
         try:
             raw_file_path = filedialog.askopenfilename(title="Select Raw Document File",
                                                        filetypes=[("Text Files", "*.txt")])
@@ -1204,6 +1222,7 @@ class ERAGGUI:
 
 
     def run_talk2urls(self):
+        from src.talk2url import Talk2URL
         try:
             api_type = self.api_type_var.get()
             model = self.model_var.get()
@@ -1222,6 +1241,7 @@ class ERAGGUI:
 
 
     def run_talk2git(self):
+        from src.talk2git import Talk2Git
         try:
             api_type = self.api_type_var.get()
             model = self.model_var.get()
@@ -1265,6 +1285,7 @@ class ERAGGUI:
 
 
     def _create_q_thread(self, file_path, api_type, erag_api):
+        from src.create_q import run_create_q
         try:
             result = run_create_q(file_path, api_type, erag_api)
             print(result)
@@ -1277,6 +1298,7 @@ class ERAGGUI:
 
 
     def run_web_sum(self):
+        from src.web_sum import WebSum
         try:
             api_type = self.api_type_var.get()
             model = self.model_var.get()
@@ -1295,6 +1317,7 @@ class ERAGGUI:
 
 
     def run_web_rag(self):
+        from src.web_rag import WebRAG
         try:
             api_type = self.api_type_var.get()
             model = self.model_var.get()
@@ -1497,6 +1520,7 @@ class ERAGGUI:
 
 
     def run_xda(self):
+        from src.x_da import ExploratoryDataAnalysis
         try:
             db_path = filedialog.askopenfilename(
                 title="Select SQLite Database",
@@ -1563,6 +1587,7 @@ class ERAGGUI:
 
     
     def run_axda_b1(self):
+        from src.ax_da_b1 import AdvancedExploratoryDataAnalysisB1
         try:
             db_path = filedialog.askopenfilename(
                 title="Select SQLite Database",
@@ -1627,6 +1652,7 @@ class ERAGGUI:
             messagebox.showerror("Error", error_message)
 
     def run_axda_b2(self):
+        from src.ax_da_b2 import AdvancedExploratoryDataAnalysisB2
         try:
             db_path = filedialog.askopenfilename(
                 title="Select SQLite Database",
@@ -1692,6 +1718,7 @@ class ERAGGUI:
 
 
     def run_ixda(self):
+        from src.i_da import InnovativeDataAnalysis
         try:
             db_path = filedialog.askopenfilename(
                 title="Select SQLite Database",
@@ -1757,6 +1784,7 @@ class ERAGGUI:
 
 
     def run_axda_b3(self):
+        from src.ax_da_b3 import AdvancedExploratoryDataAnalysisB3
         try:
             db_path = filedialog.askopenfilename(
                 title="Select SQLite Database",
@@ -1821,6 +1849,7 @@ class ERAGGUI:
             messagebox.showerror("Error", error_message)
 
     def run_axda_b4(self):
+        from src.ax_da_b4 import AdvancedExploratoryDataAnalysisB4
         try:
             db_path = filedialog.askopenfilename(
                 title="Select SQLite Database",
@@ -1885,6 +1914,7 @@ class ERAGGUI:
             messagebox.showerror("Error", error_message)
 
     def run_axda_b5(self):
+        from src.ax_da_b5 import AdvancedExploratoryDataAnalysisB5
         try:
             db_path = filedialog.askopenfilename(
                 title="Select SQLite Database",
@@ -1949,6 +1979,7 @@ class ERAGGUI:
             messagebox.showerror("Error", error_message)
 
     def run_axda_b6(self):
+        from src.ax_da_b6 import AdvancedExploratoryDataAnalysisB6
         try:
             db_path = filedialog.askopenfilename(
                 title="Select SQLite Database",
@@ -2013,6 +2044,7 @@ class ERAGGUI:
             messagebox.showerror("Error", error_message)
 
     def run_axda_b7(self):
+        from src.ax_da_b7 import AdvancedExploratoryDataAnalysisB7
         try:
             db_path = filedialog.askopenfilename(
                 title="Select SQLite Database",
@@ -2103,6 +2135,7 @@ class ERAGGUI:
             messagebox.showerror("Error", f"An error occurred while processing the financial data: {str(e)}")
 
     def run_fxda(self):
+        from src.f_da import FinancialExploratoryDataAnalysis
         try:
             db_path = filedialog.askopenfilename(
                 title="Select Financial SQLite Database",
@@ -2171,6 +2204,7 @@ class ERAGGUI:
             messagebox.showerror("Error", error_message)
 
     def merge_structured_data(self):
+        from src.merge_sd import merge_structured_data
         try:
             file1 = filedialog.askopenfilename(
                 title="Select First Structured Data File",
@@ -2234,6 +2268,7 @@ class ERAGGUI:
             messagebox.showerror("Error", f"An error occurred while starting the Mixture of Agents process: {str(e)}")
 
     def run_create_textbook(self):
+        from src.textbook_generator import SupervisorTextbookGenerator
         try:
             api_type = self.api_type_var.get()
             worker_model = self.model_var.get()
@@ -2366,6 +2401,7 @@ class ERAGGUI:
             messagebox.showerror("Error", error_message)
 
     def run_data_quality(self):
+        from src.check_dq import DataQualityChecker
         try:
             db_path = filedialog.askopenfilename(
                 title="Select SQLite Database for Data Quality Check",
@@ -2498,6 +2534,7 @@ class ERAGGUI:
         self.master.destroy()
 
     def run_model(self):
+        import google.generativeai as genai
         try:
             api_type = self.api_type_var.get()
             model = self.model_var.get()
@@ -2545,6 +2582,7 @@ class ERAGGUI:
             messagebox.showerror("Error", error_message)
 
     def check_api_keys(self):
+        import google.generativeai as genai
         if self.api_type_var.get() == "groq" and not self.groq_api_key:
             self.groq_api_key = simpledialog.askstring("Groq API Key", "Please enter your Groq API Key:", show='*')
             if self.groq_api_key:
@@ -1,27 +1,105 @@
 # Standard library imports
 import os
+import random
 import subprocess
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterator, Optional, Tuple
 
 # Third-party imports
-import google.generativeai as genai
+# The LLM SDKs, torch and sentence_transformers are imported where a backend is first used,
+# so importing this module (and starting the GUI) does not pay for backends that are not selected
+import numpy as np
 import requests
-import torch
 from dotenv import load_dotenv
-from groq import Groq
-from openai import OpenAI
-from sentence_transformers import SentenceTransformer
-import google.generativeai as genai
-import cohere
-import cohere
-
-
 
 # Local imports
-from src.look_and_feel import error, success, warning, info
+from src.look_and_feel import error, success, warning, info, BOLD, RED
+from src.response_cache import get_response_cache, response_key, should_cache
 from src.settings import settings
 
 load_dotenv()
 
+# A streamed text delta and, on the chunk that carries it, the usage record
+Delta = Tuple[str, Optional[Dict[str, int]]]
+
+def is_error_response(text) -> bool:
+    """True for the error strings chat()/complete() return instead of raising, also when a stream ended in one."""
+    return isinstance(text, str) and f"{BOLD}{RED}" in text
+
+def _usage(prompt_tokens=None, completion_tokens=None, total_tokens=None) -> Optional[Dict[str, int]]:
+    if prompt_tokens is None and completion_tokens is None and total_tokens is None:
+        return None
+    prompt_tokens, completion_tokens = prompt_tokens or 0, completion_tokens or 0
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": total_tokens if total_tokens is not None else prompt_tokens + completion_tokens}
+
+class ChatStream:
+    """
+    Text deltas of a streamed chat response, the same for every backend. Iterate it (or
+    `async for` over it) once; afterwards `text` holds the whole response and `usage` the
+    token counts the backend reported, or None. An error ends the stream with the error
+    string chat() would have returned, and sets `error`.
+    """
+
+    def __init__(self, deltas: Iterator[Delta]):
+        self._deltas = deltas
+        self.parts = []
+        self.usage: Optional[Dict[str, int]] = None
+        self.error: Optional[str] = None
+        self.started = time.perf_counter()
+        self.time_to_first_token: Optional[float] = None
+
+    def __iter__(self) -> Iterator[str]:
+        try:
+            for delta, usage in self._deltas:
+                if usage:
+                    self.usage = usage
+                if delta:
+                    if self.time_to_first_token is None:
+                        self.time_to_first_token = time.perf_counter() - self.started
+                    self.parts.append(delta)
+                    yield delta
+        except Exception as e:
+            self.error = str(e)
+            message = error(f"An error occurred: {str(e)}")
+            self.parts.append(message)
+            yield message
+
+    async def __aiter__(self):
+        import asyncio
+        # The SDK streams are blocking, so each delta is read on a worker thread
+        iterator, done = iter(self), object()
+        while True:
+            delta = await asyncio.to_thread(next, iterator, done)
+            if delta is done:
+                return
+            yield delta
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    def consume(self, on_token: Optional[Callable[[str], None]] = None) -> str:
+        """Read the whole stream, passing each delta to on_token, and return the text."""
+        for delta in self:
+            if on_token is not None:
+                on_token(delta)
+        return self.text
+
+def print_token(delta: str):
+    """on_token callback that writes deltas to the console as they arrive."""
+    print(delta, end="", flush=True)
+
+def _openai_deltas(chunks) -> Iterator[Delta]:
+    """Deltas from an OpenAI-style stream (Ollama, Groq); Groq reports usage under x_groq."""
+    for chunk in chunks:
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        usage = getattr(chunk, 'usage', None) or getattr(getattr(chunk, 'x_groq', None), 'usage', None)
+        yield delta or "", _usage(usage.prompt_tokens, usage.completion_tokens, usage.total_tokens) if usage else None
+
 class EragAPI:
     def __init__(self, api_type, model=None, embedding_class=None, embedding_model=None, reranker_model=None):
         self.api_type = api_type
@@ -31,7 +109,7 @@ class EragAPI:
         self.reranker_model = reranker_model or settings.reranker_model
 
         clients = {
-            "ollama": lambda: OpenAI(base_url='http://localhost:11434/v1', api_key='ollama'),
+            "ollama": lambda: _openai_client(),
             "llama": LlamaClient,
             "groq": lambda: GroqClient(self.model),
             "gemini": lambda: GeminiClient(self.model),
@@ -41,53 +119,178 @@ class EragAPI:
 
 
         embedding_clients = {
-            "ollama": lambda: OpenAI(base_url='http://localhost:11434/v1', api_key='ollama'),
-            "sentence_transformers": lambda: SentenceTransformer(self.embedding_model)
+            # Retries are handled with backoff in _embed_request
+            "ollama": lambda: _openai_client(max_retries=0),
+            "sentence_transformers": lambda: _sentence_transformer(self.embedding_model)
         }
         self.embedding_client = embedding_clients.get(self.embedding_class, lambda: ValueError(f"Invalid embedding class: {self.embedding_class}"))()
+        self._embedding_executor = None
+        self._embedding_executor_lock = threading.Lock()
 
     def _encode(self, texts):
         print(info(f"Starting embedding process for {len(texts)} texts"))
         if self.embedding_class == "ollama":
-            embeddings = [self.embedding_client.embeddings.create(model=self.embedding_model, input=text).data[0].embedding for text in texts]
-            return torch.tensor(embeddings)
+            return np.asarray(self._encode_ollama(list(texts)), dtype=np.float32)
         return self.embedding_client.encode(texts)
 
-    def chat(self, messages, temperature=0.7, max_tokens=None, stream=False):
+    @property
+    def encode_block_size(self):
+        """How many texts callers should hand to _encode at once to keep every request slot busy."""
+        if self.embedding_class == "ollama":
+            return settings.ollama_embedding_batch_size * settings.ollama_embedding_workers
+        return settings.batch_size
+
+    def _get_embedding_executor(self):
+        with self._embedding_executor_lock:
+            if self._embedding_executor is None:
+                self._embedding_executor = ThreadPoolExecutor(max_workers=settings.ollama_embedding_workers, thread_name_prefix="embedding")
+            return self._embedding_executor
+
+    def _embed_request(self, batch):
+        """One embeddings request for a list of texts, retried with exponential backoff."""
+        for attempt in range(settings.embedding_max_retries + 1):
+            try:
+                response = self.embedding_client.embeddings.create(model=self.embedding_model, input=batch)
+                return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+            except Exception as e:
+                if attempt == settings.embedding_max_retries:
+                    raise
+                delay = settings.embedding_retry_delay * (2 ** attempt) * (1 + random.random() * 0.1)
+                print(warning(f"Embedding request failed ({str(e)}), retrying in {delay:.1f}s"))
+                time.sleep(delay)
+
+    def _encode_ollama(self, texts):
+        """Send many texts per request and keep several requests in flight over the pooled connection."""
+        if not texts:
+            return []
+        batch_size = max(1, settings.ollama_embedding_batch_size)
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        start = time.perf_counter()
+        results = [None] * len(batches)
+        done = 0
+        futures = {self._get_embedding_executor().submit(self._embed_request, batch): i for i, batch in enumerate(batches)}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+            done += len(batches[futures[future]])
+            elapsed = max(time.perf_counter() - start, 1e-9)
+            print(info(f"Embedded {done}/{len(texts)} texts ({done / elapsed:.1f} texts/sec)"))
+        return [embedding for batch in results for embedding in batch]
+
+    def chat(self, messages, temperature=0.7, max_tokens=None, stream=False, on_token=None, cache=None):
+        """
+        The response text. With stream=True a ChatStream of text deltas is returned instead;
+        with on_token the response is streamed to that callback and the full text returned.
+        `cache` opts the call site into the persistent response cache with one of the
+        policies in src.response_cache (streamed responses are not cached).
+        """
+        if stream or on_token is not None:
+            chat_stream = ChatStream(self._chat_deltas(messages, temperature, max_tokens))
+            return chat_stream.consume(on_token) if on_token is not None else chat_stream
+        response_cache, key, cached = self._cache_lookup("chat", messages, temperature, max_tokens, cache)
+        if cached is not None:
+            return cached
+        response = self._chat(messages, temperature, max_tokens)
+        self._cache_store(response_cache, key, response)
+        return response
+
+    def _cache_lookup(self, kind, request, temperature, max_tokens, cache):
+        """(cache, key, stored response) when the call site's policy allows caching, else Nones."""
+        response_cache = get_response_cache() if should_cache(cache, temperature) else None
+        if response_cache is None:
+            return None, None, None
+        key = response_key(kind, self.api_type, self.model, request, temperature, max_tokens)
+        return response_cache, key, response_cache.get(key)
+
+    @staticmethod
+    def _cache_store(response_cache, key, response):
+        # Errors come back as strings, and must not be replayed on the next run
+        if response_cache is not None and isinstance(response, str) and not is_error_response(response):
+            response_cache.put(key, response)
+
+    def _chat(self, messages, temperature=0.7, max_tokens=None):
         try:
             if self.api_type == "gemini":
-                model = genai.GenerativeModel(self.model)
-                
-                # Format messages for Gemini API
-                formatted_messages = []
-                for message in messages:
-                    if message['role'] == 'system':
-                        formatted_messages.append({"role": "user", "parts": [{"text": f"System: {message['content']}"}]})
-                    elif message['role'] in ['user', 'assistant']:
-                        formatted_messages.append({"role": message['role'], "parts": [{"text": message['content']}]})
-                
-                if not any(msg['role'] == 'user' for msg in formatted_messages):
-                    formatted_messages.append({"role": "user", "parts": [{"text": " "}]})
-                
-                response = model.generate_content(
-                    formatted_messages,
-                    generation_config=genai.types.GenerationConfig(
-                        temperature=temperature,
-                        max_output_tokens=max_tokens,
-                    ),
-                    stream=stream
-                )
-                return response if stream else response.text
+                return self._gemini_chat(messages, temperature, max_tokens).text
             elif self.api_type in ["llama", "groq", "cohere"]:
-                return self.client.chat(messages, temperature=temperature, max_tokens=max_tokens, stream=stream)
+                return self.client.chat(messages, temperature=temperature, max_tokens=max_tokens)
             response = self.client.chat.completions.create(
-                model=self.model, messages=messages, temperature=temperature, max_tokens=max_tokens, stream=stream
+                model=self.model, messages=messages, temperature=temperature, max_tokens=max_tokens
             )
-            return response if stream else response.choices[0].message.content
+            return response.choices[0].message.content
         except Exception as e:
             return error(f"An error occurred: {str(e)}")
 
-    def complete(self, prompt, temperature=0.7, max_tokens=None, stream=False):
+    def _chat_deltas(self, messages, temperature=0.7, max_tokens=None) -> Iterator[Delta]:
+        # A generator, so the request is only sent once ChatStream iterates and its errors end the stream
+        if self.api_type == "gemini":
+            yield from GeminiClient.stream_deltas(self._gemini_chat(messages, temperature, max_tokens, stream=True))
+        elif self.api_type in ["llama", "groq", "cohere"]:
+            yield from self.client.stream_chat(messages, temperature=temperature, max_tokens=max_tokens)
+        else:
+            yield from _openai_deltas(self.client.chat.completions.create(
+                model=self.model, messages=messages, temperature=temperature, max_tokens=max_tokens,
+                stream=True, stream_options={"include_usage": True}
+            ))
+
+    async def achat(self, messages, temperature=0.7, max_tokens=None, cache=None):
+        """chat() on the backend's async client, within its concurrency and rate limits."""
+        from src.async_api import achat
+        response_cache, key, cached = self._cache_lookup("chat", messages, temperature, max_tokens, cache)
+        if cached is not None:
+            return cached
+        response = await achat(self, messages, temperature=temperature, max_tokens=max_tokens)
+        self._cache_store(response_cache, key, response)
+        return response
+
+    async def acomplete(self, prompt, temperature=0.7, max_tokens=None, cache=None):
+        from src.async_api import acomplete
+        response_cache, key, cached = self._cache_lookup("complete", prompt, temperature, max_tokens, cache)
+        if cached is not None:
+            return cached
+        response = await acomplete(self, prompt, temperature=temperature, max_tokens=max_tokens)
+        self._cache_store(response_cache, key, response)
+        return response
+
+    async def aembed(self, texts):
+        from src.async_api import aembed
+        return await aembed(self, texts)
+
+    def _gemini_chat(self, messages, temperature=0.7, max_tokens=None, stream=False):
+        model, formatted_messages, config = self._gemini_request(messages, temperature, max_tokens)
+        return model.generate_content(formatted_messages, generation_config=config, stream=stream)
+
+    def _gemini_request(self, messages, temperature=0.7, max_tokens=None):
+        import google.generativeai as genai
+        model = genai.GenerativeModel(self.model)
+        
+        # Format messages for Gemini API
+        formatted_messages = []
+        for message in messages:
+            if message['role'] == 'system':
+                formatted_messages.append({"role": "user", "parts": [{"text": f"System: {message['content']}"}]})
+            elif message['role'] in ['user', 'assistant']:
+                formatted_messages.append({"role": message['role'], "parts": [{"text": message['content']}]})
+        
+        if not any(msg['role'] == 'user' for msg in formatted_messages):
+            formatted_messages.append({"role": "user", "parts": [{"text": " "}]})
+        
+        config = genai.types.GenerationConfig(
+            temperature=temperature,
+            max_output_tokens=max_tokens,
+        )
+        return model, formatted_messages, config
+
+    def complete(self, prompt, temperature=0.7, max_tokens=None, stream=False, cache=None):
+        if stream:
+            return self._complete(prompt, temperature, max_tokens, stream=True)
+        response_cache, key, cached = self._cache_lookup("complete", prompt, temperature, max_tokens, cache)
+        if cached is not None:
+            return cached
+        response = self._complete(prompt, temperature, max_tokens)
+        self._cache_store(response_cache, key, response)
+        return response
+
+    def _complete(self, prompt, temperature=0.7, max_tokens=None, stream=False):
         try:
             if self.api_type in ["llama", "groq", "gemini", "cohere"]:
                 return self.client.complete(prompt, temperature=temperature, max_tokens=max_tokens, stream=stream)
@@ -98,11 +301,6 @@ class EragAPI:
         except Exception as e:
             return error(f"An error occurred: {str(e)}")
 
-    def _stream_cohere_response(self, response):
-        for event in response:
-            if event.event_type == "text-generation":
-                yield event.text
-
     
 def update_settings(settings, api_type, model):
     setting_map = {"ollama": "ollama_model", "llama": "llama_model", "groq": "groq_model", "gemini": "gemini_model", "cohere": "cohere_model"}
@@ -123,9 +321,33 @@ class LlamaClient:
             return response.json()['choices'][0]['message']['content' if endpoint == 'chat/completions' else 'text']
         raise Exception(error(f"Error from llama.cpp server: {response.status_code} - {response.text}"))
 
-    def chat(self, messages, temperature=0.7, max_tokens=None):
+    def chat(self, messages, temperature=0.7, max_tokens=None, stream=False):
+        if stream:
+            return ChatStream(self.stream_chat(messages, temperature=temperature, max_tokens=max_tokens))
         return self._request('chat/completions', {"messages": messages, "temperature": temperature, "max_tokens": max_tokens})
 
+    def stream_chat(self, messages, temperature=0.7, max_tokens=None) -> Iterator[Delta]:
+        data = {"messages": messages, "temperature": temperature, "max_tokens": max_tokens, "stream": True}
+        with requests.post(f"{self.base_url}/chat/completions", json=data, stream=True) as response:
+            if response.status_code != 200:
+                raise Exception(error(f"Error from llama.cpp server: {response.status_code} - {response.text}"))
+            # Server-sent events: one "data: {json}" line per chunk, then "data: [DONE]"
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                payload = line[len("data:"):].strip()
+                if payload == "[DONE]":
+                    break
+                chunk = json.loads(payload)
+                choices = chunk.get('choices') or [{}]
+                delta = (choices[0].get('delta') or {}).get('content') or ""
+                usage, timings = chunk.get('usage'), chunk.get('timings')
+                if usage:
+                    usage = _usage(usage.get('prompt_tokens'), usage.get('completion_tokens'), usage.get('total_tokens'))
+                elif timings:
+                    usage = _usage(timings.get('prompt_n'), timings.get('predicted_n'))
+                yield delta, usage
+
     def complete(self, prompt, temperature=0.7, max_tokens=None):
         return self._request('completions', {"prompt": prompt, "temperature": temperature, "max_tokens": max_tokens})
 
@@ -137,6 +359,7 @@ class LlamaClient:
 
 class GroqClient:
     def __init__(self, model=None):
+        from groq import Groq
         self.client = Groq(api_key=os.getenv("GROQ_API_KEY") or ValueError(error("GROQ_API_KEY not found in .env file")))
         self.model = model or self.get_default_model()
 
@@ -160,22 +383,23 @@ class GroqClient:
         completion = self._request(self.client.completions.create, prompt=prompt, temperature=temperature, max_tokens=max_tokens, stream=stream)
         return completion if stream else completion.choices[0].text
 
-    def stream_chat(self, messages, temperature=1, max_tokens=1024):
-        for chunk in self._request(self.client.chat.completions.create, messages=messages, temperature=temperature, max_tokens=max_tokens, stream=True):
-            yield chunk.choices[0].delta.content or ""
+    def stream_chat(self, messages, temperature=0.7, max_tokens=None) -> Iterator[Delta]:
+        yield from _openai_deltas(self._request(self.client.chat.completions.create, messages=messages, temperature=temperature, max_tokens=max_tokens, stream=True))
 
 class GeminiClient:
     def __init__(self, model=None):
+        import google.generativeai as genai
         genai.configure(api_key=os.getenv("GEMINI_API_KEY") or ValueError(error("GEMINI_API_KEY not found in .env file")))
         self.model = model or self.get_default_model()
 
     def get_default_model(self):
         try:
-            return next((model.name for model in genai.list_models() if 'generateContent' in model.supported_generation_methods), None)
+            return next(iter(_list_gemini_models()), None)
         except Exception:
             return None
 
     def _request(self, messages=None, prompt=None, temperature=0.7, max_tokens=None, stream=False):
+        import google.generativeai as genai
         model = genai.GenerativeModel(self.model)
         config = genai.types.GenerationConfig(temperature=temperature, max_output_tokens=max_tokens)
         
@@ -198,23 +422,41 @@ class GeminiClient:
 
     @staticmethod
     def _stream_response(response):
+        for delta, _ in GeminiClient.stream_deltas(response):
+            yield delta
+
+    @staticmethod
+    def stream_deltas(response) -> Iterator[Delta]:
         for chunk in response:
-            yield chunk.text
+            try:
+                delta = chunk.text
+            except ValueError:
+                # Chunks without text parts (e.g. the final one carrying only metadata)
+                delta = ""
+            metadata = getattr(chunk, 'usage_metadata', None)
+            usage = _usage(metadata.prompt_token_count, metadata.candidates_token_count, metadata.total_token_count) if metadata else None
+            yield delta, usage
 
 class CohereClient:
     def __init__(self, model):
+        import cohere
         self.client = cohere.Client(api_key=os.getenv("CO_API_KEY"))
         self.model = model
 
+    @staticmethod
+    def _cohere_messages(messages):
+        # Convert messages to Cohere format
+        cohere_messages = []
+        for message in messages:
+            if message['role'] == 'system':
+                cohere_messages.append({"role": "USER", "message": f"System: {message['content']}"})
+            elif message['role'] in ['user', 'assistant']:
+                cohere_messages.append({"role": "USER" if message['role'] == 'user' else "CHATBOT", "message": message['content']})
+        return cohere_messages
+
     def chat(self, messages, temperature=0.7, max_tokens=None, stream=False):
         try:
-            # Convert messages to Cohere format
-            cohere_messages = []
-            for message in messages:
-                if message['role'] == 'system':
-                    cohere_messages.append({"role": "USER", "message": f"System: {message['content']}"})
-                elif message['role'] in ['user', 'assistant']:
-                    cohere_messages.append({"role": "USER" if message['role'] == 'user' else "CHATBOT", "message": message['content']})
+            cohere_messages = self._cohere_messages(messages)
 
             if stream:
                 response = self.client.chat_stream(
@@ -237,6 +479,22 @@ class CohereClient:
         except Exception as e:
             return error(f"An error occurred with Cohere API: {str(e)}")
 
+    def stream_chat(self, messages, temperature=0.7, max_tokens=None) -> Iterator[Delta]:
+        cohere_messages = self._cohere_messages(messages)
+        events = self.client.chat_stream(
+            model=self.model,
+            message=cohere_messages[-1]['message'] if cohere_messages else "",
+            temperature=temperature,
+            max_tokens=max_tokens,
+            chat_history=cohere_messages[:-1] if len(cohere_messages) > 1 else None,
+        )
+        for event in events:
+            if event.event_type == "text-generation":
+                yield event.text, None
+            elif event.event_type == "stream-end":
+                units = getattr(getattr(getattr(event, 'response', None), 'meta', None), 'billed_units', None)
+                yield "", _usage(units.input_tokens, units.output_tokens) if units else None
+
     def complete(self, prompt, temperature=0.7, max_tokens=None, stream=False):
         try:
             response = self.client.generate(
@@ -266,12 +524,28 @@ class CohereClient:
             print(error(f"Error listing Cohere models: {str(e)}"))
             return []
 
+def _openai_client(**kwargs):
+    from openai import OpenAI
+    return OpenAI(base_url='http://localhost:11434/v1', api_key='ollama', **kwargs)
+
+def _sentence_transformer(model_name):
+    from src.model_registry import get_sentence_transformer
+    return get_sentence_transformer(model_name)
+
+def _list_groq_models():
+    from groq import Groq
+    return [model.id for model in Groq(api_key=os.getenv("GROQ_API_KEY")).models.list().data]
+
+def _list_gemini_models():
+    import google.generativeai as genai
+    return [model.name for model in genai.list_models() if 'generateContent' in model.supported_generation_methods]
+
 def get_available_models(api_type, server_manager=None):
     model_fetchers = {
         "ollama": lambda: [model.split()[0] for model in subprocess.run(["ollama", "list"], capture_output=True, text=True).stdout.strip().split('\n')[1:] if model.split()[0] not in ['failed', 'NAME']],
         "llama": lambda: server_manager.get_gguf_models() if server_manager else [],
-        "groq": lambda: [model.id for model in Groq(api_key=os.getenv("GROQ_API_KEY")).models.list().data],
-        "gemini": lambda: [model.name for model in genai.list_models() if 'generateContent' in model.supported_generation_methods],
+        "groq": _list_groq_models,
+        "gemini": _list_gemini_models,
         "cohere": lambda: CohereClient(None).list_models()
     }
     
@@ -0,0 +1,206 @@
+# Standard library imports
+import asyncio
+import inspect
+import logging
+import os
+import threading
+import time
+import weakref
+from typing import Any, Dict, List, Sequence
+
+# Third-party imports
+import numpy as np
+
+# Local imports
+from src.look_and_feel import error, warning
+from src.settings import settings
+
+class RateLimiter:
+    """
+    Spaces requests at least 60 / requests_per_minute seconds apart. Slots are handed out
+    under a thread lock, so one limiter covers every event loop and thread in the process.
+    """
+
+    def __init__(self, requests_per_minute: float):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Seconds to wait before the reserved request may start."""
+        if self.interval <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+            return slot - now
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+_rate_limiters: Dict[str, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+def get_rate_limiter(backend: str) -> RateLimiter:
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(backend)
+        requests_per_minute = settings.async_requests_per_minute.get(backend, 0)
+        if limiter is None or limiter.interval != (60.0 / requests_per_minute if requests_per_minute > 0 else 0.0):
+            limiter = _rate_limiters[backend] = RateLimiter(requests_per_minute)
+        return limiter
+
+class _LoopResources:
+    """Clients and semaphores of one event loop; asyncio objects cannot be shared between loops."""
+
+    def __init__(self):
+        self.clients: Dict[Any, Any] = {}
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+
+_loop_resources: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopResources]" = weakref.WeakKeyDictionary()
+_loop_resources_lock = threading.Lock()
+
+def _resources() -> _LoopResources:
+    loop = asyncio.get_running_loop()
+    with _loop_resources_lock:
+        resources = _loop_resources.get(loop)
+        if resources is None:
+            resources = _loop_resources[loop] = _LoopResources()
+        return resources
+
+def _client(key, factory):
+    """
+    One pooled client per backend (and base URL) per event loop, reused by every request.
+    Run the requests on one long-lived loop and await aclose_clients() before closing it.
+    """
+    clients = _resources().clients
+    if key not in clients:
+        clients[key] = factory()
+    return clients[key]
+
+async def aclose_clients():
+    """Close the running loop's pooled clients and their connections."""
+    clients = _resources().clients
+    while clients:
+        key, client = clients.popitem()
+        close = getattr(client, 'close', None) or getattr(client, 'aclose', None)
+        if close is None:
+            continue
+        try:
+            result = close()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logging.warning(warning(f"Failed to close the async {key} client: {str(e)}"))
+
+def _semaphore(backend: str) -> asyncio.Semaphore:
+    semaphores = _resources().semaphores
+    if backend not in semaphores:
+        semaphores[backend] = asyncio.Semaphore(max(1, settings.async_max_concurrency.get(backend, 4)))
+    return semaphores[backend]
+
+class _Slot:
+    """`async with _Slot(backend)`: waits for a concurrency slot, then for the rate limit."""
+
+    def __init__(self, backend: str):
+        self.semaphore = _semaphore(backend)
+        self.rate_limiter = get_rate_limiter(backend)
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        try:
+            await self.rate_limiter.acquire()
+        except BaseException:
+            self.semaphore.release()
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.semaphore.release()
+
+def _openai_compatible_client(base_url: str, api_key: str):
+    def create():
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(base_url=base_url, api_key=api_key)
+    return _client(("openai", base_url), create)
+
+def _chat_client(erag_api):
+    if erag_api.api_type == "ollama":
+        return _openai_compatible_client('http://localhost:11434/v1', 'ollama')
+    if erag_api.api_type == "llama":
+        # llama.cpp's server speaks the OpenAI API
+        return _openai_compatible_client(erag_api.client.base_url, 'sk-no-key-required')
+    if erag_api.api_type == "groq":
+        from groq import AsyncGroq
+        return _client("groq", lambda: AsyncGroq(api_key=os.getenv("GROQ_API_KEY")))
+    if erag_api.api_type == "cohere":
+        import cohere
+        return _client("cohere", lambda: cohere.AsyncClient(api_key=os.getenv("CO_API_KEY")))
+    raise ValueError(f"Invalid API type: {erag_api.api_type}")
+
+async def achat(erag_api, messages: List[Dict[str, str]], temperature=0.7, max_tokens=None) -> str:
+    try:
+        async with _Slot(erag_api.api_type):
+            if erag_api.api_type == "gemini":
+                model, formatted_messages, config = erag_api._gemini_request(messages, temperature, max_tokens)
+                return (await model.generate_content_async(formatted_messages, generation_config=config)).text
+            client = _chat_client(erag_api)
+            if erag_api.api_type == "cohere":
+                from src.api_model import CohereClient
+                cohere_messages = CohereClient._cohere_messages(messages)
+                response = await client.chat(
+                    model=erag_api.model,
+                    message=cohere_messages[-1]['message'] if cohere_messages else "",
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    chat_history=cohere_messages[:-1] if len(cohere_messages) > 1 else None,
+                )
+                return response.text
+            response = await client.chat.completions.create(
+                model=erag_api.model, messages=messages, temperature=temperature, max_tokens=max_tokens
+            )
+            return response.choices[0].message.content
+    except Exception as e:
+        return error(f"An error occurred: {str(e)}")
+
+async def acomplete(erag_api, prompt: str, temperature=0.7, max_tokens=None) -> str:
+    try:
+        async with _Slot(erag_api.api_type):
+            if erag_api.api_type == "gemini":
+                import google.generativeai as genai
+                model = genai.GenerativeModel(erag_api.model)
+                config = genai.types.GenerationConfig(temperature=temperature, max_output_tokens=max_tokens)
+                return (await model.generate_content_async(prompt, generation_config=config)).text
+            client = _chat_client(erag_api)
+            if erag_api.api_type == "cohere":
+                response = await client.generate(model=erag_api.model, prompt=prompt, temperature=temperature, max_tokens=max_tokens)
+                return response.generations[0].text
+            response = await client.completions.create(
+                model=erag_api.model, prompt=prompt, temperature=temperature, max_tokens=max_tokens
+            )
+            return response.choices[0].text
+    except Exception as e:
+        return error(f"An error occurred: {str(e)}")
+
+async def aembed(erag_api, texts: Sequence[str]) -> np.ndarray:
+    """Embeddings of texts as a float32 matrix; Ollama batches are sent concurrently."""
+    texts = list(texts)
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+    if erag_api.embedding_class != "ollama":
+        # Local models are CPU/GPU bound, so they run on a worker thread
+        from src.embedding_store import to_numpy
+        return to_numpy(await asyncio.to_thread(erag_api._encode, texts)).astype(np.float32, copy=False)
+
+    client = _openai_compatible_client('http://localhost:11434/v1', 'ollama')
+    batch_size = max(1, settings.ollama_embedding_batch_size)
+
+    async def embed_batch(batch):
+        async with _Slot("ollama_embeddings"):
+            response = await client.embeddings.create(model=erag_api.embedding_model, input=batch)
+            return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    batches = await asyncio.gather(*(embed_batch(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)))
+    return np.asarray([embedding for batch in batches for embedding in batch], dtype=np.float32)
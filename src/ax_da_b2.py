@@ -29,6 +29,7 @@ from statsmodels.graphics.mosaicplot import mosaic
 from wordcloud import WordCloud
 
 from src.api_model import EragAPI
+from src.response_cache import CACHE_ALWAYS
 from src.settings import settings
 from src.look_and_feel import error, success, warning, info, highlight
 from src.print_pdf import PDFReportGenerator
@@ -857,7 +858,7 @@ class AdvancedExploratoryDataAnalysisB2:
         """
 
         worker_interpretation = self.worker_erag_api.chat([{"role": "system", "content": "You are an expert data analyst providing insights for business leaders and analysts. Respond in the requested format."}, 
-                                                    {"role": "user", "content": worker_prompt}])
+                                                    {"role": "user", "content": worker_prompt}], cache=CACHE_ALWAYS)
 
         supervisor_prompt = f"""
         You are an expert data analyst providing insights on exploratory data analysis results. Your task is to interpret the following analysis results and provide a detailed, data-driven interpretation.
@@ -885,7 +886,7 @@ class AdvancedExploratoryDataAnalysisB2:
         supervisor_analysis = self.supervisor_erag_api.chat([
             {"role": "system", "content": "You are a senior business analyst providing insights based on data analysis results. Provide a concise yet comprehensive business analysis."},
             {"role": "user", "content": supervisor_prompt}
-        ])
+        ], cache=CACHE_ALWAYS)
 
         combined_interpretation = f"""
         Data Analysis:
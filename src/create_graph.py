@@ -2,36 +2,47 @@
 import json
 import logging
 import os
-from typing import Dict, List, Tuple
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
 # Third-party imports
 import networkx as nx
-import nltk
-import spacy
-import torch
-from nltk.tokenize import sent_tokenize
-from sentence_transformers import SentenceTransformer, util
+import numpy as np
 from tqdm import tqdm
 
 # Local imports
 from src.api_model import EragAPI
 from src.embeddings_utils import load_embeddings_and_data
+from src.entity_index import build_entity_index
+from src.graph_store import save_graph
+from src.model_registry import get_sentence_transformer, get_spacy_model
 from src.look_and_feel import BLUE, GREEN, RESET, error, info, success, warning
 from src.settings import settings
 
-# Set up logging and download NLTK data
+# Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-nltk.download('punkt', quiet=True)
 
-# Initialize NLP model
-nlp = spacy.load(settings.nlp_model)
+# NLTK data, downloaded on first use
+punkt_downloaded = False
+# Pipeline components entity extraction does not need
+NER_UNUSED_COMPONENTS = ["parser", "lemmatizer", "tagger", "attribute_ruler", "senter"]
+
+def get_nlp():
+    # Shared with SearchUtils through the model registry
+    return get_spacy_model(settings.nlp_model)
 
 def set_nlp_model(new_model: str):
-    global nlp
     settings.nlp_model = new_model
-    nlp = spacy.load(settings.nlp_model)
+    get_nlp()
     logging.info(info(f"NLP model set to {settings.nlp_model}"))
 
+def sent_tokenize(text: str) -> List[str]:
+    global punkt_downloaded
+    import nltk
+    if not punkt_downloaded:
+        nltk.download('punkt', quiet=True)
+        punkt_downloaded = True
+    return nltk.tokenize.sent_tokenize(text)
+
 def set_graph_settings(similarity_threshold: float, min_entity_occurrence: int):
     settings.similarity_threshold = similarity_threshold
     settings.min_entity_occurrence = min_entity_occurrence
@@ -41,11 +52,64 @@ def set_graph_settings(similarity_threshold: float, min_entity_occurrence: int):
 def preprocess_text(text: str) -> str:
     return ' '.join(text.split())
 
-def extract_entities_with_confidence(text: str) -> List[Tuple[str, str, float]]:
-    doc = nlp(text)
+def entities_with_confidence(doc) -> List[Tuple[str, str, float]]:
     return [(ent.text, ent.label_, min(1.0, (len(ent.text) / 10) * (1 if ent.label_ in ['PERSON', 'ORG', 'GPE'] else 0.7)))
             for ent in doc.ents]
 
+def extract_entities_with_confidence(text: str) -> List[Tuple[str, str, float]]:
+    return entities_with_confidence(get_nlp()(text))
+
+def pipe_entities(items: Iterable[Tuple[str, Any]], expected_items: int = 0) -> Iterator[Tuple[str, List[Tuple[str, str, float]], Any]]:
+    """
+    Run NER over (text, context) pairs with nlp.pipe, yielding (text, entities, context)
+    in input order. Only the components NER needs are run, and large inputs are
+    spread over several processes.
+    """
+    nlp = get_nlp()
+    disable = [name for name in NER_UNUSED_COMPONENTS if name in nlp.pipe_names]
+    n_process = settings.nlp_n_process or os.cpu_count() or 1
+    if expected_items < settings.nlp_batch_size * 4:
+        # Starting worker processes costs more than it saves on small inputs
+        n_process = 1
+    for doc, context in nlp.pipe(items, as_tuples=True, batch_size=settings.nlp_batch_size, n_process=n_process, disable=disable):
+        yield doc.text, entities_with_confidence(doc), context
+
+def add_documents_to_graph(G: nx.Graph, doc_texts: List[str], doc_chunks: Iterable[List[str]], expected_chunks: int, desc: str):
+    """
+    Add document, chunk and entity nodes. Entities are extracted in batches, and the
+    results are merged in document order, so the graph matches a sequential build.
+    """
+    entity_count: Dict[str, int] = {}
+
+    def chunk_items():
+        for doc_idx, chunks in enumerate(doc_chunks):
+            for chunk_idx, chunk in enumerate(chunks):
+                yield chunk, (doc_idx, chunk_idx)
+
+    next_doc = 0
+    with tqdm(total=len(doc_texts), desc=desc, colour='blue') as pbar:
+        def add_documents_through(doc_idx: int):
+            nonlocal next_doc
+            while next_doc <= doc_idx:
+                G.add_node(f"doc_{next_doc}", type='document', text=doc_texts[next_doc])
+                next_doc += 1
+                pbar.update(1)
+
+        for chunk, entities, (doc_idx, chunk_idx) in pipe_entities(chunk_items(), expected_chunks):
+            add_documents_through(doc_idx)
+            doc_node = f"doc_{doc_idx}"
+            chunk_node = f"doc_{doc_idx}_chunk_{chunk_idx}"
+            G.add_node(chunk_node, type='chunk', text=chunk)
+            G.add_edge(doc_node, chunk_node, relation='contains')
+
+            for entity, entity_type, confidence in entities:
+                entity_count[entity] = entity_count.get(entity, 0) + 1
+                if entity_count[entity] >= settings.min_entity_occurrence:
+                    if not G.has_node(entity):
+                        G.add_node(entity, type='entity', entity_type=entity_type, confidence=confidence)
+                    G.add_edge(chunk_node, entity, relation='contains', confidence=confidence)
+        add_documents_through(len(doc_texts) - 1)
+
 def chunk_document(document: str) -> List[str]:
     sentences = sent_tokenize(document)
     chunks, current_chunk = [], ""
@@ -62,77 +126,74 @@ def chunk_document(document: str) -> List[str]:
     
     return chunks
 
-def create_networkx_graph(data: List[str], embeddings: torch.Tensor) -> nx.Graph:
+def add_semantic_edges(G: nx.Graph, nodes: List[str], embeddings, threshold: Optional[float] = None):
+    """
+    Connect every pair of nodes whose embeddings have cosine similarity above the threshold.
+
+    Similarities are computed a tile at a time with a matrix multiply over the upper
+    triangle, so memory stays bounded by the block size and BLAS uses all cores.
+    Edges above the threshold are streamed into the graph tile by tile.
+    """
+    threshold = settings.similarity_threshold if threshold is None else threshold
+    block_size = max(1, settings.similarity_block_size)
+    n = len(nodes)
+    norms = np.empty(n, dtype=np.float32)
+    for start in range(0, n, block_size):
+        norms[start:start + block_size] = np.linalg.norm(np.asarray(embeddings[start:start + block_size], dtype=np.float32), axis=1)
+    norms = np.maximum(norms, 1e-12)
+
+    starts = list(range(0, n, block_size))
+    added = 0
+    with tqdm(total=len(starts) * (len(starts) + 1) // 2, desc=f"{GREEN}Creating semantic edges{RESET}", colour='green') as pbar:
+        for block, i in enumerate(starts):
+            rows = np.asarray(embeddings[i:i + block_size], dtype=np.float32) / norms[i:i + block_size, None]
+            for j in starts[block:]:
+                cols = rows if j == i else np.asarray(embeddings[j:j + block_size], dtype=np.float32) / norms[j:j + block_size, None]
+                similarities = rows @ cols.T
+                if j == i:
+                    # Only pairs above the diagonal, so each pair is compared once
+                    similarities[np.tril_indices_from(similarities)] = -np.inf
+                row_ids, col_ids = np.nonzero(similarities > threshold)
+                G.add_edges_from(
+                    (nodes[i + r], nodes[j + c], {'relation': 'similar', 'weight': float(similarities[r, c]), 'confidence': float(similarities[r, c])})
+                    for r, c in zip(row_ids.tolist(), col_ids.tolist()))
+                added += len(row_ids)
+                pbar.update(1)
+    logging.info(info(f"Added {added} semantic edges between {n} documents"))
+
+def create_networkx_graph(data: List[str], embeddings: np.ndarray) -> nx.Graph:
     G = nx.Graph()
-    entity_count: Dict[str, int] = {}
-    
-    for doc_idx, document in tqdm(enumerate(data), total=len(data), desc=f"{BLUE}Processing documents{RESET}", colour='blue'):
-        doc_node = f"doc_{doc_idx}"
-        G.add_node(doc_node, type='document', text=document)
-        
-        for chunk_idx, chunk in enumerate(chunk_document(document)):
-            chunk_node = f"doc_{doc_idx}_chunk_{chunk_idx}"
-            G.add_node(chunk_node, type='chunk', text=chunk)
-            G.add_edge(doc_node, chunk_node, relation='contains')
-            
-            for entity, entity_type, confidence in extract_entities_with_confidence(chunk):
-                entity_count[entity] = entity_count.get(entity, 0) + 1
-                if entity_count[entity] >= settings.min_entity_occurrence:
-                    if not G.has_node(entity):
-                        G.add_node(entity, type='entity', entity_type=entity_type, confidence=confidence)
-                    G.add_edge(chunk_node, entity, relation='contains', confidence=confidence)
+    doc_texts = list(data)
+    # Chunked lazily as nlp.pipe consumes them; db.txt lines are usually a single chunk
+    add_documents_to_graph(G, doc_texts, (chunk_document(document) for document in doc_texts), len(doc_texts),
+                           f"{BLUE}Processing documents{RESET}")
     
     if settings.enable_semantic_edges:
         doc_nodes = [n for n, d in G.nodes(data=True) if d['type'] == 'document']
-        total_comparisons = len(doc_nodes) * (len(doc_nodes) - 1) // 2
-        with tqdm(total=total_comparisons, desc=f"{GREEN}Creating semantic edges{RESET}", colour='green') as pbar:
-            for i, node1 in enumerate(doc_nodes):
-                for j, node2 in enumerate(doc_nodes[i+1:], start=i+1):
-                    similarity = util.pytorch_cos_sim(embeddings[i], embeddings[j]).item()
-                    if similarity > settings.similarity_threshold:
-                        G.add_edge(node1, node2, relation='similar', weight=similarity, confidence=similarity)
-                    pbar.update(1)
+        add_semantic_edges(G, doc_nodes, embeddings)
     
     return G
 
-def process_raw_document(document: str, model: SentenceTransformer) -> Tuple[List[str], torch.Tensor]:
+def process_raw_document(document: str, model) -> Tuple[List[str], np.ndarray]:
     chunks = chunk_document(document)
-    return chunks, model.encode(chunks, convert_to_tensor=True)
+    return chunks, model.encode(chunks, show_progress_bar=False)
 
-def create_graph_from_raw(raw_documents: List[str], model: SentenceTransformer) -> nx.Graph:
+def create_graph_from_raw(raw_documents: List[str], model) -> nx.Graph:
     G = nx.Graph()
-    entity_count: Dict[str, int] = {}
-    all_chunk_embeddings = []
+    all_chunks, all_chunk_embeddings = [], []
     
-    for doc_idx, document in tqdm(enumerate(raw_documents), total=len(raw_documents), desc=f"{BLUE}Processing raw documents{RESET}", colour='blue'):
-        doc_node = f"doc_{doc_idx}"
-        G.add_node(doc_node, type='document', text=document[:1000])  # Store first 1000 chars as preview
-        
+    for document in tqdm(raw_documents, desc=f"{BLUE}Embedding raw documents{RESET}", colour='blue'):
         chunks, chunk_embeddings = process_raw_document(document, model)
+        all_chunks.append(chunks)
         all_chunk_embeddings.append(chunk_embeddings)
-        
-        for chunk_idx, chunk in enumerate(chunks):
-            chunk_node = f"doc_{doc_idx}_chunk_{chunk_idx}"
-            G.add_node(chunk_node, type='chunk', text=chunk)
-            G.add_edge(doc_node, chunk_node, relation='contains')
-            
-            for entity, entity_type, confidence in extract_entities_with_confidence(chunk):
-                entity_count[entity] = entity_count.get(entity, 0) + 1
-                if entity_count[entity] >= settings.min_entity_occurrence:
-                    if not G.has_node(entity):
-                        G.add_node(entity, type='entity', entity_type=entity_type, confidence=confidence)
-                    G.add_edge(chunk_node, entity, relation='contains', confidence=confidence)
+    
+    # Store first 1000 chars of each document as preview
+    add_documents_to_graph(G, [document[:1000] for document in raw_documents], all_chunks, sum(len(chunks) for chunks in all_chunks),
+                           f"{BLUE}Processing raw documents{RESET}")
     
     if settings.enable_semantic_edges:
-        doc_embeddings = torch.stack([torch.mean(emb, dim=0) for emb in all_chunk_embeddings])
-        total_comparisons = len(raw_documents) * (len(raw_documents) - 1) // 2
-        with tqdm(total=total_comparisons, desc=f"{GREEN}Creating semantic edges{RESET}", colour='green') as pbar:
-            for i in range(len(raw_documents)):
-                for j in range(i+1, len(raw_documents)):
-                    similarity = util.pytorch_cos_sim(doc_embeddings[i], doc_embeddings[j]).item()
-                    if similarity > settings.similarity_threshold:
-                        G.add_edge(f"doc_{i}", f"doc_{j}", relation='similar', weight=similarity, confidence=similarity)
-                    pbar.update(1)
+        doc_embeddings = np.stack([emb.mean(axis=0) for emb in all_chunk_embeddings])
+        add_semantic_edges(G, [f"doc_{i}" for i in range(len(raw_documents))], doc_embeddings)
     
     return G
 
@@ -140,7 +201,19 @@ def save_graph_json(G: nx.Graph, file_path: str):
     graph_data = nx.node_link_data(G)
     os.makedirs(os.path.dirname(file_path), exist_ok=True)
     with open(file_path, 'w', encoding='utf-8') as file:
-        json.dump(graph_data, file, indent=2)
+        json.dump(graph_data, file)
+
+def save_knowledge_graph(G: nx.Graph, file_path: str) -> str:
+    """Save G and return the fingerprint of the saved graph."""
+    fingerprint = save_graph(G, file_path)
+    if settings.export_graph_json:
+        # Node-link JSON for external tools; ERAG itself reads the compact store
+        save_graph_json(G, file_path)
+    return fingerprint
+
+def save_entity_index(G: nx.Graph, fingerprint: str):
+    entity_index_file_path = os.path.join(settings.output_folder, os.path.basename(settings.entity_index_file_path))
+    build_entity_index(G, fingerprint=fingerprint).save(entity_index_file_path)
 
 def create_knowledge_graph():
     embeddings_file_path = os.path.join(settings.output_folder, os.path.basename(settings.embeddings_file_path))
@@ -152,20 +225,22 @@ def create_knowledge_graph():
 
     G = create_networkx_graph(content, embeddings)
     knowledge_graph_file_path = os.path.join(settings.output_folder, os.path.basename(settings.knowledge_graph_file_path))
-    save_graph_json(G, knowledge_graph_file_path)
+    fingerprint = save_knowledge_graph(G, knowledge_graph_file_path)
+    save_entity_index(G, fingerprint)
     logging.info(success(f"NetworkX graph created with {G.number_of_nodes()} nodes and {G.number_of_edges()} edges."))
     logging.info(success(f"Graph saved as {knowledge_graph_file_path}"))
     return G
 
 def create_knowledge_graph_from_raw(raw_file_path: str):
-    model = SentenceTransformer(settings.model_name)
+    model = get_sentence_transformer(settings.model_name)
     
     with open(raw_file_path, 'r', encoding='utf-8') as f:
         raw_documents = [doc.strip() for doc in f.read().split("---DOCUMENT_SEPARATOR---") if doc.strip()]
     
     G = create_graph_from_raw(raw_documents, model)
     knowledge_graph_file_path = os.path.join(settings.output_folder, os.path.basename(settings.knowledge_graph_file_path))
-    save_graph_json(G, knowledge_graph_file_path)
+    fingerprint = save_knowledge_graph(G, knowledge_graph_file_path)
+    save_entity_index(G, fingerprint)
     logging.info(success(f"NetworkX graph created from raw documents with {G.number_of_nodes()} nodes and {G.number_of_edges()} edges."))
     logging.info(success(f"Graph saved as {knowledge_graph_file_path}"))
     return G
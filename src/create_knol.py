@@ -9,17 +9,17 @@ from collections import deque
 from typing import List, Dict, Tuple
 
 # Third-party imports
-import torch
 import numpy as np
-from sentence_transformers import SentenceTransformer
 import networkx as nx
-import json
 
 # Local imports
 from src.search_utils import SearchUtils
+from src.result_fusion import format_results
 from src.settings import settings
 from src.api_model import EragAPI, create_erag_api
 from src.embeddings_utils import load_or_compute_embeddings
+from src.vector_index import get_vector_index_path
+from src.model_registry import get_knowledge_graph, get_sentence_transformer
 from src.look_and_feel import success, info, warning, error, colorize, MAGENTA, RESET, user_input as color_user_input, llm_response as color_llm_response
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -29,29 +29,29 @@ class KnolCreator:
         self.worker_erag_api = worker_erag_api
         self.supervisor_erag_api = supervisor_erag_api
         self.manager_erag_api = manager_erag_api
-        self.embedding_model = SentenceTransformer(settings.sentence_transformer_model)
+        self.embedding_model = get_sentence_transformer(settings.sentence_transformer_model, owner=self)
         self.db_embeddings, self.db_indexes, self.db_content = self.load_embeddings()
         self.conversation_history = []
         self.new_entries = []
         self.conversation_context = deque(maxlen=settings.conversation_context_size * 2)
         self.knowledge_graph = self.load_knowledge_graph()
-        self.search_utils = SearchUtils(self.worker_erag_api, self.embedding_model, self.db_embeddings, self.db_content, self.knowledge_graph)
+        self.search_utils = SearchUtils(self.worker_erag_api, self.embedding_model, self.db_embeddings, self.db_content, self.knowledge_graph,
+                                        vector_index_path=get_vector_index_path(settings.embeddings_file_path),
+                                        inverted_index_path=settings.inverted_index_file_path)
         self.output_folder = None
         os.makedirs(settings.output_folder, exist_ok=True)
 
     def load_embeddings(self):
-        embeddings, indexes, content = load_or_compute_embeddings(self.worker_erag_api, settings.db_file_path, settings.embeddings_file_path)
+        embeddings, indexes, content = load_or_compute_embeddings(self.worker_erag_api, settings.db_file_path, settings.embeddings_file_path, sync=False)
         if isinstance(embeddings, list):
-            embeddings = torch.tensor(embeddings)
+            embeddings = np.asarray(embeddings, dtype=np.float32)
         return embeddings, indexes, content
 
     def load_knowledge_graph(self):
         try:
             graph_path = os.path.join(settings.output_folder, os.path.basename(settings.knowledge_graph_file_path))
-            if os.path.exists(graph_path):
-                with open(graph_path, 'r') as f:
-                    graph_data = json.load(f)
-                G = nx.node_link_graph(graph_data)
+            G = get_knowledge_graph(graph_path, owner=self)
+            if G is not None:
                 logging.info(success(f"Successfully loaded knowledge graph with {G.number_of_nodes()} nodes and {G.number_of_edges()} edges."))
                 return G
             else:
@@ -63,23 +63,14 @@ class KnolCreator:
 
     def get_response(self, query: str, system_message: str, api: EragAPI) -> str:
         if isinstance(self.db_embeddings, list):
-            self.db_embeddings = torch.tensor(self.db_embeddings)
+            self.db_embeddings = np.asarray(self.db_embeddings, dtype=np.float32)
         
-        lexical_context, semantic_context, graph_context, text_context = self.search_utils.get_relevant_context(query, list(self.conversation_context))
+        results = self.search_utils.retrieve(query, list(self.conversation_context))
         
         combined_context = f"""Conversation Context:\n{' '.join(self.conversation_context)}
 
-    Lexical Search Results:
-    {' '.join(lexical_context)}
-
-    Semantic Search Results:
-    {' '.join(semantic_context)}
-
-    Knowledge Graph Context:
-    {' '.join(graph_context)}
-
-    Text Search Results:
-    {' '.join(text_context)}"""
+    Relevant Context (Lexical, Semantic, Knowledge Graph and Text Search, Re-ranked):
+    {format_results(results)}"""
 
         messages = [
             {"role": "system", "content": system_message},
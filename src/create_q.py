@@ -1,13 +1,17 @@
 # Standard library imports
+import hashlib
+import json
 import os
 import re
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
 # Third-party imports
 from PyPDF2 import PdfReader
 
 # Local imports
 from src.settings import settings
-from src.api_model import EragAPI
+from src.api_model import EragAPI, is_error_response
+from src.response_cache import CACHE_LOW_TEMPERATURE
 from src.look_and_feel import success, info, warning, error
 
 def chunk_text(text, chunk_size):
@@ -28,7 +32,7 @@ def read_pdf(file_path):
         text += page.extract_text() + "\n"
     return text
 
-def generate_questions(erag_api, chunk, question_number, total_questions, output_file, chunk_size):
+def generate_questions(erag_api, chunk, question_number, total_questions, chunk_size):
     print(info(f"Generating questions for chunk {question_number}/{total_questions} (size: {chunk_size})"))
     
     prompt = f"""Based on the following text, generate {settings.questions_per_chunk} insightful questions that would test a reader's understanding of the key concepts, main ideas, or important details. The questions should be specific to the content provided. Provide only the questions, without any additional text or answers.
@@ -42,18 +46,78 @@ Generate {settings.questions_per_chunk} questions:"""
         {"role": "system", "content": "You are a helpful assistant that generates insightful questions based on given text."},
         {"role": "user", "content": prompt}
     ]
-    response = erag_api.chat(messages, temperature=settings.temperature)
-
-    questions = response.strip().split('\n')
-    
-    # Write questions to file immediately
-    with open(output_file, 'a', encoding='utf-8') as file:
-        file.write(f"Chunk {question_number}. [Chunk size: {chunk_size}]\n")
-        for question in questions:
-            file.write(f"{question.strip()}\n")
-        file.write("\n")  # Add an extra newline for separation between chunks
-    
-    return questions
+    response = erag_api.chat(messages, temperature=settings.temperature, cache=CACHE_LOW_TEMPERATURE)
+    if is_error_response(response):
+        raise RuntimeError(f"Question generation failed for chunk {question_number}: {response}")
+
+    return response.strip().split('\n')
+
+def write_questions(file, question_number, chunk_size, questions):
+    file.write(f"Chunk {question_number}. [Chunk size: {chunk_size}]\n")
+    for question in questions:
+        file.write(f"{question.strip()}\n")
+    file.write("\n")  # Add an extra newline for separation between chunks
+
+def load_checkpoint(checkpoint_file, output_file, run_key):
+    """Number of chunks already written by an interrupted run with the same inputs, and the file offset after them."""
+    if not (os.path.exists(checkpoint_file) and os.path.exists(output_file)):
+        return 0, 0
+    try:
+        with open(checkpoint_file, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return 0, 0
+    if checkpoint.get("run_key") != run_key or os.path.getsize(output_file) < checkpoint.get("offset", 0):
+        return 0, 0
+    return checkpoint["completed"], checkpoint["offset"]
+
+def save_checkpoint(checkpoint_file, run_key, completed, offset):
+    temp_file = checkpoint_file + ".tmp"
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump({"run_key": run_key, "completed": completed, "offset": offset}, f)
+    os.replace(temp_file, checkpoint_file)
+
+def run_jobs(erag_api, jobs, output_file, checkpoint_file, run_key):
+    """
+    Generate questions for (number, chunk_size, chunk) jobs on a pool of settings.question_workers
+    threads. Only this thread writes: results are appended in job order as soon as every earlier
+    job is done, and the checkpoint records how many are on disk. At most twice the worker count
+    of jobs run ahead of the writer, so one slow chunk cannot pile up finished results.
+    """
+    completed, offset = load_checkpoint(checkpoint_file, output_file, run_key)
+    if completed:
+        print(info(f"Resuming after {completed} chunks already written to {output_file}"))
+    workers = max(1, settings.question_workers)
+    window = workers * 2
+    finished = {}
+    running = {}
+    next_job = completed
+
+    with open(output_file, 'a+', encoding='utf-8') as file, \
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix="create_q") as executor:
+        # Drop anything written after the last checkpoint, e.g. by a run killed mid-write
+        file.seek(offset)
+        file.truncate()
+        try:
+            while completed < len(jobs):
+                while next_job < len(jobs) and next_job < completed + window:
+                    number, chunk_size, chunk = jobs[next_job]
+                    running[executor.submit(generate_questions, erag_api, chunk, number, len(jobs), chunk_size)] = next_job
+                    next_job += 1
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finished[running.pop(future)] = future.result()
+                while completed in finished:
+                    number, chunk_size, _ = jobs[completed]
+                    write_questions(file, number, chunk_size, finished.pop(completed))
+                    completed += 1
+                file.flush()
+                save_checkpoint(checkpoint_file, run_key, completed, file.tell())
+        except BaseException:
+            for future in running:
+                future.cancel()
+            raise
+    return completed
 
 def extract_questions(input_file, output_file):
     with open(input_file, 'r', encoding='utf-8') as f:
@@ -105,18 +169,23 @@ def run_create_q(file_path, api_type, client):
     print(info(f"Identified {total_chunks} chunks using {len(chunk_sizes)} levels"))
     print(info(f"Generating {settings.questions_per_chunk} questions per chunk"))
 
-    # Prepare the output file
-    output_file = os.path.join(settings.output_folder, f"{input_file_name}_generated_questions.txt")
-    # Clear the file if it exists
-    open(output_file, 'w').close()
-
-    chunk_counter = 1
-
+    # Chunks of every level, numbered in the order they are written
+    jobs = []
     for chunk_size in chunk_sizes:
-        chunks = chunk_text(content, chunk_size)
-        for chunk in chunks:
-            questions = generate_questions(erag_api, chunk, chunk_counter, total_chunks, output_file, chunk_size)
-            chunk_counter += 1
+        for chunk in chunk_text(content, chunk_size):
+            jobs.append((len(jobs) + 1, chunk_size, chunk))
+
+    output_file = os.path.join(settings.output_folder, f"{input_file_name}_generated_questions.txt")
+    checkpoint_file = os.path.join(settings.output_folder, f"{input_file_name}_generated_questions.checkpoint.json")
+    run_key = hashlib.blake2b(json.dumps([
+        content, chunk_sizes, erag_api.api_type, erag_api.model, settings.temperature, settings.questions_per_chunk
+    ]).encode('utf-8'), digest_size=16).hexdigest()
+
+    try:
+        chunk_counter = run_jobs(erag_api, jobs, output_file, checkpoint_file, run_key) + 1
+    except Exception:
+        print(error(f"Question generation stopped; completed chunks are checkpointed in {checkpoint_file}, run it again to resume."))
+        raise
 
     print(success(f"Generated questions for {chunk_counter - 1} chunks and saved to {output_file}"))
 
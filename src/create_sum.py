@@ -1,13 +1,18 @@
 # Standard library imports
+import hashlib
+import json
 import os
-from typing import List
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Tuple
 
 # Third-party imports
 import fitz  # PyMuPDF
 
 # Local imports
 from src.settings import settings
-from src.api_model import EragAPI
+from src.api_model import EragAPI, is_error_response
+from src.response_cache import CACHE_LOW_TEMPERATURE
 from src.look_and_feel import success, info, warning, error
 
 def extract_text(file_path: str) -> str:
@@ -41,11 +46,11 @@ SUMMARY:"""
         {"role": "system", "content": "You are a helpful assistant that creates concise summaries."},
         {"role": "user", "content": prompt}
     ]
-    response = erag_api.chat(messages, temperature=settings.temperature)
+    response = erag_api.chat(messages, temperature=settings.temperature, cache=CACHE_LOW_TEMPERATURE)
     return response.strip()
 
 def review_summaries(summaries: List[str], erag_api: EragAPI) -> str:
-    prompt = f"""Summarize the following {settings.summarization_combining_number} summaries into one coherent paragraph:
+    prompt = f"""Summarize the following {len(summaries)} summaries into one coherent paragraph:
 
 {' '.join(summaries)}
 
@@ -55,9 +60,97 @@ SUMMARIZED PARAGRAPH:"""
         {"role": "system", "content": "You are a helpful assistant that combines multiple summaries into a coherent paragraph."},
         {"role": "user", "content": prompt}
     ]
-    response = erag_api.chat(messages, temperature=settings.temperature)
+    response = erag_api.chat(messages, temperature=settings.temperature, cache=CACHE_LOW_TEMPERATURE)
     return response.strip()
 
+class SummaryCheckpoint:
+    """
+    Append-only JSON lines file of completed summary nodes, (level, index) -> summary.
+    The first line records what the run depends on; a checkpoint from a different
+    document, model or summarization setting is discarded instead of resumed.
+    """
+
+    def __init__(self, path: str, run_key: str):
+        self.path = path
+        self.nodes: Dict[Tuple[int, int], str] = {}
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            self.load(run_key)
+        if not self.nodes:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({"run_key": run_key}) + "\n")
+
+    def load(self, run_key: str):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        try:
+            if not lines or json.loads(lines[0]).get("run_key") != run_key:
+                return
+        except json.JSONDecodeError:
+            return
+        for line in lines[1:]:
+            try:
+                node = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by an interrupted write
+                continue
+            self.nodes[(node["level"], node["index"])] = node["summary"]
+        if self.nodes:
+            print(info(f"Resuming from {self.path} with {len(self.nodes)} completed summaries"))
+
+    def get(self, level: int, index: int):
+        return self.nodes.get((level, index))
+
+    def add(self, level: int, index: int, summary: str):
+        with self.lock:
+            self.nodes[(level, index)] = summary
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({"level": level, "index": index, "summary": summary}, ensure_ascii=False) + "\n")
+
+def run_level(level: int, inputs: List, summarize, erag_api: EragAPI, checkpoint: SummaryCheckpoint) -> List[str]:
+    """Summarize every input of one tree level concurrently, skipping nodes already checkpointed."""
+    results = [checkpoint.get(level, i) for i in range(len(inputs))]
+    pending = [i for i, result in enumerate(results) if result is None]
+    label = "chunk" if level == 0 else f"level {level} group"
+    if len(pending) < len(inputs):
+        print(info(f"Reusing {len(inputs) - len(pending)} checkpointed {label} summaries"))
+
+    def work(i):
+        summary = summarize(inputs[i], erag_api)
+        if is_error_response(summary):
+            raise RuntimeError(f"{label} {i + 1} failed: {summary}")
+        checkpoint.add(level, i, summary)
+        return i, summary
+
+    with ThreadPoolExecutor(max_workers=max(1, settings.summarization_workers), thread_name_prefix="summarize") as executor:
+        futures = [executor.submit(work, i) for i in pending]
+        try:
+            for done, future in enumerate(as_completed(futures), 1):
+                i, summary = future.result()
+                results[i] = summary
+                print(info(f"Processed {label} {done}/{len(pending)}"))
+        except BaseException:
+            # Completed nodes are already checkpointed; don't start the queued ones
+            for future in futures:
+                future.cancel()
+            raise
+    return results
+
+def reduce_summaries(summaries: List[str], erag_api: EragAPI, checkpoint: SummaryCheckpoint) -> Tuple[List[str], int]:
+    """
+    Combine summaries in groups of summarization_combining_number, level by level, until
+    they fit in summarization_final_chunk_size characters or a single summary remains.
+    Returns the final summaries and the number of levels above the chunk summaries.
+    """
+    group_size = max(2, settings.summarization_combining_number)
+    level = 0
+    while len(summaries) > 1 and len("\n\n".join(summaries)) > settings.summarization_final_chunk_size:
+        level += 1
+        groups = [summaries[i:i + group_size] for i in range(0, len(summaries), group_size)]
+        print(info(f"Reduction level {level}: combining {len(summaries)} summaries into {len(groups)}"))
+        summaries = run_level(level, groups, review_summaries, erag_api, checkpoint)
+    return summaries, level
+
 def create_summary(file_path: str, erag_api: EragAPI) -> str:
     try:
         full_text = extract_text(file_path)
@@ -73,36 +166,36 @@ def create_summary(file_path: str, erag_api: EragAPI) -> str:
         print(info(f"Saved full text: {full_text_path}"))
 
         chunks = split_into_chunks(full_text)
-        
-        # Create a single file for all chunk summaries
+
+        # Every completed summary is checkpointed, so an interrupted run picks up where it stopped
+        run_key = hashlib.blake2b(json.dumps([
+            full_text, erag_api.api_type, erag_api.model, settings.temperature, settings.summarization_chunk_size,
+            settings.summarization_summary_size, settings.summarization_combining_number
+        ]).encode('utf-8'), digest_size=16).hexdigest()
+        checkpoint = SummaryCheckpoint(os.path.join(output_folder, "summary_checkpoint.jsonl"), run_key)
+
+        # Map: summarize the chunks concurrently
+        chunk_summaries = run_level(0, chunks, summarize_chunk, erag_api, checkpoint)
         all_summaries_path = os.path.join(output_folder, "all_chunk_summaries.txt")
-        chunk_summaries = []
         with open(all_summaries_path, 'w', encoding='utf-8') as f:
-            for i, chunk in enumerate(chunks, 1):
-                summary = summarize_chunk(chunk, erag_api)
+            for summary in chunk_summaries:
                 f.write(f"{summary}\n\n")
-                f.flush()  # Ensure the summary is written to the file immediately
-                chunk_summaries.append(summary)
-                print(info(f"Processed chunk {i}/{len(chunks)}"))
 
         print(success(f"All chunk summaries saved to: {all_summaries_path}"))
 
-        # Create reviewed summary by processing chunks in groups
+        # Reduce: combine the summaries level by level down to the final size
+        final_summaries, levels = reduce_summaries(chunk_summaries, erag_api, checkpoint)
         reviewed_summary_path = os.path.join(output_folder, "reviewed_summary.txt")
         with open(reviewed_summary_path, 'w', encoding='utf-8') as f:
-            for i in range(0, len(chunk_summaries), settings.summarization_combining_number):
-                group = chunk_summaries[i:i+settings.summarization_combining_number]
-                reviewed_summary = review_summaries(group, erag_api)
-                f.write(f"{reviewed_summary}\n\n")
-                f.flush()  # Ensure the summary is written to the file immediately
-                print(info(f"Processed reviewed summary group {i//settings.summarization_combining_number + 1}"))
+            for summary in final_summaries:
+                f.write(f"{summary}\n\n")
 
-        print(success(f"Reviewed summary saved to: {reviewed_summary_path}"))
+        print(success(f"Reviewed summary ({levels} reduction levels) saved to: {reviewed_summary_path}"))
 
         return success(f"Successfully processed {len(chunks)} chunks. Full text, all chunk summaries, and reviewed summary saved in folder: {output_folder}")
 
     except Exception as e:
-        return error(f"An error occurred while processing the document: {str(e)}")
+        return error(f"An error occurred while processing the document: {str(e)}. Completed summaries are checkpointed, run it again to resume.")
 
 def run_create_sum(file_path: str, api_type: str, erag_api: EragAPI) -> str:
     return create_summary(file_path, erag_api)
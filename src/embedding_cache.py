@@ -0,0 +1,68 @@
+# Standard library imports
+import time
+from typing import Dict, List, Optional, Sequence
+
+# Third-party imports
+import numpy as np
+
+# Local imports
+from src.embedding_store import content_hash
+from src.settings import settings
+from src.sqlite_cache import SQLiteCache, get_shared_cache
+
+# SQLite limits the number of bound parameters per statement
+_QUERY_BATCH = 500
+
+class EmbeddingCache(SQLiteCache):
+    """On-disk cache of embedding vectors keyed by (embedding model, text hash)."""
+
+    LABEL = "embedding cache"
+    TABLE = "embeddings"
+    KEY_COLUMNS = ("model", "text_hash")
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS embeddings (
+            model TEXT NOT NULL,
+            text_hash BLOB NOT NULL,
+            vector BLOB NOT NULL,
+            last_used REAL NOT NULL,
+            PRIMARY KEY (model, text_hash)
+        ) WITHOUT ROWID
+    """
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Cached vectors for `texts`, None where the text has not been embedded with `model`."""
+        hashes = [content_hash(text) for text in texts]
+        found: Dict[bytes, np.ndarray] = {}
+        now = time.time()
+        with self.lock:
+            for start in range(0, len(hashes), _QUERY_BATCH):
+                batch = list(set(hashes[start:start + _QUERY_BATCH]))
+                placeholders = ",".join("?" * len(batch))
+                rows = self.conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch]).fetchall()
+                for text_hash, vector in rows:
+                    found[bytes(text_hash)] = np.frombuffer(vector, dtype=np.float32)
+            if found:
+                self.conn.executemany("UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                                      [(now, model, text_hash) for text_hash in found])
+                self.conn.commit()
+        results = [found.get(text_hash) for text_hash in hashes]
+        hits = sum(result is not None for result in results)
+        self.hits += hits
+        self.misses += len(results) - hits
+        return results
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: np.ndarray):
+        now = time.time()
+        rows = [(model, content_hash(text), np.asarray(vector, dtype=np.float32).tobytes(), now)
+                for text, vector in zip(texts, vectors)]
+        with self.lock:
+            self.conn.executemany("INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)", rows)
+            self.conn.commit()
+            self._evict()
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """The process-wide embedding cache, or None when it is disabled or cannot be opened."""
+    return get_shared_cache(EmbeddingCache, settings.embedding_cache_enabled, settings.embedding_cache_file_path,
+                            settings.embedding_cache_max_entries)
@@ -0,0 +1,372 @@
+# Standard library imports
+import hashlib
+import json
+import logging
+import os
+import struct
+import uuid
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+# Third-party imports
+import numpy as np
+
+# Local imports
+from src.look_and_feel import info, success, warning
+from src.settings import settings
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+STORE_VERSION = 2
+# Fixed .npy header size so the row count in the header can be rewritten in place when appending
+NPY_HEADER_SIZE = 128
+DTYPES = {"float32": np.float32, "float16": np.float16}
+HASH_DTYPE = np.dtype('S16')
+# Rows copied per step when compacting
+_COMPACT_BLOCK = 8192
+
+def content_hash(text: str) -> bytes:
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+def get_store_paths(embeddings_file_path: str) -> Dict[str, str]:
+    """
+    Files of the embedding store that replaces the pickled db_embeddings.pt.
+    They share its base name, e.g. db_embeddings.npy and db_embeddings_text.bin.
+    """
+    embeddings_file_path = os.path.join(settings.output_folder, os.path.basename(embeddings_file_path))
+    base = os.path.splitext(embeddings_file_path)[0]
+    return {
+        'base': base,
+        'manifest': f"{base}_manifest.json",
+        'legacy': f"{base}.pt",
+    }
+
+def _write_npy_header(f, dtype: np.dtype, shape: Tuple[int, ...]):
+    header = repr({'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)), 'fortran_order': False, 'shape': tuple(shape)})
+    header = header.ljust(NPY_HEADER_SIZE - 11) + '\n'
+    f.seek(0)
+    f.write(b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1'))
+
+def _create_npy(path: str, dtype: np.dtype, row_shape: Tuple[int, ...]):
+    with open(path, 'wb') as f:
+        _write_npy_header(f, dtype, (0,) + tuple(row_shape))
+
+def _append_npy(path: str, rows: np.ndarray, count: int):
+    """Write rows after the first `count` committed rows and update the header shape."""
+    with open(path, 'r+b') as f:
+        f.seek(NPY_HEADER_SIZE + count * rows[0].nbytes if len(rows) else NPY_HEADER_SIZE)
+        f.write(np.ascontiguousarray(rows).tobytes())
+        _write_npy_header(f, rows.dtype, (count + len(rows),) + rows.shape[1:])
+
+def _open_npy(path: str, dtype: np.dtype, shape: Tuple[int, ...]) -> np.ndarray:
+    if shape[0] == 0:
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=NPY_HEADER_SIZE, shape=shape)
+
+def _remove_files(paths: Sequence[str]):
+    for path in paths:
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except OSError as e:
+            # Still mapped by a reader (Windows); it is only garbage now
+            logging.warning(warning(f"Could not remove old embedding file {path}: {str(e)}"))
+
+def to_numpy(embeddings) -> np.ndarray:
+    if hasattr(embeddings, 'detach'):
+        embeddings = embeddings.detach().cpu().numpy()
+    return np.asarray(embeddings)
+
+class TextStore(Sequence):
+    """
+    Read-only list of chunk texts backed by a memory-mapped UTF-8 file and an offsets array.
+    `rows` maps list positions to stored texts when the two are not in the same order.
+    """
+
+    def __init__(self, text_path: str, offsets: np.ndarray, rows: Optional[np.ndarray] = None):
+        self.offsets = offsets
+        self.rows = rows
+        self._data = np.memmap(text_path, dtype=np.uint8, mode='r') if len(offsets) > 1 and offsets[-1] > 0 else np.empty(0, dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.rows) if self.rows is not None else max(len(self.offsets) - 1, 0)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[str, List[str]]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("TextStore index out of range")
+        row = self.rows[index] if self.rows is not None else index
+        return self._data[self.offsets[row]:self.offsets[row + 1]].tobytes().decode('utf-8')
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self[i]
+
+class EmbeddingStore:
+    """
+    On-disk embeddings plus their chunk texts and content hashes.
+
+    Vectors live in a raw .npy matrix (float32 or float16) opened with np.memmap, so
+    opening is near-instant and processes share pages through the OS cache. Texts
+    are concatenated in one UTF-8 file indexed by an int64 offsets array.
+
+    The data files are append-only: every update appends a segment of new rows, and
+    the logical chunk order (db.txt order) maps onto stored rows. While that mapping
+    is the identity, readers get the memory-mapped matrix directly. Rows of removed or
+    changed chunks become garbage until compaction rewrites the files in logical order
+    under a new generation. The JSON manifest is written last, so an interrupted
+    update never exposes partial rows.
+    """
+
+    def __init__(self, embeddings_file_path: str):
+        self.paths = get_store_paths(embeddings_file_path)
+        self.manifest = self._read_manifest()
+
+    def _read_manifest(self) -> Optional[dict]:
+        if not os.path.exists(self.paths['manifest']):
+            return None
+        with open(self.paths['manifest'], 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('version') == 1:
+            return self._upgrade_v1(manifest)
+        return manifest if manifest.get('version') == STORE_VERSION else None
+
+    def _upgrade_v1(self, manifest: dict) -> dict:
+        """Version 1 stores had no content hashes; hash the stored texts once."""
+        manifest.update(version=STORE_VERSION, generation=0, model=None, live=manifest['count'],
+                        ordered=True, segments=[{'start': 0, 'count': manifest['count']}] if manifest['count'] else [])
+        self.manifest = manifest
+        if manifest['count']:
+            _, texts = self.open()
+            hashes = np.array([content_hash(text) for text in texts], dtype=HASH_DTYPE)
+            _create_npy(self._path('hashes'), HASH_DTYPE, ())
+            _append_npy(self._path('hashes'), hashes, 0)
+        self._write_manifest()
+        return manifest
+
+    def _write_manifest(self):
+        tmp_path = f"{self.paths['manifest']}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, self.paths['manifest'])
+
+    def _path(self, kind: str, generation: Optional[int] = None) -> str:
+        generation = self.manifest['generation'] if generation is None else generation
+        base = self.paths['base'] if generation == 0 else f"{self.paths['base']}-{generation}"
+        suffixes = {'vectors': '.npy', 'text': '_text.bin', 'offsets': '_offsets.npy', 'hashes': '_hashes.npy', 'order': '_order.npy'}
+        return f"{base}{suffixes[kind]}"
+
+    def _generation_files(self, generation: int) -> List[str]:
+        return [self._path(kind, generation) for kind in ('vectors', 'text', 'offsets', 'hashes', 'order')]
+
+    def exists(self) -> bool:
+        return self.manifest is not None
+
+    def __len__(self) -> int:
+        """Number of chunks in logical order."""
+        return self.manifest['live'] if self.manifest else 0
+
+    @property
+    def stored_rows(self) -> int:
+        return self.manifest['count'] if self.manifest else 0
+
+    @property
+    def dtype(self) -> np.dtype:
+        return np.dtype(self.manifest['dtype'] if self.manifest else settings.embedding_dtype)
+
+    @property
+    def revision(self) -> Optional[str]:
+        """Token that changes whenever the logical rows do; indexes built over the store record it."""
+        return self.manifest.get('revision') if self.manifest else None
+
+    @property
+    def model(self) -> Optional[str]:
+        return self.manifest.get('model') if self.manifest else None
+
+    def set_model(self, model: Optional[str]):
+        self.manifest['model'] = model
+        self._write_manifest()
+
+    def reset(self, dtype: Optional[str] = None, model: Optional[str] = None):
+        """Start an empty store under a new generation, replacing any existing one."""
+        dtype = dtype or settings.embedding_dtype
+        if dtype not in DTYPES:
+            raise ValueError(f"Invalid embedding dtype: {dtype}")
+        os.makedirs(os.path.dirname(self.paths['manifest']), exist_ok=True)
+        old_generation = self.manifest['generation'] if self.manifest else None
+        self.manifest = {
+            'version': STORE_VERSION,
+            'generation': old_generation + 1 if old_generation is not None else 0,
+            'count': 0, 'live': 0, 'dim': None, 'dtype': dtype, 'model': model,
+            'ordered': True, 'segments': [], 'revision': uuid.uuid4().hex,
+        }
+        self._write_manifest()
+        if old_generation is not None:
+            _remove_files(self._generation_files(old_generation))
+
+    def _start_files(self, dim: int):
+        self.manifest['dim'] = dim
+        _create_npy(self._path('vectors'), self.dtype, (dim,))
+        _create_npy(self._path('hashes'), HASH_DTYPE, ())
+        _create_npy(self._path('offsets'), np.int64, ())
+        _append_npy(self._path('offsets'), np.zeros(1, dtype=np.int64), 0)
+        open(self._path('text'), 'wb').close()
+
+    def append_rows(self, embeddings, texts: Sequence[str], hashes: Optional[Sequence[bytes]] = None) -> int:
+        """
+        Append stored rows without placing them in the logical order; call set_order
+        afterwards. Returns the first new row id. Cost is proportional to the new data only.
+        """
+        embeddings = to_numpy(embeddings)
+        if embeddings.ndim == 1:
+            embeddings = embeddings.reshape(1, -1)
+        if len(embeddings) != len(texts):
+            raise ValueError(f"Got {len(embeddings)} embeddings for {len(texts)} texts")
+        if self.manifest is None:
+            self.reset()
+        count = self.manifest['count']
+        if len(embeddings) == 0:
+            return count
+
+        if count == 0:
+            self._start_files(int(embeddings.shape[1]))
+        elif embeddings.shape[1] != self.manifest['dim']:
+            raise ValueError(f"Embedding dimension {embeddings.shape[1]} does not match the store ({self.manifest['dim']})")
+
+        encoded = [text.encode('utf-8') for text in texts]
+        hashes = np.array(hashes if hashes is not None else [content_hash(text) for text in texts], dtype=HASH_DTYPE)
+        text_end = int(_open_npy(self._path('offsets'), np.int64, (count + 1,))[-1])
+        with open(self._path('text'), 'r+b') as f:
+            f.seek(text_end)
+            f.write(b''.join(encoded))
+        new_offsets = text_end + np.cumsum([len(data) for data in encoded], dtype=np.int64)
+
+        _append_npy(self._path('vectors'), embeddings.astype(self.dtype, copy=False), count)
+        _append_npy(self._path('hashes'), hashes, count)
+        _append_npy(self._path('offsets'), new_offsets, count + 1)
+        self.manifest['count'] = count + len(embeddings)
+        self.manifest['segments'].append({'start': count, 'count': len(embeddings)})
+        return count
+
+    def append(self, embeddings, texts: Sequence[str]):
+        """Append chunks at the end of the logical order."""
+        live = len(self)
+        start = self.append_rows(embeddings, texts)
+        added = self.manifest['count'] - start
+        if self.manifest['ordered'] and live == start:
+            self.manifest.update(live=live + added, revision=uuid.uuid4().hex)
+            self._write_manifest()
+        else:
+            self.set_order(np.concatenate([self.logical_rows(), np.arange(start, start + added, dtype=np.int64)]))
+
+    def stored_hashes(self) -> np.ndarray:
+        return np.array(_open_npy(self._path('hashes'), HASH_DTYPE, (self.stored_rows,))) if self.stored_rows else np.empty(0, dtype=HASH_DTYPE)
+
+    def hash_lookup(self) -> Dict[bytes, int]:
+        """Content hash -> a stored row holding that chunk."""
+        return {digest: row for row, digest in enumerate(self.stored_hashes().tolist())}
+
+    def logical_rows(self) -> np.ndarray:
+        """Stored row of each chunk, in logical order."""
+        if self.manifest is None:
+            return np.empty(0, dtype=np.int64)
+        if self.manifest['ordered']:
+            return np.arange(self.manifest['live'], dtype=np.int64)
+        return np.load(self._path('order'))
+
+    def set_order(self, rows: np.ndarray):
+        """Set the logical order as stored row ids, and commit the appended rows."""
+        rows = np.asarray(rows, dtype=np.int64)
+        ordered = len(rows) == self.manifest['count'] and bool(np.array_equal(rows, np.arange(len(rows))))
+        if not ordered:
+            tmp_path = f"{self._path('order')}.tmp.npy"
+            np.save(tmp_path, rows)
+            os.replace(tmp_path, self._path('order'))
+        self.manifest.update(live=len(rows), ordered=ordered, revision=uuid.uuid4().hex)
+        self._write_manifest()
+
+    def garbage_rows(self) -> int:
+        """Stored rows no chunk points at any more."""
+        if self.manifest is None or self.manifest['ordered']:
+            return 0
+        return self.manifest['count'] - len(np.unique(self.logical_rows()))
+
+    def needs_compaction(self) -> bool:
+        if self.manifest is None or self.manifest['count'] == 0:
+            return False
+        return (self.garbage_rows() > settings.embedding_compaction_ratio * self.manifest['count']
+                or len(self.manifest['segments']) > settings.embedding_max_segments)
+
+    def compact(self):
+        """Rewrite the stored rows in logical order as a single segment under a new generation."""
+        rows = self.logical_rows()
+        old_generation = self.manifest['generation']
+        stored = self.stored_rows
+        vectors = _open_npy(self._path('vectors'), self.dtype, (stored, self.manifest['dim']))
+        texts = TextStore(self._path('text'), _open_npy(self._path('offsets'), np.int64, (stored + 1,)), rows)
+        hashes = self.stored_hashes()
+
+        self.manifest['generation'] = new_generation = old_generation + 1
+        self._start_files(self.manifest['dim'])
+        text_end = 0
+        with open(self._path('text'), 'r+b') as text_file:
+            for start in range(0, len(rows), _COMPACT_BLOCK):
+                block = rows[start:start + _COMPACT_BLOCK]
+                encoded = [text.encode('utf-8') for text in texts[start:start + len(block)]]
+                text_file.write(b''.join(encoded))
+                new_offsets = text_end + np.cumsum([len(data) for data in encoded], dtype=np.int64)
+                text_end = int(new_offsets[-1])
+                _append_npy(self._path('vectors'), np.asarray(vectors[block]), start)
+                _append_npy(self._path('hashes'), hashes[block], start)
+                _append_npy(self._path('offsets'), new_offsets, start + 1)
+        del vectors, texts
+
+        garbage = self.manifest['count'] - len(rows)
+        self.manifest.update(count=len(rows), live=len(rows), ordered=True,
+                             segments=[{'start': 0, 'count': len(rows)}] if len(rows) else [])
+        self._write_manifest()
+        _remove_files(self._generation_files(old_generation))
+        logging.info(success(f"Compacted embedding store to {len(rows)} rows ({max(garbage, 0)} rows reclaimed, generation {new_generation})"))
+
+    def open(self) -> Tuple[np.ndarray, TextStore]:
+        """
+        Memory-map the embeddings matrix and text store in logical order. Until the
+        store is compacted after out-of-order changes, the matrix is gathered into memory.
+        """
+        if self.manifest is None:
+            raise FileNotFoundError(f"Embedding store {self.paths['manifest']} not found")
+        count, dim = self.manifest['count'], self.manifest['dim'] or 0
+        vectors = _open_npy(self._path('vectors'), self.dtype, (count, dim))
+        offsets = _open_npy(self._path('offsets'), np.int64, (count + 1,)) if count else np.zeros(1, dtype=np.int64)
+        if self.manifest['ordered']:
+            live = self.manifest['live']
+            return vectors[:live], TextStore(self._path('text'), offsets[:live + 1])
+        rows = self.logical_rows()
+        return np.asarray(vectors[rows]), TextStore(self._path('text'), offsets, rows)
+
+    def migrate_legacy(self) -> bool:
+        """Convert a pickled db_embeddings.pt from older versions into the store, if one exists."""
+        if not os.path.exists(self.paths['legacy']):
+            return False
+        import torch
+        logging.info(info(f"Converting legacy embeddings file {self.paths['legacy']}"))
+        data = torch.load(self.paths['legacy'])
+        self.reset()
+        self.append(data['embeddings'], list(data['content']))
+        logging.info(success(f"Converted {len(self)} embeddings to {self._path('vectors')}"))
+        return True
+
+def embeddings_exist(embeddings_file_path: str) -> bool:
+    paths = get_store_paths(embeddings_file_path)
+    return os.path.exists(paths['manifest']) or os.path.exists(paths['legacy'])
+
+def open_embedding_store(embeddings_file_path: str) -> Optional[Tuple[np.ndarray, TextStore]]:
+    """Open the store for `embeddings_file_path`, converting a legacy .pt file on first use."""
+    store = EmbeddingStore(embeddings_file_path)
+    if not store.exists() and not store.migrate_legacy():
+        logging.warning(warning(f"Embedding store for {embeddings_file_path} not found"))
+        return None
+    return store.open()
@@ -1,17 +1,19 @@
 # Standard library imports
 import logging
 import os
-from typing import List, Optional, Tuple
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
 
 # Third-party imports
 import numpy as np
-import torch
-from sentence_transformers import SentenceTransformer
 
 # Local imports
 from src.api_model import EragAPI
+from src.embedding_cache import get_embedding_cache
+from src.embedding_store import EmbeddingStore, content_hash, open_embedding_store, to_numpy
 from src.look_and_feel import error, info, success, warning
 from src.settings import settings
+from src.vector_index import VectorIndex, get_vector_index_path
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -25,84 +27,177 @@ def load_db_content(file_path: str) -> List[str]:
             return [line.strip() for line in db_file]
     return []
 
-def compute_and_save_embeddings(model, save_path: str, content: List[str]) -> None:
+def get_embedding_model_name(model) -> Optional[str]:
+    """Name recorded in the embedding store; None when the model does not expose one."""
+    return getattr(model, 'embedding_model', None)
+
+def encode_texts(model, texts: Sequence[str], model_name: Optional[str] = None) -> np.ndarray:
+    """
+    Embed `texts` as a float32 matrix, reusing vectors from the on-disk embedding cache
+    and caching the newly computed ones. Caching needs a model name to key on.
+    """
+    texts = list(texts)
+    model_name = model_name or get_embedding_model_name(model)
+    cache = get_embedding_cache() if model_name else None
+    vectors = cache.get_many(model_name, texts) if cache else [None] * len(texts)
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        missing_texts = [texts[i] for i in missing]
+        computed = model._encode(missing_texts) if isinstance(model, EragAPI) else model.encode(missing_texts, show_progress_bar=False)
+        computed = to_numpy(computed).astype(np.float32, copy=False)
+        if cache:
+            cache.put_many(model_name, missing_texts, computed)
+        for i, vector in zip(missing, computed):
+            vectors[i] = vector
+    if len(missing) < len(texts):
+        print(info(f"Reused {len(texts) - len(missing)} of {len(texts)} embeddings from the cache"))
+    return np.vstack(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+
+def compute_and_save_embeddings(model, save_path: str, content: List[str], model_name: Optional[str] = None) -> None:
+    """Embed all of `content` from scratch, replacing the store."""
     try:
         ensure_output_folder()
-        save_path = os.path.join(settings.output_folder, os.path.basename(save_path))
-        
-        print(info(f"Computing embeddings for {len(content)} items using {type(model).__name__}"))
-        db_embeddings = []
-        for i in range(0, len(content), settings.batch_size):
-            batch = content[i:i+settings.batch_size]
-            batch_embeddings = model._encode(batch) if isinstance(model, EragAPI) else model.encode(batch, convert_to_tensor=True)
-            db_embeddings.append(batch_embeddings)
-            print(info(f"Processed batch {i//settings.batch_size + 1}/{(len(content)-1)//settings.batch_size + 1}"))
-
-        db_embeddings = torch.cat(db_embeddings, dim=0)
-        print(info(f"Final embeddings shape: {db_embeddings.shape}"))
-        
-        data_to_save = {
-            'embeddings': db_embeddings,
-            'indexes': torch.arange(len(content)),
-            'content': content
-        }
-        
-        torch.save(data_to_save, save_path)
-        print(success(f"Embeddings, indexes, and content saved to {save_path}"))
-        
-        # Verify saved data
-        loaded_data = torch.load(save_path)
-        print(info(f"Verified saved embeddings shape: {loaded_data['embeddings'].shape}"))
-        print(info(f"Verified saved indexes shape: {loaded_data['indexes'].shape}"))
-        print(info(f"Verified saved content length: {len(loaded_data['content'])}"))
+        model_name = model_name or get_embedding_model_name(model)
+        store = EmbeddingStore(save_path)
+        store.reset(model=model_name)
+        update_embeddings(model, save_path, content, model_name)
     except Exception as e:
         print(error(f"Error in compute_and_save_embeddings: {str(e)}"))
         raise
 
-def load_embeddings_and_data(embeddings_file: str) -> Tuple[Optional[torch.Tensor], Optional[torch.Tensor], Optional[List[str]]]:
+def update_embeddings(model, save_path: str, content: List[str], model_name: Optional[str] = None) -> None:
+    """
+    Bring the store in line with `content`, embedding only chunks whose content hash
+    is not stored yet. Unchanged chunks keep their vectors, so the cost is proportional
+    to the new or changed data rather than the corpus. `model_name` is needed for a
+    SentenceTransformer, which does not expose its name; it keys the embedding cache and
+    is recorded in the store.
+    """
     try:
-        embeddings_file = os.path.join(settings.output_folder, os.path.basename(embeddings_file))
-        
-        if os.path.exists(embeddings_file):
-            data = torch.load(embeddings_file)
-            embeddings = torch.as_tensor(data['embeddings'])
-            indexes = torch.as_tensor(data['indexes'])
-            content = data['content']
-            
-            print(info(f"Loaded embeddings shape: {embeddings.shape}"))
-            print(info(f"Loaded indexes shape: {indexes.shape}"))
-            print(info(f"Loaded content length: {len(content)}"))
-            return embeddings, indexes, content
-        else:
-            print(warning(f"Embeddings file {embeddings_file} not found"))
+        ensure_output_folder()
+        save_path = os.path.join(settings.output_folder, os.path.basename(save_path))
+        store = EmbeddingStore(save_path)
+        if not store.exists():
+            store.migrate_legacy()
+
+        model_name = model_name or get_embedding_model_name(model)
+        if not store.exists():
+            store.reset(model=model_name)
+        elif model_name is not None and store.model not in (None, model_name):
+            print(warning(f"Embeddings were computed with {store.model}, recomputing them with {model_name}"))
+            store.reset(model=model_name)
+        elif store.model is None and model_name is not None:
+            store.set_model(model_name)
+
+        previous_rows = store.logical_rows()
+        previous_revision = store.revision
+        hashes = [content_hash(text) for text in content]
+        known = store.hash_lookup()
+        missing: Dict[bytes, str] = {}
+        for digest, text in zip(hashes, content):
+            if digest not in known and digest not in missing:
+                missing[digest] = text
+
+        print(info(f"{len(content)} chunks, {len(missing)} new or changed to embed using {type(model).__name__}"))
+        missing_hashes, missing_texts = list(missing), list(missing.values())
+        # The Ollama client spreads a larger block over several concurrent requests
+        batch_size = model.encode_block_size if isinstance(model, EragAPI) else settings.batch_size
+        total_batches = (len(missing_texts) - 1) // batch_size + 1
+        started = time.perf_counter()
+        for i in range(0, len(missing_texts), batch_size):
+            batch = missing_texts[i:i+batch_size]
+            batch_hashes = missing_hashes[i:i+batch_size]
+            batch_embeddings = encode_texts(model, batch, model_name)
+            start = store.append_rows(batch_embeddings, batch, batch_hashes)
+            known.update((digest, start + offset) for offset, digest in enumerate(batch_hashes))
+            rate = (i + len(batch)) / max(time.perf_counter() - started, 1e-9)
+            print(info(f"Processed batch {i//batch_size + 1}/{total_batches} ({rate:.1f} texts/sec)"))
+
+        rows = np.fromiter((known[digest] for digest in hashes), dtype=np.int64, count=len(hashes))
+        # Leave the manifest untouched when nothing changed, so readers keyed on it stay valid
+        if missing or not np.array_equal(rows, previous_rows):
+            store.set_order(rows)
+            if store.needs_compaction():
+                store.compact()
+
+        db_embeddings, _ = store.open()
+        print(info(f"Final embeddings shape: {db_embeddings.shape} ({store.dtype}, {store.stored_rows} stored rows)"))
+        print(success(f"Embeddings and content saved to {store.paths['manifest']}"))
+        update_vector_index(db_embeddings, get_vector_index_path(save_path), previous_rows, rows, previous_revision, store.revision)
+    except Exception as e:
+        print(error(f"Error in update_embeddings: {str(e)}"))
+        raise
+
+def update_vector_index(db_embeddings: np.ndarray, index_path: str, previous_rows: np.ndarray, rows: np.ndarray,
+                        previous_revision: Optional[str] = None, revision: Optional[str] = None) -> None:
+    """
+    Extend the saved vector index when chunks were only appended, otherwise rebuild it.
+    The revisions are the store's before and after the update.
+    """
+    appended_only = len(previous_rows) <= len(rows) and np.array_equal(previous_rows, rows[:len(previous_rows)])
+    vector_index = (VectorIndex.load(index_path, db_embeddings[:len(previous_rows)], previous_revision)
+                    if appended_only and len(previous_rows) else None)
+    if vector_index is not None and vector_index.index_type == VectorIndex._resolve_type(settings.vector_index_type, len(db_embeddings)):
+        if len(rows) == len(previous_rows) and revision == previous_revision:
+            return
+        vector_index.add(db_embeddings[len(previous_rows):], db_embeddings)
+        print(success(f"Added {len(rows) - len(previous_rows)} embeddings to the {vector_index.index_type} vector index"))
+    else:
+        vector_index = VectorIndex.build(db_embeddings)
+        print(success(f"Built {vector_index.index_type} vector index for {len(vector_index)} embeddings"))
+    vector_index.save(index_path, revision)
+
+def load_embeddings_and_data(embeddings_file: str) -> Tuple[Optional[np.ndarray], Optional[np.ndarray], Optional[Sequence[str]]]:
+    try:
+        opened = open_embedding_store(embeddings_file)
+        if opened is None:
             return None, None, None
+
+        embeddings, content = opened
+        indexes = np.arange(len(content))
+        print(info(f"Loaded embeddings shape: {embeddings.shape}"))
+        print(info(f"Loaded indexes shape: {indexes.shape}"))
+        print(info(f"Loaded content length: {len(content)}"))
+        return embeddings, indexes, content
     except Exception as e:
         print(error(f"Error in load_embeddings_and_data: {str(e)}"))
         raise
 
-def load_or_compute_embeddings(model, db_file: str, embeddings_file: str) -> Tuple[torch.Tensor, torch.Tensor, List[str]]:
+def load_or_compute_embeddings(model, db_file: str, embeddings_file: str, model_name: Optional[str] = None,
+                               sync: bool = True) -> Tuple[np.ndarray, np.ndarray, Sequence[str]]:
+    """
+    The stored embeddings, indexes and content. With sync, the store is first brought in
+    line with db.txt; without it, an existing store is loaded as is and only computed
+    when there is none, for callers that just read the embeddings.
+    """
     try:
         db_file = os.path.join(settings.output_folder, os.path.basename(db_file))
         embeddings_file = os.path.join(settings.output_folder, os.path.basename(embeddings_file))
-        
-        embeddings, indexes, content = load_embeddings_and_data(embeddings_file)
-        if embeddings is None or indexes is None or content is None:
-            content = load_db_content(db_file)
-            compute_and_save_embeddings(model, embeddings_file, content)
-            embeddings, indexes, content = load_embeddings_and_data(embeddings_file)
-        return embeddings, indexes, content
+
+        store = EmbeddingStore(embeddings_file)
+        if not sync and store.exists():
+            model_name = model_name or get_embedding_model_name(model)
+            if model_name is not None and store.model not in (None, model_name):
+                print(warning(f"Embeddings were computed with {store.model}, not {model_name}; run Execute Embeddings to recompute them"))
+        # Embed only what changed in db.txt since the store was last updated
+        elif os.path.exists(db_file):
+            update_embeddings(model, embeddings_file, load_db_content(db_file), model_name)
+        return load_embeddings_and_data(embeddings_file)
     except Exception as e:
         print(error(f"Error in load_or_compute_embeddings: {str(e)}"))
         raise
 
 if __name__ == "__main__":
+    from sentence_transformers import SentenceTransformer
+
     try:
         ensure_output_folder()
         model = (EragAPI(settings.api_type, embedding_class=settings.default_embedding_class, embedding_model=settings.default_embedding_model)
                  if settings.default_embedding_class == "ollama" else
                  SentenceTransformer(settings.default_embedding_model))
         
-        embeddings, indexes, content = load_or_compute_embeddings(model, settings.db_file_path, settings.embeddings_file_path)
+        embeddings, indexes, content = load_or_compute_embeddings(model, settings.db_file_path, settings.embeddings_file_path,
+                                                                  settings.default_embedding_model)
         print(success(f"DB Embeddings shape: {embeddings.shape}, Indexes shape: {indexes.shape}"))
         print(success(f"DB Content length: {len(content)}"))
     except Exception as e:
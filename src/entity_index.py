@@ -0,0 +1,196 @@
+# Standard library imports
+import json
+import logging
+import os
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# Local imports
+from src.graph_store import graph_fingerprint
+from src.look_and_feel import info, success, warning
+from src.settings import settings
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+INDEX_VERSION = 1
+TOKEN_PATTERN = re.compile(r'\w+')
+
+def normalize_name(text: str) -> str:
+    """Lowercase and reduce to space-separated word tokens, so matching respects word boundaries."""
+    return " ".join(TOKEN_PATTERN.findall(text.lower()))
+
+class EntityIndex:
+    """
+    Precomputed table of the entity nodes in a knowledge graph.
+
+    Everything get_graph_context needs per entity (type, confidence, chunk and document
+    degree, related entities and the first chunk texts) is computed once, so a query
+    only has to find which entity names occur in it. Rows are kept sorted by their
+    query-independent base score, so the best non-matching entities are a prefix.
+    """
+
+    def __init__(self, entities: Dict[str, list], graph_nodes: int = 0, graph_edges: int = 0, graph_fingerprint: Optional[str] = None):
+        self.entities = entities
+        self.graph_nodes = graph_nodes
+        self.graph_edges = graph_edges
+        # Fingerprint of the saved graph it was built from; counts alone miss a rebuilt graph of the same size
+        self.graph_fingerprint = graph_fingerprint
+        self.name_lookup: Dict[str, List[int]] = {}
+        for row, name in enumerate(entities['name']):
+            normalized = normalize_name(name)
+            if normalized:
+                self.name_lookup.setdefault(normalized, []).append(row)
+        self.max_name_tokens = max((key.count(" ") + 1 for key in self.name_lookup), default=0)
+        self.automaton = self._build_automaton() if ahocorasick is not None else None
+
+    def __len__(self) -> int:
+        return len(self.entities['name'])
+
+    def _build_automaton(self):
+        automaton = ahocorasick.Automaton()
+        for normalized, rows in self.name_lookup.items():
+            # Padding with spaces makes every hit a whole-word match
+            automaton.add_word(f" {normalized} ", rows)
+        if len(automaton):
+            automaton.make_automaton()
+        return automaton
+
+    def match(self, query: str) -> Set[int]:
+        """Rows of the entities whose names occur in the query."""
+        normalized_query = normalize_name(query)
+        matched: Set[int] = set()
+        if not normalized_query or not self.name_lookup:
+            return matched
+
+        if self.automaton is not None:
+            for _, rows in self.automaton.iter(f" {normalized_query} "):
+                matched.update(rows)
+            return matched
+
+        # Dictionary lookup of every word n-gram up to the longest entity name
+        tokens = normalized_query.split()
+        for start in range(len(tokens)):
+            for end in range(start + 1, min(len(tokens), start + self.max_name_tokens) + 1):
+                rows = self.name_lookup.get(" ".join(tokens[start:end]))
+                if rows:
+                    matched.update(rows)
+        return matched
+
+    def top_entities(self, query: str, top_k: int, threshold: float) -> List[int]:
+        """Rows of the top_k entities by relevance to the query, best first."""
+        base_scores = self.entities['base_score']
+        confidences = self.entities['confidence']
+        scored: Dict[int, float] = {}
+
+        for row in self.match(query):
+            score = base_scores[row] + confidences[row]
+            if score >= threshold:
+                scored[row] = score
+
+        # Without a name match the score is just the base score, and rows are sorted by it
+        taken = 0
+        for row, base_score in enumerate(base_scores):
+            if taken >= top_k or base_score < threshold:
+                break
+            if row not in scored:
+                scored[row] = base_score
+                taken += 1
+
+        return sorted(scored, key=lambda row: (-scored[row], row))[:top_k]
+
+    def context(self, row: int) -> str:
+        entity_info = f"Entity: {self.entities['name'][row]} (Type: {self.entities['entity_type'][row]})"
+        related_info = f"Related Entities: {', '.join(self.entities['related'][row])}"
+        return f"{entity_info}\n{related_info}\nRelevant Chunks:\n" + "\n".join(self.entities['chunk_texts'][row])
+
+    def is_current(self, graph) -> bool:
+        fingerprint = graph_fingerprint(graph)
+        if fingerprint is not None or self.graph_fingerprint is not None:
+            return fingerprint == self.graph_fingerprint
+        # Graph stores and indexes saved before fingerprints existed
+        return self.graph_nodes == graph.number_of_nodes() and self.graph_edges == graph.number_of_edges()
+
+    def save(self, file_path: str):
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        data = {
+            'version': INDEX_VERSION,
+            'graph_nodes': self.graph_nodes,
+            'graph_edges': self.graph_edges,
+            'graph_fingerprint': self.graph_fingerprint,
+            'entities': self.entities,
+        }
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        logging.info(success(f"Entity index with {len(self)} entities saved to {file_path}"))
+
+    @classmethod
+    def load(cls, file_path: str) -> Optional["EntityIndex"]:
+        if not os.path.exists(file_path):
+            return None
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != INDEX_VERSION:
+                return None
+            index = cls(data['entities'], data['graph_nodes'], data['graph_edges'], data.get('graph_fingerprint'))
+            logging.info(info(f"Loaded entity index with {len(index)} entities from {file_path}"))
+            return index
+        except Exception as e:
+            logging.warning(warning(f"Failed to load entity index {file_path}: {str(e)}"))
+            return None
+
+def _parent_document(G, chunk_node: str) -> Optional[str]:
+    for neighbor in G.neighbors(chunk_node):
+        if G.nodes[neighbor].get('type') == 'document':
+            return neighbor
+    return None
+
+def build_entity_index(G, chunks_per_entity: int = 3, related_per_entity: int = 5, fingerprint: Optional[str] = None) -> EntityIndex:
+    """
+    Walk the graph once and compute the per-entity table used by get_graph_context.
+    Pass the fingerprint save_graph returned when G is the in-memory graph just saved.
+    """
+    rows: List[Tuple[float, str, str, float, int, int, List[str], List[str]]] = []
+    parent_cache: Dict[str, Optional[str]] = {}
+
+    for node, data in G.nodes(data=True):
+        if data.get('type') != 'entity':
+            continue
+        confidence = data.get('confidence', 0.5)  # Default confidence if not set
+        connected_chunks, related_entities = [], []
+        for neighbor in G.neighbors(node):
+            neighbor_type = G.nodes[neighbor].get('type')
+            if neighbor_type == 'chunk':
+                connected_chunks.append(neighbor)
+            elif neighbor_type == 'entity' and len(related_entities) < related_per_entity:
+                related_entities.append(neighbor)
+
+        connected_docs = set()
+        for chunk in connected_chunks:
+            if chunk not in parent_cache:
+                parent_cache[chunk] = _parent_document(G, chunk)
+            connected_docs.add(parent_cache[chunk])
+
+        base_score = (len(connected_chunks) * 0.1 + len(connected_docs) * 0.2) * confidence
+        chunk_texts = [G.nodes[chunk].get('text', '') for chunk in connected_chunks[:chunks_per_entity]]
+        rows.append((base_score, node, data.get('entity_type', 'Unknown'), confidence,
+                     len(connected_chunks), len(connected_docs), chunk_texts, related_entities))
+
+    rows.sort(key=lambda row: -row[0])
+    columns = ['base_score', 'name', 'entity_type', 'confidence', 'chunk_count', 'doc_count', 'chunk_texts', 'related']
+    entities = {column: [row[i] for row in rows] for i, column in enumerate(columns)}
+    return EntityIndex(entities, G.number_of_nodes(), G.number_of_edges(), fingerprint or graph_fingerprint(G))
+
+def load_or_build_entity_index(G, file_path: Optional[str] = None) -> EntityIndex:
+    """Load the persisted entity index if it was built from this graph, otherwise build it in memory."""
+    index = EntityIndex.load(file_path or settings.entity_index_file_path)
+    if index is not None and index.is_current(G):
+        return index
+    logging.info(info("Entity index missing or out of date, building it from the knowledge graph"))
+    return build_entity_index(G)
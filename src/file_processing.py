@@ -3,22 +3,144 @@ import json
 import logging
 import os
 import re
+import shutil
+import tempfile
 import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from queue import Queue
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 # Third-party imports
 import docx
 import fitz  # PyMuPDF
-from tkinter import filedialog
 
 # Local imports
+from src.inverted_index import load_or_build_inverted_index
 from src.look_and_feel import error, info, success, warning
 from src.settings import settings
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+TocEntry = Tuple[int, str, int]
+
+_WHITESPACE = re.compile(r'\s+')
+# Characters read per block when streaming plain text files
+_TEXT_BLOCK_SIZE = 1024 * 1024
+
+def iter_chunks(segments: Iterable[str], chunk_size: int, overlap_size: int) -> Iterator[str]:
+    """
+    Chunk the concatenation of `segments` exactly as FileProcessor.handle_text_chunking
+    chunks the whole text, while holding only about one chunk plus one segment in memory.
+    """
+    buffer = ""  # Whitespace-normalized text starting at absolute position `offset`
+    offset = 0
+    start = 0
+    started = False
+    ends_with_space = False
+
+    def next_chunk(text_len: int) -> Tuple[str, int]:
+        end = start + chunk_size
+        chunk_text = buffer[start - offset:min(end, text_len) - offset]
+        if end < text_len:
+            last_space = chunk_text.rfind(' ')
+            if last_space != -1:
+                end = start + last_space
+                chunk_text = chunk_text[:last_space]
+        # Always move forward, even when the overlap is not smaller than the chunk
+        return chunk_text.strip(), max(end - overlap_size, start + 1)
+
+    for segment in segments:
+        normalized = _WHITESPACE.sub(' ', segment)
+        if ends_with_space and normalized.startswith(' '):
+            normalized = normalized[1:]
+        if not started:
+            normalized = normalized.lstrip(' ')
+            started = bool(normalized)
+        if not normalized:
+            continue
+        buffer += normalized
+        ends_with_space = normalized.endswith(' ')
+
+        # A trailing space may still be stripped, so only text before it is final
+        known_len = offset + len(buffer) - ends_with_space
+        while start + chunk_size < known_len:
+            chunk, start = next_chunk(known_len)
+            yield chunk
+        buffer = buffer[start - offset:]
+        offset = start
+
+    text_len = offset + len(buffer) - ends_with_space
+    while start < text_len:
+        chunk, start = next_chunk(text_len)
+        yield chunk
+
+def iter_pdf_text(file_path: str) -> Iterator[str]:
+    with fitz.open(file_path) as doc:
+        for page_number, page in enumerate(doc):
+            if page_number:
+                yield " "
+            yield page.get_text()
+
+def iter_docx_text(doc: docx.Document) -> Iterator[str]:
+    # Paragraphs and table rows, in document order
+    first = True
+    for element in doc.element.body:
+        if element.tag.endswith('p'):
+            parts = [element.text]
+        elif element.tag.endswith('tbl'):
+            parts = [' | '.join(cell.text for cell in row.findall('.//w:t', namespaces=element.nsmap))
+                     for row in element.findall('.//w:tr', namespaces=element.nsmap)]
+        else:
+            continue
+        for part in parts:
+            if not first:
+                yield " "
+            first = False
+            yield part
+
+def iter_text_file(file_path: str) -> Iterator[str]:
+    with open(file_path, 'r', encoding="utf-8") as txt_file:
+        for block in iter(lambda: txt_file.read(_TEXT_BLOCK_SIZE), ''):
+            yield block
+
+def read_document(file_type: str, file_path: str) -> Tuple[Iterator[str], List[TocEntry]]:
+    """A lazy stream of the document's text and its table of contents."""
+    if file_type == "DOCX":
+        doc = docx.Document(file_path)
+        return iter_docx_text(doc), FileProcessor.generate_toc_docx(doc)
+    if file_type == "PDF":
+        return iter_pdf_text(file_path), FileProcessor.generate_toc_pdf(file_path)
+    if file_type == "Text":
+        with open(file_path, 'r', encoding="utf-8") as txt_file:
+            toc_text = FileProcessor.extract_toc_from_lines(txt_file)
+        return iter_text_file(file_path), [(1, line, 0) for line in toc_text.split('\n') if line.strip()]
+    if file_type == "JSON":
+        with open(file_path, 'r', encoding="utf-8") as json_file:
+            data = json.load(json_file)
+        # Same text as json.dumps(data, indent=2), produced piece by piece
+        return json.JSONEncoder(indent=2).iterencode(data), FileProcessor.generate_toc_json(data)
+    raise ValueError(f"Unsupported file type: {file_type}")
+
+def ingest_file(file_type: str, file_path: str, spool_path: str, chunk_size: int, overlap_size: int,
+                buffer_size: int) -> Tuple[int, List[TocEntry]]:
+    """
+    Extract and chunk one file into `spool_path`, one chunk per line as in db.txt.
+    Runs in a worker process, so everything it needs is passed in rather than read from settings.
+    """
+    segments, toc = read_document(file_type, file_path)
+    chunk_count = 0
+    with open(spool_path, "w", encoding="utf-8", buffering=buffer_size) as spool:
+        for chunk in iter_chunks(segments, chunk_size, overlap_size):
+            spool.write(f"{chunk}\n")
+            chunk_count += 1
+    return chunk_count, toc
+
+def get_ingest_executor(file_count: int) -> Executor:
+    workers = min(settings.ingest_workers or os.cpu_count() or 1, file_count)
+    # A single file gains nothing from a process pool, but still overlaps with writing
+    return ProcessPoolExecutor(max_workers=workers) if workers > 1 else ThreadPoolExecutor(max_workers=1)
+
 class FileProcessor:
     def __init__(self):
         self.toc = []
@@ -53,6 +175,28 @@ class FileProcessor:
 
         return '\n'.join(toc_lines)
 
+    @staticmethod
+    def extract_toc_from_lines(lines: Iterable[str]) -> str:
+        """extract_toc_from_text over an iterable of newline-terminated lines, such as an open file."""
+        toc_lines = []
+        found = False
+        for line_number, line in enumerate(lines):
+            stripped_line = line.strip()
+            if not found:
+                # The Contents heading must follow a newline and end with one
+                found = line_number > 0 and line.endswith('\n') and stripped_line.lower() == 'contents'
+                continue
+            if not stripped_line:
+                continue
+            if re.match(r'^CHAPTER [IVXLC]+\.?\s+', stripped_line, re.IGNORECASE):
+                toc_lines.append(stripped_line)
+            elif toc_lines and not re.match(r'^CHAPTER', stripped_line, re.IGNORECASE):
+                break
+            if len(toc_lines) >= 50:  # Reasonable limit for number of chapters
+                break
+
+        return '\n'.join(toc_lines) if found else "No table of contents found"
+
     @staticmethod
     def generate_toc_docx(doc: docx.Document) -> List[Tuple[int, str, int]]:
         return [(int(para.style.name[-1]), para.text, 0) for para in doc.paragraphs if para.style.name.startswith('Heading')]
@@ -62,13 +206,14 @@ class FileProcessor:
         with fitz.open(pdf_path) as doc:
             return doc.get_toc()
 
-    def generate_toc_json(self, data: dict, prefix: str = "") -> List[Tuple[int, str, int]]:
+    @staticmethod
+    def generate_toc_json(data: dict, prefix: str = "") -> List[Tuple[int, str, int]]:
         toc = []
         for key, value in data.items():
             full_key = f"{prefix}.{key}" if prefix else key
             toc.append((1, full_key, 0))
             if isinstance(value, dict):
-                toc.extend(self.generate_toc_json(value, full_key))
+                toc.extend(FileProcessor.generate_toc_json(value, full_key))
             elif isinstance(value, list) and value and isinstance(value[0], dict):
                 toc.append((2, f"{full_key} (list of objects)", 0))
         return toc
@@ -81,6 +226,8 @@ class FileProcessor:
             "JSON": [("JSON Files", "*.json")]
         }
         
+        # Imported here so headless ingestion (src/ingest_cli.py) works without tkinter
+        from tkinter import filedialog
         file_paths = filedialog.askopenfilenames(filetypes=filetypes[file_type])
         if file_paths:
             self.total_files += len(file_paths)
@@ -99,37 +246,74 @@ class FileProcessor:
     def process_file_queue(self):
         print(info(f"Starting to process {self.total_files} files..."))
         while not self.file_queue.empty():
-            file_type, file_path = self.file_queue.get()
-            self.processed_files += 1
+            # Files queued while a batch is ingesting are picked up by the next batch
+            batch = []
+            while not self.file_queue.empty():
+                batch.append(self.file_queue.get())
             try:
-                text, filename = self.process_single_file(file_type, file_path)
-                if text:
-                    chunks = self.handle_text_chunking(text)
-                    print(info(f"Processing {filename}... ({self.processed_files}/{self.total_files})"))
-                    print(info("Extracting or generating table of contents..."))
-                    
-                    toc_str = self.format_toc()
-                    print(info(f"Method: TOC generated using {file_type}-specific method"))
-                    
-                    if not toc_str or toc_str.strip() == "":
-                        print(warning(f"Warning: Failed to generate a table of contents for {filename}."))
-                        toc_str = f"No table of contents could be generated for {filename}."
-                    
-                    print(info("Appending to db_content.txt..."))
-                    self.append_to_db_content(filename, toc_str)
-                    self.append_to_db(chunks)
-                    print(success(f"Processed and appended {filename} to db.txt and db_content.txt. ({self.processed_files}/{self.total_files})"))
-                else:
-                    print(warning(f"Warning: {filename} was empty or could not be processed. ({self.processed_files}/{self.total_files})"))
+                self.ingest_files(batch)
             except Exception as e:
-                print(error(f"Error processing {file_path}: {str(e)} ({self.processed_files}/{self.total_files})"))
+                print(error(f"Error ingesting files: {str(e)}"))
             finally:
-                self.file_queue.task_done()
+                for _ in batch:
+                    self.file_queue.task_done()
 
         print(success(f"All files processed. Total: {self.total_files}"))
         self.total_files = 0
         self.processed_files = 0
 
+    def ingest_files(self, files: List[Tuple[str, str]], db_file: str = "db.txt") -> Tuple[int, int]:
+        """
+        Extract and chunk `files` across a worker pool, streaming each document page by page,
+        and append them to db.txt and db_content.txt in queue order.
+        Returns the number of files ingested and the number of chunks written.
+        """
+        db_file_path = os.path.join(settings.output_folder, db_file)
+        spool_dir = tempfile.mkdtemp(prefix="ingest_", dir=settings.output_folder)
+        ingested_files = 0
+        total_chunks = 0
+        try:
+            with get_ingest_executor(len(files)) as executor:
+                futures = [executor.submit(ingest_file, file_type, file_path, os.path.join(spool_dir, f"{i}.txt"),
+                                           settings.file_chunk_size, settings.file_overlap_size, settings.ingest_buffer_size)
+                           for i, (file_type, file_path) in enumerate(files)]
+                with open(db_file_path, "ab") as db:
+                    for i, ((_, file_path), future) in enumerate(zip(files, futures)):
+                        self.processed_files += 1
+                        progress = f"({self.processed_files}/{self.total_files})"
+                        filename = os.path.basename(file_path)
+                        spool_path = os.path.join(spool_dir, f"{i}.txt")
+                        try:
+                            chunk_count, toc = future.result()
+                        except Exception as e:
+                            print(error(f"Error processing {file_path}: {str(e)} {progress}"))
+                            continue
+
+                        if not chunk_count:
+                            print(warning(f"Warning: {filename} was empty or could not be processed. {progress}"))
+                            os.remove(spool_path)
+                            continue
+
+                        toc_str = self.format_toc(toc)
+                        if not toc_str or toc_str.strip() == "":
+                            print(warning(f"Warning: Failed to generate a table of contents for {filename}."))
+                            toc_str = f"No table of contents could be generated for {filename}."
+                        self.append_to_db_content(filename, toc_str)
+
+                        with open(spool_path, "rb") as spool:
+                            shutil.copyfileobj(spool, db, settings.ingest_buffer_size)
+                        os.remove(spool_path)
+                        ingested_files += 1
+                        total_chunks += chunk_count
+                        print(success(f"Processed and appended {filename} ({chunk_count} chunks) to db.txt and db_content.txt. {progress}"))
+        finally:
+            shutil.rmtree(spool_dir, ignore_errors=True)
+
+        if total_chunks:
+            print(success(f"Appended {total_chunks} chunks to {db_file_path}"))
+            self.update_inverted_index(db_file_path)
+        return ingested_files, total_chunks
+
     def process_single_file(self, file_type: str, file_path: str) -> Optional[Tuple[str, str]]:
         try:
             processors = {
@@ -145,25 +329,12 @@ class FileProcessor:
 
     def process_docx(self, file_path: str) -> Tuple[str, str]:
         doc = docx.Document(file_path)
-        
-        # Extract text from paragraphs and tables
-        text_content = []
-        
-        for element in doc.element.body:
-            if element.tag.endswith('p'):
-                text_content.append(element.text)
-            elif element.tag.endswith('tbl'):
-                for row in element.findall('.//w:tr', namespaces=element.nsmap):
-                    cells = [cell.text for cell in row.findall('.//w:t', namespaces=element.nsmap)]
-                    text_content.append(' | '.join(cells))
-        
-        text = " ".join(text_content)
+        text = "".join(iter_docx_text(doc))
         self.toc = self.generate_toc_docx(doc)
         return text, os.path.basename(file_path)
 
     def process_pdf(self, file_path: str) -> Tuple[str, str]:
-        with fitz.open(file_path) as doc:
-            text = " ".join([page.get_text() for page in doc])
+        text = "".join(iter_pdf_text(file_path))
         self.toc = self.generate_toc_pdf(file_path)
         return text, os.path.basename(file_path)
 
@@ -183,23 +354,11 @@ class FileProcessor:
 
     @staticmethod
     def handle_text_chunking(text: str) -> List[str]:
-        text = re.sub(r'\s+', ' ', text).strip()
-        chunks = []
-        start = 0
-        while start < len(text):
-            end = start + settings.file_chunk_size
-            chunk_text = text[start:end]
-            if end < len(text):
-                last_space = chunk_text.rfind(' ')
-                if last_space != -1:
-                    end = start + last_space
-                    chunk_text = text[start:end]
-            chunks.append(chunk_text.strip())
-            start = end - settings.file_overlap_size
-        return chunks
-
-    def format_toc(self) -> str:
-        return '\n'.join(f"{'  ' * (level - 1)}- {title}" for level, title, _ in self.toc)
+        return list(iter_chunks([text], settings.file_chunk_size, settings.file_overlap_size))
+
+    def format_toc(self, toc: Optional[List[TocEntry]] = None) -> str:
+        toc = self.toc if toc is None else toc
+        return '\n'.join(f"{'  ' * (level - 1)}- {title}" for level, title, _ in toc)
 
     @staticmethod
     def append_to_db_content(filename: str, table_of_contents: str):
@@ -220,6 +379,13 @@ class FileProcessor:
                 if total_chunks < 10 or (i + 1) % (total_chunks // 10) == 0:
                     print(info(f"Progress: {(i + 1) / total_chunks * 100:.1f}% ({i + 1}/{total_chunks} chunks)"))
         print(success(f"Appended {total_chunks} chunks to {db_file_path}"))
+        FileProcessor.update_inverted_index(db_file_path)
+
+    @staticmethod
+    def update_inverted_index(db_file_path: str):
+        # Index only the chunks just appended; the rest of the inverted index is reused
+        if os.path.abspath(db_file_path) == os.path.abspath(settings.db_file_path):
+            load_or_build_inverted_index(db_file_path)
 
 # Create a global instance of FileProcessor
 file_processor = FileProcessor()
@@ -12,6 +12,7 @@ import pyarrow.parquet as pq
 from src.settings import settings
 from src.look_and_feel import error, success, warning, info
 from src.api_model import create_erag_api
+from src.response_cache import CACHE_ALWAYS
 
 def read_qa_file(file_path: str) -> List[Dict[str, str]]:
     qa_pairs = []
@@ -58,7 +59,7 @@ Language: [language]
 Answer type: [answer_type]
 """
 
-    response = erag_api.chat([{"role": "user", "content": prompt}])
+    response = erag_api.chat([{"role": "user", "content": prompt}], cache=CACHE_ALWAYS)
     
     # Parse the LLM response
     metadata = {}
@@ -0,0 +1,316 @@
+# Standard library imports
+import hashlib
+import json
+import logging
+import os
+import shutil
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+# Third-party imports
+import networkx as nx
+import numpy as np
+
+# Local imports
+from src.embedding_store import TextStore
+from src.look_and_feel import info, success, warning
+from src.settings import settings
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+STORE_VERSION = 1
+NODE_ATTRS = ('type', 'text', 'entity_type', 'confidence')
+EDGE_ATTRS = ('relation', 'weight', 'confidence')
+
+def get_graph_store_dir(graph_file_path: str) -> str:
+    """Directory of the compact graph saved for `graph_file_path`, e.g. output/knowledge_graph_store."""
+    graph_file_path = os.path.join(settings.output_folder, os.path.basename(graph_file_path))
+    return f"{os.path.splitext(graph_file_path)[0]}_store"
+
+def _intern(values: List[Optional[str]]) -> Tuple[np.ndarray, List[str]]:
+    """Map strings to small integer codes; None becomes -1."""
+    vocabulary: Dict[str, int] = {}
+    codes = np.array([-1 if value is None else vocabulary.setdefault(value, len(vocabulary)) for value in values], dtype=np.int32)
+    return codes, list(vocabulary)
+
+def _optional_floats(values: List[Any]) -> np.ndarray:
+    return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+
+def _write_texts(directory: str, name: str, texts: List[Optional[str]], digest):
+    encoded = [(text or "").encode('utf-8') for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(data) for data in encoded], out=offsets[1:])
+    data = b''.join(encoded)
+    with open(os.path.join(directory, f"{name}.bin"), 'wb') as f:
+        f.write(data)
+    np.save(os.path.join(directory, f"{name}_offsets.npy"), offsets)
+    digest.update(data)
+    digest.update(offsets.tobytes())
+
+def graph_fingerprint(G) -> Optional[str]:
+    """Digest of a saved graph's contents; None for graphs that were not loaded from the compact store."""
+    return getattr(G, 'fingerprint', None)
+
+def save_graph(G: nx.Graph, graph_file_path: str) -> str:
+    """
+    Write G as a compact graph: interned node ids, CSR adjacency with per-entry edge
+    attributes, and node texts in a side store referenced by offset. The store is
+    written next to the old location and swapped in, so readers never see half of it.
+    Returns the fingerprint (a digest of the written data) recorded in its metadata.
+    """
+    store_dir = get_graph_store_dir(graph_file_path)
+    tmp_dir = f"{store_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    nodes = list(G.nodes)
+    node_ids = {node: i for i, node in enumerate(nodes)}
+    node_data = [G.nodes[node] for node in nodes]
+    extra_node_attrs = {str(i): {k: v for k, v in data.items() if k not in NODE_ATTRS}
+                        for i, data in enumerate(node_data) if any(k not in NODE_ATTRS for k in data)}
+
+    # Adjacency in networkx iteration order, so neighbors() keeps its order after loading
+    indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+    indices: List[int] = []
+    relations: List[Optional[str]] = []
+    weights: List[Any] = []
+    confidences: List[Any] = []
+    extra_edge_attrs: Dict[str, Dict[str, Any]] = {}
+    for i, node in enumerate(nodes):
+        for neighbor, data in G.adj[node].items():
+            if any(k not in EDGE_ATTRS for k in data):
+                extra_edge_attrs[str(len(indices))] = {k: v for k, v in data.items() if k not in EDGE_ATTRS}
+            indices.append(node_ids[neighbor])
+            relations.append(data.get('relation'))
+            weights.append(data.get('weight'))
+            confidences.append(data.get('confidence'))
+        indptr[i + 1] = len(indices)
+
+    node_types, type_vocabulary = _intern([data.get('type') for data in node_data])
+    entity_types, entity_type_vocabulary = _intern([data.get('entity_type') for data in node_data])
+    edge_relations, relation_vocabulary = _intern(relations)
+    arrays = {
+        'indptr': indptr,
+        'indices': np.array(indices, dtype=np.int32),
+        'node_type': node_types.astype(np.int16),
+        'entity_type': entity_types,
+        'node_confidence': _optional_floats([data.get('confidence') for data in node_data]),
+        'has_text': np.array(['text' in data for data in node_data], dtype=bool),
+        'edge_relation': edge_relations.astype(np.int16),
+        'edge_weight': _optional_floats(weights),
+        'edge_confidence': _optional_floats(confidences),
+    }
+    digest = hashlib.blake2b(digest_size=16)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_dir, f"{name}.npy"), array)
+        digest.update(name.encode('utf-8'))
+        digest.update(array.tobytes())
+    _write_texts(tmp_dir, 'names', [str(node) for node in nodes], digest)
+    _write_texts(tmp_dir, 'texts', [data.get('text') for data in node_data], digest)
+
+    meta = {
+        'version': STORE_VERSION,
+        'directed': G.is_directed(),
+        'number_of_nodes': len(nodes),
+        'number_of_edges': G.number_of_edges(),
+        'node_types': type_vocabulary,
+        'entity_types': entity_type_vocabulary,
+        'relations': relation_vocabulary,
+        # Node names that are not strings (never produced by create_graph) keep their JSON form
+        'non_string_names': {str(i): node for i, node in enumerate(nodes) if not isinstance(node, str)},
+        'extra_node_attrs': extra_node_attrs,
+        'extra_edge_attrs': extra_edge_attrs,
+    }
+    digest.update(json.dumps(meta, sort_keys=True).encode('utf-8'))
+    meta['fingerprint'] = digest.hexdigest()
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+
+    old_dir = f"{store_dir}.old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(store_dir):
+        os.replace(store_dir, old_dir)
+    os.replace(tmp_dir, store_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    logging.info(success(f"Saved compact knowledge graph with {len(nodes)} nodes and {G.number_of_edges()} edges to {store_dir}"))
+    return meta['fingerprint']
+
+class _NodeView:
+    """The parts of networkx's G.nodes used by the search code: iteration, len, G.nodes[n] and G.nodes(data=True)."""
+
+    def __init__(self, graph: "CompactGraph"):
+        self._graph = graph
+
+    def __call__(self, data: bool = False):
+        return _NodeDataView(self._graph) if data else self
+
+    def __len__(self) -> int:
+        return self._graph.number_of_nodes()
+
+    def __iter__(self) -> Iterator[Any]:
+        return (self._graph.node_name(i) for i in range(len(self)))
+
+    def __contains__(self, node) -> bool:
+        return self._graph.has_node(node)
+
+    def __getitem__(self, node) -> Dict[str, Any]:
+        return self._graph.node_attributes(self._graph.node_id(node))
+
+class _NodeDataView:
+    def __init__(self, graph: "CompactGraph"):
+        self._graph = graph
+
+    def __len__(self) -> int:
+        return self._graph.number_of_nodes()
+
+    def __iter__(self) -> Iterator[Tuple[Any, Dict[str, Any]]]:
+        return ((self._graph.node_name(i), self._graph.node_attributes(i)) for i in range(len(self)))
+
+class CompactGraph:
+    """
+    Read-only knowledge graph loaded from the compact store.
+
+    Arrays are memory-mapped and node texts are only read when a node's attributes are
+    requested, so opening costs the same whatever the amount of text. It supports the
+    networkx calls the search code makes (nodes, neighbors, has_node, edge data and
+    counts); call to_networkx() for anything else.
+    """
+
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        load = lambda name: np.load(os.path.join(store_dir, f"{name}.npy"), mmap_mode='r')
+        self.indptr = load('indptr')
+        self.indices = load('indices')
+        self.node_type = load('node_type')
+        self.entity_type = load('entity_type')
+        self.node_confidence = load('node_confidence')
+        self.has_text = load('has_text')
+        self.edge_relation = load('edge_relation')
+        self.edge_weight = load('edge_weight')
+        self.edge_confidence = load('edge_confidence')
+        self.names = TextStore(os.path.join(store_dir, 'names.bin'), load('names_offsets'))
+        self.texts = TextStore(os.path.join(store_dir, 'texts.bin'), load('texts_offsets'))
+        self._name_ids: Optional[Dict[Any, int]] = None
+        self.nodes = _NodeView(self)
+
+    def is_directed(self) -> bool:
+        return self.meta['directed']
+
+    def number_of_nodes(self) -> int:
+        return self.meta['number_of_nodes']
+
+    def number_of_edges(self) -> int:
+        return self.meta['number_of_edges']
+
+    @property
+    def fingerprint(self) -> Optional[str]:
+        return self.meta.get('fingerprint')
+
+    def __len__(self) -> int:
+        return self.number_of_nodes()
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self.nodes)
+
+    def __contains__(self, node) -> bool:
+        return self.has_node(node)
+
+    def node_name(self, node_id: int):
+        non_string = self.meta['non_string_names'].get(str(node_id))
+        if non_string is None:
+            return self.names[node_id]
+        return tuple(non_string) if isinstance(non_string, list) else non_string
+
+    def node_id(self, node) -> int:
+        if self._name_ids is None:
+            # Built on first lookup; names are short, unlike the node texts
+            self._name_ids = {self.node_name(i): i for i in range(self.number_of_nodes())}
+        try:
+            return self._name_ids[node]
+        except (KeyError, TypeError):
+            raise KeyError(node)
+
+    def has_node(self, node) -> bool:
+        try:
+            self.node_id(node)
+            return True
+        except KeyError:
+            return False
+
+    def node_attributes(self, node_id: int) -> Dict[str, Any]:
+        attributes: Dict[str, Any] = {}
+        if self.node_type[node_id] >= 0:
+            attributes['type'] = self.meta['node_types'][self.node_type[node_id]]
+        if self.has_text[node_id]:
+            attributes['text'] = self.texts[node_id]
+        if self.entity_type[node_id] >= 0:
+            attributes['entity_type'] = self.meta['entity_types'][self.entity_type[node_id]]
+        if not np.isnan(self.node_confidence[node_id]):
+            attributes['confidence'] = float(self.node_confidence[node_id])
+        attributes.update(self.meta['extra_node_attrs'].get(str(node_id), {}))
+        return attributes
+
+    def _edge_attributes(self, position: int) -> Dict[str, Any]:
+        attributes: Dict[str, Any] = {}
+        if self.edge_relation[position] >= 0:
+            attributes['relation'] = self.meta['relations'][self.edge_relation[position]]
+        if not np.isnan(self.edge_weight[position]):
+            attributes['weight'] = float(self.edge_weight[position])
+        if not np.isnan(self.edge_confidence[position]):
+            attributes['confidence'] = float(self.edge_confidence[position])
+        attributes.update(self.meta['extra_edge_attrs'].get(str(position), {}))
+        return attributes
+
+    def neighbor_ids(self, node_id: int) -> np.ndarray:
+        return self.indices[self.indptr[node_id]:self.indptr[node_id + 1]]
+
+    def neighbors(self, node) -> Iterator[Any]:
+        return (self.node_name(int(i)) for i in self.neighbor_ids(self.node_id(node)))
+
+    def degree(self, node) -> int:
+        node_id = self.node_id(node)
+        return int(self.indptr[node_id + 1] - self.indptr[node_id])
+
+    def get_edge_data(self, u, v, default=None) -> Optional[Dict[str, Any]]:
+        u_id, v_id = self.node_id(u), self.node_id(v)
+        start = int(self.indptr[u_id])
+        hits = np.flatnonzero(self.neighbor_ids(u_id) == v_id)
+        return self._edge_attributes(start + int(hits[0])) if len(hits) else default
+
+    def has_edge(self, u, v) -> bool:
+        return self.has_node(u) and self.has_node(v) and self.get_edge_data(u, v) is not None
+
+    def to_networkx(self) -> nx.Graph:
+        G = nx.DiGraph() if self.is_directed() else nx.Graph()
+        for node_id in range(self.number_of_nodes()):
+            G.add_node(self.node_name(node_id), **self.node_attributes(node_id))
+        for node_id in range(self.number_of_nodes()):
+            name = self.node_name(node_id)
+            start = int(self.indptr[node_id])
+            for offset, neighbor_id in enumerate(self.neighbor_ids(node_id)):
+                G.add_edge(name, self.node_name(int(neighbor_id)), **self._edge_attributes(start + offset))
+        return G
+
+def load_graph(graph_file_path: Optional[str] = None) -> Optional[Union[CompactGraph, nx.Graph]]:
+    """
+    Open the compact graph for `graph_file_path`. A node-link JSON graph from older
+    versions is converted on first use. Returns None if neither exists.
+    """
+    graph_file_path = os.path.join(settings.output_folder, os.path.basename(graph_file_path or settings.knowledge_graph_file_path))
+    store_dir = get_graph_store_dir(graph_file_path)
+    if os.path.exists(os.path.join(store_dir, 'meta.json')):
+        with open(os.path.join(store_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            version = json.load(f).get('version')
+        if version == STORE_VERSION:
+            return CompactGraph(store_dir)
+        logging.warning(warning(f"Unsupported graph store version {version} in {store_dir}"))
+
+    if not os.path.exists(graph_file_path):
+        return None
+    logging.info(info(f"Converting node-link JSON graph {graph_file_path} to the compact format"))
+    with open(graph_file_path, 'r', encoding='utf-8') as f:
+        G = nx.node_link_graph(json.load(f))
+    save_graph(G, graph_file_path)
+    return CompactGraph(store_dir)
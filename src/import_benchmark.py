@@ -0,0 +1,77 @@
+# Standard library imports
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Local imports
+from src.look_and_feel import error, info, success, warning
+
+# Modules timed by default: the GUI entry point and the modules behind the most used features
+DEFAULT_MODULES = ["main", "src.api_model", "src.search_utils", "src.create_graph", "src.talk2doc", "src.ingest_cli"]
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Lines written by `python -X importtime`: "import time: self [us] | cumulative | imported package"
+_IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S.*)$')
+
+def time_import(module: str) -> Tuple[float, List[Tuple[str, float]]]:
+    """
+    Import `module` in a fresh interpreter, so nothing is already cached in sys.modules.
+    Returns the wall-clock seconds of the whole run and the cumulative seconds spent in each
+    other top-level package it pulled in (torch, spacy, ...), slowest first.
+    """
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=PROJECT_ROOT, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"import {module} failed")
+
+    own_package = module.split('.')[0]
+    packages: Dict[str, float] = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORT_TIME_LINE.match(line)
+        if not match:
+            continue
+        package = match.group(3).strip().split('.')[0]
+        if package != own_package:
+            # The outermost import of a package has the largest cumulative time
+            packages[package] = max(packages.get(package, 0.0), int(match.group(2)) / 1e6)
+    return elapsed, sorted(packages.items(), key=lambda item: item[1], reverse=True)
+
+def run_benchmark(modules: List[str], top: int = 10, repeat: int = 3) -> Dict[str, float]:
+    """Best-of-`repeat` cold import time for each module, printing the slowest packages it pulls in."""
+    results = {}
+    for module in modules:
+        try:
+            runs = [time_import(module) for _ in range(repeat)]
+        except RuntimeError as e:
+            print(error(f"{module}: {str(e)}"))
+            continue
+        elapsed, packages = min(runs, key=lambda run: run[0])
+        results[module] = elapsed
+        print(success(f"{module}: {elapsed:.2f}s cold start (best of {repeat})"))
+        for name, seconds in packages[:top]:
+            print(info(f"    {seconds:7.3f}s  {name}"))
+    return results
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure cold import time of ERAG modules.")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES, help="Modules to import (default: %(default)s)")
+    parser.add_argument("--top", type=int, default=10, help="Slowest packages to list per module")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters per module; the fastest run is reported")
+    parser.add_argument("--budget", type=float, default=None, help="Exit non-zero if any module takes longer than this many seconds")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.modules, args.top, args.repeat)
+    over_budget = [module for module, seconds in results.items() if args.budget is not None and seconds > args.budget]
+    for module in over_budget:
+        print(warning(f"{module} exceeds the {args.budget:.2f}s import budget"))
+    return 1 if over_budget or len(results) < len(args.modules) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
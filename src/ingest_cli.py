@@ -0,0 +1,142 @@
+# Standard library imports
+import argparse
+import glob
+import logging
+import os
+import sys
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Local imports
+from src.file_processing import FileProcessor
+from src.look_and_feel import error, info, success, warning
+from src.settings import settings
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# File types understood by FileProcessor, by extension
+FILE_TYPES: Dict[str, str] = {
+    ".docx": "DOCX",
+    ".pdf": "PDF",
+    ".txt": "Text",
+    ".json": "JSON"
+}
+
+def collect_files(paths: Iterable[str]) -> List[Tuple[str, str]]:
+    """
+    Expand files, directories (searched recursively) and glob patterns into (file type, path)
+    pairs in a stable order, skipping unsupported extensions and duplicates.
+    """
+    files = []
+    seen = set()
+
+    def add(path: str):
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                for name in sorted(names):
+                    add(os.path.join(root, name))
+            return
+        file_type = FILE_TYPES.get(os.path.splitext(path)[1].lower())
+        key = os.path.abspath(path)
+        if file_type and key not in seen and os.path.isfile(path):
+            seen.add(key)
+            files.append((file_type, path))
+
+    for path in paths:
+        if glob.has_magic(path):
+            matches = sorted(glob.glob(path, recursive=True))
+            if not matches:
+                print(warning(f"No files match {path}"))
+            for match in matches:
+                add(match)
+        elif os.path.exists(path):
+            add(path)
+        else:
+            print(warning(f"{path} does not exist"))
+    return files
+
+def build_embeddings():
+    """Embed db.txt the same way the GUI's Execute Embeddings button does."""
+    from src.api_model import create_erag_api
+    from src.embeddings_utils import load_or_compute_embeddings
+    from src.model_registry import get_sentence_transformer
+
+    if settings.default_embedding_class == "ollama":
+        model = create_erag_api(settings.api_type, embedding_class=settings.default_embedding_class, embedding_model=settings.default_embedding_model)
+    else:
+        model = get_sentence_transformer(settings.default_embedding_model)
+    embeddings, _, _ = load_or_compute_embeddings(model, settings.db_file_path, settings.embeddings_file_path,
+                                                  settings.default_embedding_model)
+    return embeddings
+
+def build_graph():
+    """Create the knowledge graph the same way the GUI's Create Knowledge Graph button does."""
+    from src.create_graph import create_knowledge_graph
+
+    return create_knowledge_graph()
+
+def ingest(paths: Iterable[str], workers: Optional[int] = None, embeddings: bool = True, graph: bool = True) -> Dict[str, float]:
+    """
+    Ingest files, directories or glob patterns into db.txt and db_content.txt, then update
+    the embeddings and knowledge graph. Returns throughput statistics for the run.
+    """
+    if workers is not None:
+        settings.ingest_workers = workers
+
+    files = collect_files(paths)
+    stats = {"files": 0, "failed_files": 0, "chunks": 0, "seconds": 0.0, "files_per_sec": 0.0, "chunks_per_sec": 0.0}
+    if not files:
+        print(warning("No DOCX, PDF, Text or JSON files found to ingest."))
+        return stats
+
+    print(info(f"Ingesting {len(files)} files..."))
+    processor = FileProcessor()
+    processor.total_files = len(files)
+    started = time.perf_counter()
+    ingested_files, chunks = processor.ingest_files(files)
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    stats.update(files=ingested_files, failed_files=len(files) - ingested_files, chunks=chunks, seconds=elapsed,
+                 files_per_sec=ingested_files / elapsed, chunks_per_sec=chunks / elapsed)
+    print(success(f"Ingested {ingested_files}/{len(files)} files and {chunks} chunks in {elapsed:.1f}s "
+                  f"({stats['files_per_sec']:.2f} files/sec, {stats['chunks_per_sec']:.1f} chunks/sec)"))
+
+    if not chunks:
+        return stats
+    if embeddings:
+        db_embeddings = build_embeddings()
+        print(success(f"Embeddings saved with shape {db_embeddings.shape}"))
+        if graph:
+            knowledge_graph = build_graph()
+            if knowledge_graph is None:
+                print(error("Failed to create knowledge graph."))
+            else:
+                print(success(f"Knowledge graph created with {knowledge_graph.number_of_nodes()} nodes and {knowledge_graph.number_of_edges()} edges"))
+    elif graph:
+        print(warning("Skipping the knowledge graph, it is built from the embeddings"))
+    return stats
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Ingest documents into ERAG without the GUI.")
+    parser.add_argument("paths", nargs="+", help="Files, directories (searched recursively) or glob patterns such as 'docs/**/*.pdf'")
+    parser.add_argument("--workers", type=int, default=None, help="Processes extracting and chunking files (0 = one per CPU core, default from settings)")
+    parser.add_argument("--no-embeddings", action="store_true", help="Only append to db.txt and db_content.txt")
+    parser.add_argument("--no-graph", action="store_true", help="Do not rebuild the knowledge graph")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    # Same configuration the GUI uses: saved settings and API keys from .env
+    from dotenv import load_dotenv
+    load_dotenv()
+    settings.load_settings()
+    try:
+        stats = ingest(args.paths, workers=args.workers, embeddings=not args.no_embeddings, graph=not args.no_graph)
+    except Exception as e:
+        print(error(f"Ingestion failed: {str(e)}"))
+        return 1
+    return 0 if stats["files"] and not stats["failed_files"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+# Standard library imports
+import hashlib
+import heapq
+import logging
+import math
+import os
+import pickle
+import re
+import threading
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Local imports
+from src.look_and_feel import info, success, warning
+from src.settings import settings
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+TOKEN_PATTERN = re.compile(r'\w+')
+INDEX_VERSION = 1
+_DIGEST_WINDOW = 4096
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+def _file_digest(file_path: str, end: int) -> str:
+    """Hash the bytes just before `end` so an index can tell whether db.txt was rewritten."""
+    with open(file_path, 'rb') as f:
+        f.seek(max(0, end - _DIGEST_WINDOW))
+        return hashlib.sha1(f.read(min(end, _DIGEST_WINDOW))).hexdigest()
+
+class InvertedIndex:
+    """
+    Term -> postings index over the lines of db.txt with BM25 scoring.
+
+    Postings are stored as parallel arrays of document ids and term frequencies.
+    Document ids are line numbers, so they only ever grow and new chunks can be
+    appended without touching existing postings. `lock` is held while scoring, syncing
+    and saving, since one index is shared by everything in the process that reads db.txt.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._clear()
+
+    def _clear(self):
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        self.doc_lengths = array('I')
+        self.total_length = 0
+        # How much of the source file has been indexed, for incremental updates
+        self.source_size = 0
+        self.source_digest = ""
+        self.unsaved_changes = False
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def add_document(self, text: str) -> int:
+        with self.lock:
+            return self._add_document(text)
+
+    def _add_document(self, text: str) -> int:
+        doc_id = len(self.doc_lengths)
+        term_counts = Counter(tokenize(text))
+        for term, tf in term_counts.items():
+            entry = self.postings.get(term)
+            if entry is None:
+                entry = self.postings[term] = (array('I'), array('I'))
+            entry[0].append(doc_id)
+            entry[1].append(tf)
+        length = sum(term_counts.values())
+        self.doc_lengths.append(length)
+        self.total_length += length
+        return doc_id
+
+    def add_documents(self, texts: Iterable[str]):
+        with self.lock:
+            for text in texts:
+                self._add_document(text)
+
+    def _score(self, query: str) -> Tuple[Dict[int, float], Dict[int, int]]:
+        """BM25 scores and number of distinct matched query terms, for documents matching any term."""
+        with self.lock:
+            return self._score_unlocked(query)
+
+    def _score_unlocked(self, query: str) -> Tuple[Dict[int, float], Dict[int, int]]:
+        scores: Dict[int, float] = {}
+        matches: Dict[int, int] = {}
+        num_docs = len(self.doc_lengths)
+        if num_docs == 0:
+            return scores, matches
+
+        k1, b = settings.bm25_k1, settings.bm25_b
+        avg_length = self.total_length / num_docs or 1.0
+        doc_lengths = self.doc_lengths
+        for term in set(tokenize(query)):
+            entry = self.postings.get(term)
+            if entry is None:
+                continue
+            doc_ids, tfs = entry
+            idf = math.log(1 + (num_docs - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+            for doc_id, tf in zip(doc_ids, tfs):
+                norm = k1 * (1 - b + b * doc_lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+                matches[doc_id] = matches.get(doc_id, 0) + 1
+        return scores, matches
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """Top-k documents by BM25 score."""
+        scores, _ = self._score(query)
+        return heapq.nlargest(k, scores.items(), key=lambda item: (item[1], -item[0]))
+
+    def match(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """Top-k documents containing the most distinct query terms, ties broken by BM25."""
+        scores, matches = self._score(query)
+        top = heapq.nlargest(k, matches, key=lambda doc_id: (matches[doc_id], scores[doc_id], -doc_id))
+        return [(doc_id, scores[doc_id]) for doc_id in top]
+
+    def sync_with_file(self, file_path: str) -> bool:
+        """
+        Index lines appended to `file_path` since the last sync. Starts over if the file was
+        truncated or rewritten. Returns True if the index changed.
+        """
+        with self.lock:
+            return self._sync_with_file(file_path)
+
+    def _sync_with_file(self, file_path: str) -> bool:
+        if not os.path.exists(file_path):
+            return False
+
+        size = os.path.getsize(file_path)
+        if size == self.source_size and size and _file_digest(file_path, size) == self.source_digest:
+            return False
+        if size < self.source_size or (self.source_size and _file_digest(file_path, self.source_size) != self.source_digest):
+            logging.info(info(f"{file_path} was rewritten, rebuilding the inverted index"))
+            self._clear()
+
+        added = 0
+        with open(file_path, 'rb') as f:
+            f.seek(self.source_size)
+            for raw_line in f:
+                if not raw_line.endswith(b'\n'):
+                    # Wait until the writer finishes the line
+                    break
+                self._add_document(raw_line.decode('utf-8', errors='replace'))
+                self.source_size += len(raw_line)
+                added += 1
+
+        self.source_digest = _file_digest(file_path, self.source_size)
+        if added:
+            self.unsaved_changes = True
+            logging.info(info(f"Indexed {added} new chunks from {file_path} ({len(self)} total)"))
+        return added > 0
+
+    def save(self, index_path: str):
+        with self.lock:
+            self._save(index_path)
+
+    def _save(self, index_path: str):
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        data = {
+            'version': INDEX_VERSION,
+            'postings': self.postings,
+            'doc_lengths': self.doc_lengths,
+            'total_length': self.total_length,
+            'source_size': self.source_size,
+            'source_digest': self.source_digest,
+        }
+        tmp_path = f"{index_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, index_path)
+        self.unsaved_changes = False
+
+    @classmethod
+    def load(cls, index_path: str) -> Optional["InvertedIndex"]:
+        if not os.path.exists(index_path):
+            return None
+        try:
+            with open(index_path, 'rb') as f:
+                data = pickle.load(f)
+            if data.get('version') != INDEX_VERSION:
+                return None
+            index = cls()
+            index.postings = data['postings']
+            index.doc_lengths = data['doc_lengths']
+            index.total_length = data['total_length']
+            index.source_size = data['source_size']
+            index.source_digest = data['source_digest']
+            return index
+        except Exception as e:
+            logging.warning(warning(f"Failed to load inverted index {index_path}: {str(e)}"))
+            return None
+
+# Indexes already loaded in this process, so repeated appends only read the new lines
+_loaded_indexes: Dict[str, InvertedIndex] = {}
+_loaded_indexes_lock = threading.Lock()
+
+def load_or_build_inverted_index(db_file_path: str, index_path: Optional[str] = None, save: bool = True) -> InvertedIndex:
+    """Load the persisted index for db.txt, index any lines appended since, and optionally save it back."""
+    index_path = index_path or settings.inverted_index_file_path
+    with _loaded_indexes_lock:
+        index = _loaded_indexes.get(index_path)
+        if index is None:
+            index = _loaded_indexes[index_path] = InvertedIndex.load(index_path) or InvertedIndex()
+        # Queries score under the same lock, so they never see a half-applied sync
+        with index.lock:
+            index.sync_with_file(db_file_path)
+            if save and index.unsaved_changes:
+                index.save(index_path)
+                logging.info(success(f"Inverted index with {len(index)} chunks saved to {index_path}"))
+    return index
+
+def build_inverted_index(documents: Iterable[str]) -> InvertedIndex:
+    index = InvertedIndex()
+    index.add_documents(documents)
+    return index
@@ -3,6 +3,7 @@ import os
 from datetime import datetime
 from typing import List, Dict
 import logging
+import time
 from src.api_model import EragAPI, create_erag_api
 from src.settings import settings
 from src.look_and_feel import error, success, info, llm_response, user_input
@@ -19,11 +20,23 @@ class MixAgents:
         os.makedirs(self.output_folder, exist_ok=True)
         self.session_log = []
         self.session_file = None
+        # One loop for the whole session, so the async clients and their connections are reused across prompts
+        self.loop = asyncio.new_event_loop()
         logging.info(f"MixAgents initialized. Output folder: {self.output_folder}")
 
+    def close(self):
+        """Close the pooled async clients, then the event loop."""
+        if self.loop.is_closed():
+            return
+        from src.async_api import aclose_clients
+        try:
+            self.loop.run_until_complete(aclose_clients())
+        finally:
+            self.loop.close()
+
     async def run_llm(self, erag_api: EragAPI, messages: List[Dict[str, str]]):
         """Run a single LLM call with a given EragAPI instance."""
-        response = erag_api.chat(messages, temperature=settings.temperature)
+        response = await erag_api.achat(messages, temperature=settings.temperature)
         return erag_api.model, response
 
     async def get_responses(self, user_prompt: str):
@@ -39,7 +52,10 @@ class MixAgents:
         if self.manager_erag_api:
             tasks.append(self.run_llm(self.manager_erag_api, messages))
         
+        # The calls overlap, so this takes as long as the slowest model rather than all of them
+        started = time.perf_counter()
         results = await asyncio.gather(*tasks)
+        logging.info(f"Got {len(results)} model responses in {time.perf_counter() - started:.2f}s")
         return results
 
     def aggregate_responses(self, user_prompt: str, responses: List[tuple]):
@@ -81,6 +97,12 @@ class MixAgents:
             logging.error(f"Error saving interaction to file: {str(e)}")
 
     def run(self):
+        try:
+            self.chat_loop()
+        finally:
+            self.close()
+
+    def chat_loop(self):
         print(info("Starting MixAgents. Type 'exit' to end the conversation."))
         while True:
             user_prompt = input(user_input("You: "))
@@ -89,7 +111,7 @@ class MixAgents:
                 break
             
             try:
-                responses = asyncio.run(self.get_responses(user_prompt))
+                responses = self.loop.run_until_complete(self.get_responses(user_prompt))
                 for model, response in responses:
                     print(info(f"{model} response: {response}"))
                 
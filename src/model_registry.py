@@ -0,0 +1,176 @@
+# Standard library imports
+import logging
+import os
+import threading
+import time
+import weakref
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+# Local imports
+from src.look_and_feel import info, success
+from src.settings import settings
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+class _Entry:
+    __slots__ = ('kind', 'key', 'version', 'resource', 'refcount', 'last_used', '__weakref__')
+
+    def __init__(self, kind: str, key: Hashable, version: Hashable, resource: Any):
+        self.kind = kind
+        self.key = key
+        self.version = version
+        self.resource = resource
+        self.refcount = 0
+        self.last_used = time.monotonic()
+
+class ModelRegistry:
+    """
+    Process-wide cache of expensive resources (SentenceTransformer and spaCy models,
+    opened embedding stores and knowledge graphs), keyed by (kind, key).
+
+    Each resource is loaded once and shared. Objects that pass themselves as `owner` hold
+    a reference that is released when they are garbage collected. Once nothing holds a
+    resource and it has been idle for `settings.model_idle_timeout` seconds, it is evicted
+    (0 keeps everything loaded for the life of the process). A resource acquired with a
+    different `version` than the cached one (e.g. a file that changed on disk) is reloaded.
+    """
+
+    def __init__(self):
+        self._entries: Dict[Tuple[str, Hashable], _Entry] = {}
+        self._lock = threading.Lock()
+        self._load_locks: Dict[Tuple[str, Hashable], threading.Lock] = {}
+        self._sweeper: Optional[threading.Thread] = None
+
+    def acquire(self, kind: str, key: Hashable, loader: Callable[[], Any], owner: Any = None, version: Hashable = None) -> Any:
+        """The cached resource for (kind, key), calling `loader` if it is missing or stale."""
+        self.evict_idle()
+        entry = self._get(kind, key, version)
+        if entry is None:
+            with self._lock:
+                load_lock = self._load_locks.setdefault((kind, key), threading.Lock())
+            # Concurrent requests for the same resource wait for one load instead of loading it twice
+            with load_lock:
+                entry = self._get(kind, key, version)
+                if entry is None:
+                    started = time.perf_counter()
+                    entry = _Entry(kind, key, version, loader())
+                    with self._lock:
+                        self._entries[(kind, key)] = entry
+                    logging.info(info(f"Loaded {kind} {key} in {time.perf_counter() - started:.2f}s"))
+
+        with self._lock:
+            entry.last_used = time.monotonic()
+            if owner is not None:
+                entry.refcount += 1
+        if owner is not None:
+            weakref.finalize(owner, self._release, weakref.ref(entry))
+        self._start_sweeper()
+        return entry.resource
+
+    def _get(self, kind: str, key: Hashable, version: Hashable) -> Optional[_Entry]:
+        with self._lock:
+            entry = self._entries.get((kind, key))
+            return entry if entry is not None and entry.version == version else None
+
+    def _release(self, entry_ref: 'weakref.ref[_Entry]'):
+        entry = entry_ref()
+        if entry is None:
+            return
+        with self._lock:
+            entry.refcount = max(entry.refcount - 1, 0)
+            entry.last_used = time.monotonic()
+
+    def evict_idle(self, max_idle: Optional[float] = None) -> int:
+        """Drop resources nothing holds that have been idle for `max_idle` seconds (default from settings)."""
+        max_idle = settings.model_idle_timeout if max_idle is None else max_idle
+        if max_idle <= 0:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            idle = [name for name, entry in self._entries.items() if entry.refcount == 0 and now - entry.last_used >= max_idle]
+            for name in idle:
+                del self._entries[name]
+        for kind, key in idle:
+            logging.info(info(f"Evicted idle {kind} {key}"))
+        return len(idle)
+
+    def _start_sweeper(self):
+        with self._lock:
+            if settings.model_idle_timeout <= 0 or (self._sweeper is not None and self._sweeper.is_alive()):
+                return
+            self._sweeper = threading.Thread(target=self._sweep, daemon=True)
+            self._sweeper.start()
+
+    def _sweep(self):
+        # Evicts resources that go idle while nothing is being acquired; exits when eviction is turned off
+        while settings.model_idle_timeout > 0:
+            time.sleep(min(settings.model_idle_timeout, 60))
+            self.evict_idle()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        logging.info(success("Model registry cleared"))
+
+    def stats(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            return [{"kind": entry.kind, "key": entry.key, "version": entry.version, "refcount": entry.refcount,
+                     "idle_seconds": now - entry.last_used} for entry in self._entries.values()]
+
+# The registry shared by every component in the process
+registry = ModelRegistry()
+
+def file_version(paths: Sequence[str]) -> Optional[Tuple[int, int]]:
+    """Modification time and size of the first existing path, so rewritten files are reloaded."""
+    for path in paths:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            return stat.st_mtime_ns, stat.st_size
+    return None
+
+def get_sentence_transformer(model_name: Optional[str] = None, owner: Any = None):
+    model_name = model_name or settings.sentence_transformer_model
+
+    def load():
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+
+    return registry.acquire("sentence_transformer", model_name, load, owner)
+
+def get_cross_encoder(model_name: Optional[str] = None, owner: Any = None):
+    model_name = model_name or settings.cross_encoder_model
+
+    def load():
+        from sentence_transformers import CrossEncoder
+        return CrossEncoder(model_name, device="cpu")
+
+    return registry.acquire("cross_encoder", model_name, load, owner)
+
+def get_spacy_model(model_name: Optional[str] = None, owner: Any = None):
+    model_name = model_name or settings.nlp_model
+
+    def load():
+        import spacy
+        return spacy.load(model_name)
+
+    return registry.acquire("spacy", model_name, load, owner)
+
+def get_embeddings(embeddings_file_path: Optional[str] = None, owner: Any = None):
+    """(embeddings, indexes, content) from load_embeddings_and_data, shared until the store changes."""
+    from src.embedding_store import get_store_paths
+    from src.embeddings_utils import load_embeddings_and_data
+
+    embeddings_file_path = embeddings_file_path or settings.embeddings_file_path
+    paths = get_store_paths(embeddings_file_path)
+    version = file_version([paths['manifest'], paths['legacy']])
+    return registry.acquire("embeddings", paths['base'], lambda: load_embeddings_and_data(embeddings_file_path), owner, version)
+
+def get_knowledge_graph(graph_file_path: Optional[str] = None, owner: Any = None):
+    """The knowledge graph from load_graph (None if there is none), shared until it is rebuilt."""
+    from src.graph_store import get_graph_store_dir, load_graph
+
+    graph_file_path = os.path.join(settings.output_folder, os.path.basename(graph_file_path or settings.knowledge_graph_file_path))
+    version = file_version([os.path.join(get_graph_store_dir(graph_file_path), 'meta.json'), graph_file_path])
+    return registry.acquire("knowledge_graph", graph_file_path, lambda: load_graph(graph_file_path), owner, version)
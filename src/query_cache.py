@@ -0,0 +1,143 @@
+# Standard library imports
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Sequence, Tuple
+
+# Third-party imports
+import numpy as np
+
+# Local imports
+from src.look_and_feel import info
+from src.settings import settings
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+_WHITESPACE = re.compile(r'\s+')
+_TRAILING_PUNCTUATION = re.compile(r'[\s?!.]+$')
+
+def normalize_query(query: str) -> str:
+    return _TRAILING_PUNCTUATION.sub('', _WHITESPACE.sub(' ', query.strip().lower()))
+
+def context_fingerprint(conversation_context: Sequence[str], *scope: Any) -> str:
+    """Hash of the conversation context and anything else the answer depends on (e.g. the model)."""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in list(scope) + list(conversation_context):
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+class _CachedResponse:
+    __slots__ = ('query', 'fingerprint', 'vector', 'response', 'created')
+
+    def __init__(self, query: str, fingerprint: str, vector: Optional[np.ndarray], response: str):
+        self.query = query
+        self.fingerprint = fingerprint
+        self.vector = vector
+        self.response = response
+        self.created = time.monotonic()
+
+class QueryCache:
+    """
+    Two-level cache of RAG answers.
+
+    Level one matches the normalized query exactly; level two matches a cached query whose
+    embedding has cosine similarity of at least `settings.query_cache_similarity` (1 turns it
+    off). Both only match entries with the same context fingerprint. Entries expire after
+    `settings.query_cache_ttl` seconds, the least recently used ones are dropped beyond
+    `settings.query_cache_size`, and everything is dropped when the data version changes.
+    """
+
+    def __init__(self):
+        self._entries: "OrderedDict[Tuple[str, str], _CachedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._version: Hashable = None
+        self.metrics: Dict[str, int] = {"exact_hits": 0, "semantic_hits": 0, "misses": 0,
+                                        "expired": 0, "evicted": 0, "invalidations": 0}
+
+    def _check_version(self, version: Hashable):
+        if version != self._version:
+            if self._entries:
+                self.metrics["invalidations"] += 1
+                logging.info(info(f"Query cache cleared, the data changed ({len(self._entries)} answers dropped)"))
+            self._entries.clear()
+            self._version = version
+
+    def _expire(self):
+        ttl = settings.query_cache_ttl
+        if ttl <= 0:
+            return
+        now = time.monotonic()
+        expired = [key for key, entry in self._entries.items() if now - entry.created > ttl]
+        for key in expired:
+            del self._entries[key]
+        self.metrics["expired"] += len(expired)
+
+    def lookup(self, query: str, fingerprint: str, version: Hashable = None,
+               embed: Optional[Callable[[str], np.ndarray]] = None) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """
+        The cached answer (or None) and the query's normalized embedding when one had to be
+        computed for the semantic level, so that store() does not compute it again.
+        """
+        normalized = normalize_query(query)
+        with self._lock:
+            self._check_version(version)
+            self._expire()
+            entry = self._entries.get((normalized, fingerprint))
+            if entry is not None:
+                self._entries.move_to_end((normalized, fingerprint))
+                self.metrics["exact_hits"] += 1
+                return entry.response, None
+            candidates = [(key, entry) for key, entry in self._entries.items()
+                          if entry.fingerprint == fingerprint and entry.vector is not None]
+
+        vector = None
+        if embed is not None and settings.query_cache_similarity < 1:
+            vector = embed(normalized)
+            vector = vector / max(float(np.linalg.norm(vector)), 1e-12)
+            if candidates:
+                similarities = np.stack([entry.vector for _, entry in candidates]) @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= settings.query_cache_similarity:
+                    key, entry = candidates[best]
+                    with self._lock:
+                        if key in self._entries:
+                            self._entries.move_to_end(key)
+                        self.metrics["semantic_hits"] += 1
+                    logging.info(info(f"Answering from the cache entry for '{entry.query}' (similarity {similarities[best]:.3f})"))
+                    return entry.response, vector
+
+        with self._lock:
+            self.metrics["misses"] += 1
+        return None, vector
+
+    def store(self, query: str, fingerprint: str, response: str, vector: Optional[np.ndarray] = None, version: Hashable = None):
+        if settings.query_cache_size <= 0:
+            return
+        normalized = normalize_query(query)
+        if vector is not None:
+            vector = vector / max(float(np.linalg.norm(vector)), 1e-12)
+        with self._lock:
+            self._check_version(version)
+            self._entries[(normalized, fingerprint)] = _CachedResponse(normalized, fingerprint, vector, response)
+            self._entries.move_to_end((normalized, fingerprint))
+            while len(self._entries) > settings.query_cache_size:
+                self._entries.popitem(last=False)
+                self.metrics["evicted"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.metrics["exact_hits"] + self.metrics["semantic_hits"] + self.metrics["misses"]
+            hits = lookups - self.metrics["misses"]
+            return {**self.metrics, "entries": len(self._entries), "hit_rate": hits / lookups if lookups else 0.0}
+
+# Shared by every RAGSystem in the process, so answers survive across Talk2Doc sessions
+query_cache = QueryCache()
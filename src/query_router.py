@@ -0,0 +1,140 @@
+# Standard library imports
+import hashlib
+import logging
+import os
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+# Third-party imports
+import numpy as np
+
+# Local imports
+from src.look_and_feel import warning
+from src.settings import settings
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {
+    "the", "and", "for", "are", "was", "what", "who", "how", "why", "when", "where", "which", "does", "did",
+    "can", "could", "would", "should", "about", "tell", "with", "from", "that", "this", "these", "those",
+    "there", "their", "they", "you", "your", "into", "have", "has", "had", "been", "its", "not", "any", "all",
+    "please", "give", "explain", "describe", "some", "more", "much", "many", "between", "than", "then"
+}
+# Queries asking for breadth or analysis go to the iterative components (create_knol, web_sum)
+_DEEP_QUERY = re.compile(r"\b(in detail|in depth|in-depth|comprehensive|thorough|compare|comparison|contrast|analy[sz]e|analysis|"
+                         r"overview of|everything about|history of|essay|report on|pros and cons|implications|evaluate|"
+                         r"step by step|all aspects)\b", re.IGNORECASE)
+# Time-sensitive queries are unlikely to be answered by the local documents
+_CURRENT_EVENTS = re.compile(r"\b(latest|today|tonight|yesterday|tomorrow|this week|this month|this year|current|currently|"
+                             r"recent|recently|news|breaking|right now|price of|stock price|weather|score of)\b", re.IGNORECASE)
+
+def tokenize(text: str) -> Set[str]:
+    return {token for token in _TOKEN.findall(text.lower()) if len(token) > 2 and token not in _STOPWORDS}
+
+def parse_toc_entries(db_content: str) -> List[str]:
+    """Document names and table-of-contents entries from db_content.txt."""
+    entries = []
+    for line in db_content.split('\n'):
+        stripped = line.strip()
+        document = re.match(r'^--- (.+) ---$', stripped)
+        if document:
+            entries.append(re.sub(r'[_\-.]+', ' ', os.path.splitext(document.group(1))[0]).strip())
+        elif stripped.startswith('- ') and 'no table of contents' not in stripped.lower():
+            entries.append(stripped[2:].strip())
+    return [entry for entry in entries if entry]
+
+class PreRouter:
+    """
+    Local routing stage in front of RouteQuery's LLM evaluation.
+
+    Relevance to the local documents is a weighted mix of the best cosine similarity between
+    the query and the TOC entries and the share of query terms that appear in the TOC.
+    At or above `settings.route_local_threshold` the query goes to the local components, at
+    or below `settings.route_web_threshold` to the web ones; in between it is ambiguous and
+    evaluate() returns None so the caller can ask the LLM. Complexity comes from the query's
+    wording and length.
+    """
+
+    def __init__(self, embedding_model=None, model_name: Optional[str] = None):
+        self.embedding_model = embedding_model
+        self.model_name = model_name or settings.sentence_transformer_model
+        self.toc_key: Optional[str] = None
+        self.toc_entries: List[str] = []
+        self.toc_terms: Set[str] = set()
+        self.toc_embeddings: Optional[np.ndarray] = None
+
+    def get_embedding_model(self):
+        if self.embedding_model is None:
+            from src.model_registry import get_sentence_transformer
+            self.embedding_model = get_sentence_transformer(self.model_name, owner=self)
+        return self.embedding_model
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        from src.embeddings_utils import encode_texts
+        embeddings = encode_texts(self.get_embedding_model(), texts, self.model_name)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12)
+
+    def prepare(self, db_content: str):
+        """Parse and embed the TOC, reusing the previous work while db_content.txt is unchanged."""
+        toc_key = hashlib.blake2b(db_content.encode('utf-8'), digest_size=16).hexdigest()
+        if toc_key == self.toc_key:
+            return
+        self.toc_entries = parse_toc_entries(db_content)
+        self.toc_terms = set().union(*(tokenize(entry) for entry in self.toc_entries)) if self.toc_entries else set()
+        self.toc_embeddings = None
+        if self.toc_entries and settings.route_semantic_weight > 0:
+            try:
+                self.toc_embeddings = self.embed(self.toc_entries)
+            except Exception as e:
+                logging.warning(warning(f"Could not embed the TOC for pre-routing, using lexical overlap only: {str(e)}"))
+        self.toc_key = toc_key
+
+    def score_relevance(self, query: str) -> Tuple[float, float, float, str]:
+        """(relevance, semantic similarity, lexical overlap, best matching TOC entry)."""
+        query_terms = tokenize(query)
+        overlap = len(query_terms & self.toc_terms) / len(query_terms) if query_terms else 0.0
+
+        similarity, best_entry = 0.0, ""
+        if self.toc_embeddings is not None and len(self.toc_embeddings):
+            similarities = self.toc_embeddings @ self.embed([query])[0]
+            best = int(np.argmax(similarities))
+            similarity, best_entry = float(similarities[best]), self.toc_entries[best]
+            weight = settings.route_semantic_weight
+        else:
+            weight = 0.0
+        return weight * similarity + (1 - weight) * overlap, similarity, overlap, best_entry
+
+    @staticmethod
+    def is_deep(query: str) -> bool:
+        return bool(_DEEP_QUERY.search(query)) or len(query.split()) >= settings.route_deep_query_words
+
+    def evaluate(self, query: str, db_content: str) -> Optional[Dict[str, str]]:
+        """An evaluation in RouteQuery.parse_evaluation's format, or None when the query is ambiguous."""
+        self.prepare(db_content)
+        relevance, similarity, overlap, best_entry = self.score_relevance(query)
+        time_sensitive = bool(_CURRENT_EVENTS.search(query))
+
+        if relevance >= settings.route_local_threshold:
+            local = True
+        elif relevance <= settings.route_web_threshold or time_sensitive:
+            local = False
+        else:
+            return None
+
+        deep = self.is_deep(query)
+        recommendation = {(True, False): 'A', (True, True): 'B', (False, False): 'C', (False, True): 'D'}[(local, deep)]
+        reasons = [f"relevance score {relevance:.2f} (similarity {similarity:.2f}, term overlap {overlap:.2f})"]
+        if best_entry:
+            reasons.append(f"closest TOC entry '{best_entry}'")
+        if time_sensitive and not local:
+            reasons.append("the query asks about recent or current information")
+        reasons.append("the query asks for an in-depth answer" if deep else "the query asks for a direct answer")
+        return {
+            "relevance": "high" if local else "low",
+            "complexity": "deep" if deep else "simple",
+            "recommendation": recommendation,
+            "explanation": "Pre-router: " + "; ".join(reasons) + "."
+        }
@@ -0,0 +1,151 @@
+# Standard library imports
+import hashlib
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Hashable, List, Optional, Sequence, Tuple
+
+# Third-party imports
+import numpy as np
+
+# Local imports
+from src.look_and_feel import warning
+from src.query_router import tokenize
+from src.settings import settings
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+RERANK_METHODS = ("embedding", "cross_encoder", "llm")
+
+def _text_key(text: str) -> str:
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+class _LRUCache:
+    """Thread-safe in-memory LRU map used for passage vectors and pair scores."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, object]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class Reranker(ABC):
+    """Scores passages against a query locally; higher is more relevant."""
+
+    @abstractmethod
+    def score(self, query: str, passages: Sequence[str]) -> List[float]:
+        pass
+
+    def rerank(self, query: str, passages: Sequence[str], top_k: Optional[int] = None) -> List[Tuple[str, float]]:
+        """(passage, score) pairs, best first. Ties keep the input order."""
+        if not passages:
+            return []
+        scores = self.score(query, passages)
+        order = sorted(range(len(passages)), key=lambda i: -scores[i])
+        ranked = [(passages[i], float(scores[i])) for i in order]
+        return ranked[:top_k] if top_k is not None else ranked
+
+class EmbeddingReranker(Reranker):
+    """
+    Cosine similarity between the query and passage embeddings, fused with the share of
+    query terms found in the passage (`settings.rerank_lexical_weight`). Passage vectors
+    are kept in an in-memory LRU, so repeated candidates are not encoded again.
+    """
+
+    def __init__(self, model, model_name: Optional[str] = None):
+        self.model = model
+        self.model_name = model_name
+        self.vectors = _LRUCache(settings.rerank_cache_size)
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        from src.embeddings_utils import encode_texts
+
+        keys = [_text_key(text) for text in texts]
+        vectors = [self.vectors.get(key) for key in keys]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        batch_size = max(settings.rerank_batch_size, 1)
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            computed = encode_texts(self.model, [texts[i] for i in batch], self.model_name)
+            norms = np.linalg.norm(computed, axis=1, keepdims=True)
+            for i, vector in zip(batch, computed / np.maximum(norms, 1e-12)):
+                self.vectors.put(keys[i], vector)
+                vectors[i] = vector
+        return np.vstack(vectors)
+
+    def score(self, query: str, passages: Sequence[str]) -> List[float]:
+        embeddings = self.embed([query] + list(passages))
+        similarities = embeddings[1:] @ embeddings[0]
+
+        weight = settings.rerank_lexical_weight
+        query_terms = tokenize(query)
+        if weight <= 0 or not query_terms:
+            return similarities.tolist()
+        overlaps = np.array([len(query_terms & tokenize(passage)) / len(query_terms) for passage in passages])
+        return ((1 - weight) * similarities + weight * overlaps).tolist()
+
+class CrossEncoderReranker(Reranker):
+    """
+    Scores each (query, passage) pair with a sentence-transformers CrossEncoder on the CPU.
+    Pair scores are cached, so a follow-up rerank over the same candidates is free.
+    """
+
+    def __init__(self, model_name: Optional[str] = None):
+        self.model_name = model_name or settings.cross_encoder_model
+        self.model = None
+        self.scores = _LRUCache(settings.rerank_cache_size)
+
+    def get_model(self):
+        if self.model is None:
+            from src.model_registry import get_cross_encoder
+            self.model = get_cross_encoder(self.model_name, owner=self)
+        return self.model
+
+    def score(self, query: str, passages: Sequence[str]) -> List[float]:
+        query_key = _text_key(query)
+        keys = [(query_key, _text_key(passage)) for passage in passages]
+        scores = [self.scores.get(key) for key in keys]
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if missing:
+            predicted = self.get_model().predict([(query, passages[i]) for i in missing],
+                                                 batch_size=max(settings.rerank_batch_size, 1), show_progress_bar=False)
+            for i, score in zip(missing, np.asarray(predicted, dtype=np.float32).reshape(-1)):
+                self.scores.put(keys[i], float(score))
+                scores[i] = float(score)
+        return scores
+
+def create_reranker(embedding_model=None, embedding_model_name: Optional[str] = None, method: Optional[str] = None,
+                    owner=None) -> Optional[Reranker]:
+    """The local reranker for `settings.rerank_method`, or None for the LLM reranker."""
+    method = (method or settings.rerank_method).lower()
+    if method == "cross_encoder":
+        return CrossEncoderReranker()
+    if method == "embedding":
+        if embedding_model is None:
+            from src.model_registry import get_sentence_transformer
+            embedding_model_name = settings.sentence_transformer_model
+            embedding_model = get_sentence_transformer(embedding_model_name, owner=owner)
+        return EmbeddingReranker(embedding_model, embedding_model_name)
+    if method != "llm":
+        logging.warning(warning(f"Unknown rerank method '{method}', expected one of {', '.join(RERANK_METHODS)}; using the LLM"))
+    return None
@@ -0,0 +1,64 @@
+# Standard library imports
+import hashlib
+import json
+import time
+from typing import Any, Optional
+
+# Local imports
+from src.settings import settings
+from src.sqlite_cache import SQLiteCache, get_shared_cache
+
+# Call sites opt in with one of these policies
+CACHE_LOW_TEMPERATURE = "low_temperature"  # Only when temperature <= settings.llm_cache_max_temperature
+CACHE_ALWAYS = "always"  # Any temperature; a rerun reuses whichever sample was stored first
+CACHE_POLICIES = (CACHE_LOW_TEMPERATURE, CACHE_ALWAYS)
+
+def should_cache(policy: Optional[str], temperature: float) -> bool:
+    if not policy or not settings.llm_cache_enabled:
+        return False
+    if policy == CACHE_ALWAYS:
+        return True
+    if policy == CACHE_LOW_TEMPERATURE:
+        return temperature <= settings.llm_cache_max_temperature
+    raise ValueError(f"Unknown cache policy '{policy}', expected one of {', '.join(CACHE_POLICIES)}")
+
+def response_key(kind: str, backend: str, model: str, request: Any, temperature: float, max_tokens: Optional[int]) -> bytes:
+    """Hash of everything that determines a response; `request` is the messages or the prompt."""
+    payload = json.dumps([kind, backend, model, request, temperature, max_tokens], sort_keys=True, ensure_ascii=False)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=20).digest()
+
+class ResponseCache(SQLiteCache):
+    """On-disk cache of LLM responses keyed by response_key()."""
+
+    LABEL = "LLM response cache"
+    TABLE = "responses"
+    KEY_COLUMNS = ("key",)
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS responses (
+            key BLOB PRIMARY KEY,
+            response TEXT NOT NULL,
+            last_used REAL NOT NULL
+        ) WITHOUT ROWID
+    """
+
+    def get(self, key: bytes) -> Optional[str]:
+        with self.lock:
+            row = self.conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: bytes, response: str):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO responses (key, response, last_used) VALUES (?, ?, ?)", (key, response, time.time()))
+            self.conn.commit()
+            self._evict()
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """The process-wide response cache, or None when it is disabled or cannot be opened."""
+    return get_shared_cache(ResponseCache, settings.llm_cache_enabled, settings.llm_cache_file_path,
+                            settings.llm_cache_max_entries)
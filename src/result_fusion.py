@@ -0,0 +1,54 @@
+# Standard library imports
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+# Local imports
+from src.settings import settings
+
+# A retriever's hits, best first: (key, text). Keys are db_content indexes for chunks and
+# "entity:<row>" for knowledge-graph entities, so the same chunk found twice is merged.
+RankedHits = List[Tuple[Hashable, str]]
+
+class FusedResult:
+    __slots__ = ('key', 'text', 'score', 'ranks', 'rerank_score')
+
+    def __init__(self, key: Hashable, text: str):
+        self.key = key
+        self.text = text
+        self.score = 0.0
+        self.ranks: Dict[str, int] = {}  # Retriever name -> 1-based rank in its list
+        self.rerank_score: Optional[float] = None
+
+    @property
+    def sources(self) -> List[str]:
+        return list(self.ranks)
+
+    def provenance(self) -> str:
+        return ", ".join(f"{source} #{rank}" for source, rank in self.ranks.items())
+
+    def __repr__(self) -> str:
+        return f"FusedResult({self.key!r}, score={self.score:.4f}, {self.provenance()})"
+
+def reciprocal_rank_fusion(ranked_lists: Dict[str, RankedHits], weights: Dict[str, float],
+                           k: Optional[int] = None) -> List[FusedResult]:
+    """
+    Merge the retrievers' lists into one, scoring each key by sum(weight / (k + rank)) over
+    the lists it appears in. Ties go to the result with the better best rank.
+    """
+    k = settings.rrf_k if k is None else k
+    fused: Dict[Hashable, FusedResult] = {}
+    for source, hits in ranked_lists.items():
+        weight = weights.get(source, 1.0)
+        for rank, (key, text) in enumerate(hits, 1):
+            result = fused.get(key)
+            if result is None:
+                result = fused[key] = FusedResult(key, text)
+            if source in result.ranks:
+                continue
+            result.ranks[source] = rank
+            result.score += weight / (k + rank)
+    return sorted(fused.values(), key=lambda result: (-result.score, min(result.ranks.values())))
+
+def format_results(results: Sequence[FusedResult], with_provenance: bool = False) -> str:
+    if with_provenance:
+        return "\n\n".join(f"[{result.provenance()}] {result.text}" for result in results)
+    return "\n\n".join(result.text for result in results)
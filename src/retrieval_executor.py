@@ -0,0 +1,80 @@
+# Standard library imports
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Local imports
+from src.look_and_feel import info, warning
+from src.settings import settings
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+def get_retrieval_executor() -> ThreadPoolExecutor:
+    """Process-wide pool shared by every SearchUtils instance."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.retrieval_workers, thread_name_prefix="retriever")
+        return _executor
+
+def _timed(func: Callable[[], Any]) -> Callable[[], Tuple[Any, float]]:
+    def run():
+        start = time.perf_counter()
+        result = func()
+        return result, time.perf_counter() - start
+    return run
+
+def run_retrievers(retrievers: Dict[str, Callable[[], List[Any]]],
+                   timeouts: Optional[Dict[str, float]] = None) -> Tuple[Dict[str, List[Any]], Dict[str, float]]:
+    """
+    Run retrievers concurrently and collect whatever finishes before its deadline.
+
+    Each retriever gets its own deadline (seconds from submission). A retriever that
+    misses it or raises contributes an empty list; the thread is left to finish in
+    the background since Python threads cannot be interrupted. Returns the results
+    and the per-retriever wall time in seconds.
+    """
+    timeouts = timeouts if timeouts is not None else settings.retriever_timeouts
+    executor = get_retrieval_executor()
+    start = time.perf_counter()
+
+    futures = {executor.submit(_timed(func)): name for name, func in retrievers.items()}
+    deadlines = {future: start + timeouts.get(name, settings.retrieval_timeout) for future, name in futures.items()}
+    results: Dict[str, List[Any]] = {name: [] for name in retrievers}
+    timings: Dict[str, float] = {}
+
+    pending = set(futures)
+    while pending:
+        now = time.perf_counter()
+        expired = {future for future in pending if deadlines[future] <= now}
+        for future in expired:
+            name = futures[future]
+            future.cancel()
+            timings[name] = now - start
+            logging.warning(warning(f"{name} retrieval missed its {timeouts.get(name, settings.retrieval_timeout):.1f}s deadline, continuing without it"))
+        pending -= expired
+        if not pending:
+            break
+
+        done, pending = wait(pending, timeout=min(deadlines[f] for f in pending) - now, return_when=FIRST_COMPLETED)
+        for future in done:
+            name = futures[future]
+            try:
+                results[name], timings[name] = future.result()
+            except Exception as e:
+                timings[name] = time.perf_counter() - start
+                logging.error(f"{name} retrieval failed: {str(e)}")
+
+    return results, {name: timings[name] for name in retrievers}
+
+def format_timings(timings: Dict[str, float]) -> str:
+    return ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in timings.items())
+
+def log_timings(timings: Dict[str, float]):
+    logging.info(info(f"Retrieval timings: {format_timings(timings)}"))
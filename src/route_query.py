@@ -3,30 +3,55 @@ import sys
 import logging
 import re
 import os
+import threading
+import time
 from enum import Enum
+from typing import Any, Dict, Hashable, Optional, Tuple
 
 # Local imports
 from src.settings import settings
 from src.api_model import EragAPI, create_erag_api
 from src.look_and_feel import success, info, warning, error, highlight
+from src.model_registry import file_version
+from src.query_router import PreRouter
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Route recommendations and the components that handle them
+ROUTE_COMPONENTS = {
+    'A': 'talk2doc',
+    'B': 'create_knol',
+    'C': 'web_rag',
+    'D': 'web_sum'
+}
+# Components built from the local documents, rebuilt when those files change
+LOCAL_COMPONENTS = {'talk2doc', 'create_knol'}
+
 class RouteQuery:
-    def __init__(self, api_type: str, model: str = None):
+    def __init__(self, api_type: str, model: str = None, prewarm: Optional[bool] = None):
         embedding_class = settings.get_default_embedding_class()
         embedding_model = settings.get_default_embedding_model(embedding_class)
         reranker_model = settings.reranker_model
         self.erag_api = create_erag_api(api_type, model, embedding_class, embedding_model, reranker_model)
-
+        self.prewarm_on_start = settings.route_prewarm if prewarm is None else prewarm
+        # Warm component instances with the data version they were built from
+        self.components: Dict[str, Tuple[Any, Hashable]] = {}
+        self.component_locks = {name: threading.Lock() for name in ROUTE_COMPONENTS.values()}
+        self.db_content_cache: Optional[Tuple[Hashable, str]] = None
+        self.pre_router = PreRouter()
 
     def load_db_content(self):
-        logging.info("Loading database content...")
         db_content_path = os.path.join(settings.output_folder, 'db_content.txt')
+        version = file_version([db_content_path])
+        if version is not None and self.db_content_cache is not None and self.db_content_cache[0] == version:
+            return self.db_content_cache[1]
+
+        logging.info("Loading database content...")
         try:
             with open(db_content_path, 'r', encoding='utf-8') as f:
                 content = f.read()
+            self.db_content_cache = (version, content)
             logging.info(f"Successfully loaded database content from {db_content_path}")
             logging.info(f"Loaded db_content (first 100 characters): {content[:100]}...")
             return content
@@ -41,9 +66,33 @@ class RouteQuery:
 
     def evaluate_query(self, query: str) -> dict:
         logging.info(f"Evaluating query: {query}")
-        
+        started = time.perf_counter()
         db_content = self.load_db_content()
-        
+
+        # Confident decisions are made locally; only ambiguous queries cost an LLM call
+        if settings.route_prerouter_enabled:
+            try:
+                evaluation = self.pre_router.evaluate(query, db_content)
+            except Exception as e:
+                logging.warning(warning(f"Pre-router failed, asking the LLM: {str(e)}"))
+                evaluation = None
+            if evaluation is not None:
+                evaluation['source'] = 'pre-router'
+                self.log_decision(evaluation, started)
+                return evaluation
+            logging.info(info("Pre-router found the query ambiguous, asking the LLM"))
+
+        evaluation = self.evaluate_query_with_llm(query, db_content)
+        evaluation.setdefault('source', 'llm')
+        self.log_decision(evaluation, started)
+        return evaluation
+
+    @staticmethod
+    def log_decision(evaluation: dict, started: float):
+        latency_ms = (time.perf_counter() - started) * 1000
+        logging.info(info(f"Routing decision {evaluation['recommendation']} from {evaluation['source']} in {latency_ms:.0f} ms"))
+
+    def evaluate_query_with_llm(self, query: str, db_content: str) -> dict:
         system_message = """You are an intelligent query router with expertise in analyzing user queries and database content. Your task is to determine the most appropriate way to handle a given query based on the available information and the capabilities of our systems. 
 
         IMPORTANT: The database content provided is a Table of Contents (TOC) summary, not the full content. The presence of relevant entries in this TOC is a strong indicator that detailed information is available in the local documents.
@@ -115,7 +164,8 @@ class RouteQuery:
                 "recommendation": "C",
                 "relevance": "low",
                 "complexity": "simple",
-                "explanation": f"Default routing due to error in LLM response: {str(e)}"
+                "explanation": f"Default routing due to error in LLM response: {str(e)}",
+                "source": "default"
             }
 
     def parse_evaluation(self, response: str) -> dict:
@@ -151,7 +201,8 @@ class RouteQuery:
             return RAGSystem(self.erag_api)
         elif component_name == 'create_knol':
             from src.create_knol import KnolCreator
-            return KnolCreator(self.erag_api)
+            # The routed KnolCreator uses the same model as worker and supervisor
+            return KnolCreator(self.erag_api, self.erag_api)
         elif component_name == 'web_rag':
             from src.web_rag import WebRAG
             return WebRAG(self.erag_api)
@@ -161,6 +212,46 @@ class RouteQuery:
         else:
             raise ValueError(f"Unknown component: {component_name}")
 
+    def get_data_version(self, component_name: str) -> Hashable:
+        if component_name not in LOCAL_COMPONENTS:
+            return None
+        from src.embedding_store import get_store_paths
+        from src.graph_store import get_graph_store_dir
+        graph_path = os.path.join(settings.output_folder, os.path.basename(settings.knowledge_graph_file_path))
+        return (file_version([settings.db_file_path]),
+                file_version([get_store_paths(settings.embeddings_file_path)['manifest']]),
+                file_version([os.path.join(get_graph_store_dir(graph_path), 'meta.json')]))
+
+    def get_component(self, component_name: str):
+        """A warm instance of the component, built on first use or when the local documents changed."""
+        with self.component_locks[component_name]:
+            version = self.get_data_version(component_name)
+            cached = self.components.get(component_name)
+            if cached is not None and cached[1] == version:
+                return cached[0]
+            if cached is not None:
+                logging.info(info(f"Local documents changed, reloading {component_name}"))
+            component = self.load_component(component_name)
+            # Building may update the embeddings, so record the version it was built from afterwards
+            self.components[component_name] = (component, self.get_data_version(component_name))
+            return component
+
+    def prewarm(self):
+        """Build every route target up front, so routed queries only pay for the LLM calls."""
+        started = time.perf_counter()
+        if settings.route_prerouter_enabled:
+            try:
+                self.pre_router.prepare(self.load_db_content())
+                print(success("Pre-warmed the pre-router"))
+            except Exception as e:
+                print(warning(f"Could not pre-warm the pre-router: {str(e)}"))
+        for component_name in ROUTE_COMPONENTS.values():
+            try:
+                self.get_component(component_name)
+                print(success(f"Pre-warmed {component_name}"))
+            except Exception as e:
+                print(warning(f"Could not pre-warm {component_name}: {str(e)}"))
+        print(info(f"Pre-warming finished in {time.perf_counter() - started:.1f}s"))
 
     def route_query(self, query: str, evaluation: dict):
         print(info("Routing decision:"))
@@ -168,17 +259,14 @@ class RouteQuery:
         print(f"Complexity: {evaluation['complexity']}")
         print(f"Recommendation: {evaluation['recommendation']}")
         print(f"Explanation: {evaluation['explanation']}")
+        print(f"Decided by: {evaluation.get('source', 'llm')}")
 
-        system_to_load = {
-            'A': 'talk2doc',
-            'B': 'create_knol',
-            'C': 'web_rag',
-            'D': 'web_sum'
-        }.get(evaluation['recommendation'], 'web_rag')
+        system_to_load = ROUTE_COMPONENTS.get(evaluation['recommendation'], 'web_rag')
 
         print(info(f"Loading system: {system_to_load}"))
-        component = self.load_component(system_to_load)
-        print(success(f"System loaded: {system_to_load}"))
+        started = time.perf_counter()
+        component = self.get_component(system_to_load)
+        print(success(f"System loaded: {system_to_load} ({time.perf_counter() - started:.2f}s)"))
 
         if system_to_load == 'talk2doc':
             response = component.get_response(query)
@@ -203,6 +291,10 @@ class RouteQuery:
             print(error("Error: Cannot start the Query Routing System. Please upload and process documents first."))
             return
 
+        if self.prewarm_on_start:
+            print(info("Pre-warming route targets..."))
+            self.prewarm()
+
         while True:
             user_input = input(info("Enter your query: ")).strip()
 
@@ -219,16 +311,16 @@ class RouteQuery:
 
             self.route_query(user_input, evaluation)
 
-def main(api_type: str, model: str = None):
-    route_query = RouteQuery(api_type, model)
+def main(api_type: str, model: str = None, prewarm: Optional[bool] = None):
+    route_query = RouteQuery(api_type, model, prewarm)
     route_query.run()
 
 if __name__ == "__main__":
     if len(sys.argv) > 1:
         api_type = sys.argv[1]
-        main(api_type)
+        main(api_type, prewarm=True if "--prewarm" in sys.argv[2:] else None)
     else:
         print(error("No API type provided."))
-        print(warning("Usage: python src/route_query.py <api_type>"))
+        print(warning("Usage: python src/route_query.py <api_type> [--prewarm]"))
         print(info("Available API types: ollama, llama"))
         sys.exit(1)
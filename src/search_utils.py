@@ -1,143 +1,183 @@
 # Standard library imports
-import re
 import os
-import json
 import logging
-from typing import List, Tuple
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
 
 # Third-party imports
-import torch
-from sentence_transformers import util
 import networkx as nx
-import spacy
 import numpy as np
 
 # Local imports
 from src.settings import settings
 from src.look_and_feel import success, info, warning, error
+from src.embedding_store import EmbeddingStore, open_embedding_store, to_numpy
+from src.vector_index import VectorIndex, get_vector_index_path, load_or_build_vector_index
+from src.inverted_index import InvertedIndex, build_inverted_index, load_or_build_inverted_index
+from src.retrieval_executor import log_timings, run_retrievers
+from src.entity_index import EntityIndex, load_or_build_entity_index
+from src.graph_store import get_graph_store_dir
+from src.model_registry import get_knowledge_graph, get_spacy_model
+from src.reranker import Reranker, create_reranker
+from src.result_fusion import FusedResult, RankedHits, reciprocal_rank_fusion
 
 class SearchUtils:
-    def __init__(self, erag_api, model, db_embeddings=None, db_content=None, knowledge_graph=None):
+    def __init__(self, erag_api, model, db_embeddings=None, db_content=None, knowledge_graph=None, vector_index_path=None, inverted_index_path=None):
         self.erag_api = erag_api
         self.model = model
-        self.nlp = spacy.load(settings.nlp_model)
+        self.vector_index_path = vector_index_path
+        self.vector_index = None
+        # The store the persisted vector index was built over; its revision tells whether the index is current
+        self.embeddings_path = os.path.join(settings.output_folder, os.path.basename(settings.embeddings_file_path))
+        # Set when db_content mirrors db.txt, so the persisted inverted index can be used
+        self.inverted_index_path = inverted_index_path
+        self.inverted_index = None
+        self.inverted_index_mismatch = None
+        # Retrievers run concurrently, so lazy index construction must happen once
+        self.vector_index_lock = threading.Lock()
+        self.inverted_index_lock = threading.Lock()
+        self.entity_index = None
+        self.entity_index_lock = threading.Lock()
+        self.last_timings: Dict[str, float] = {}
+        self._nlp = None
         self.rerank_model = erag_api
+        self.reranker = None
+        self.reranker_method = None
+        self.reranker_lock = threading.Lock()
+        self.last_rerank_scores: List[Tuple[str, float]] = []
+        self.last_results: List[FusedResult] = []
         
         # Load db_embeddings and db_content
         if db_embeddings is not None and db_content is not None:
             self.db_embeddings = db_embeddings
             self.db_content = db_content
         else:
-            embeddings_path = os.path.join(settings.output_folder, os.path.basename(settings.embeddings_file_path))
-            if os.path.exists(embeddings_path):
-                loaded_data = torch.load(embeddings_path)
-                self.db_embeddings = loaded_data['embeddings']
-                self.db_content = loaded_data['content']
+            embeddings_path = self.embeddings_path
+            opened = open_embedding_store(embeddings_path)
+            if opened is not None:
+                # Memory-mapped, so this is cheap and the pages are shared with other processes
+                self.db_embeddings, self.db_content = opened
+                self.vector_index_path = get_vector_index_path(embeddings_path)
                 logging.info(info(f"Loaded embeddings and content from {embeddings_path}"))
             else:
                 logging.error(error(f"Embeddings file not found: {embeddings_path}"))
-                self.db_embeddings = torch.tensor([])
+                self.db_embeddings = np.empty((0, 0), dtype=np.float32)
                 self.db_content = []
 
+        # Convert once here instead of on every query
+        self.db_embeddings = to_numpy(self.db_embeddings)
+
         # Load knowledge graph
         if knowledge_graph is not None:
             self.knowledge_graph = knowledge_graph
         else:
             graph_path = os.path.join(settings.output_folder, os.path.basename(settings.knowledge_graph_file_path))
-            if os.path.exists(graph_path):
-                with open(graph_path, 'r') as f:
-                    graph_data = json.load(f)
-                self.knowledge_graph = nx.node_link_graph(graph_data)
-                logging.info(info(f"Loaded knowledge graph from {graph_path}"))
+            graph = get_knowledge_graph(graph_path, owner=self)
+            if graph is not None:
+                self.knowledge_graph = graph
+                logging.info(info(f"Loaded knowledge graph from {get_graph_store_dir(graph_path)}"))
             else:
                 logging.error(error(f"Knowledge graph file not found: {graph_path}"))
                 self.knowledge_graph = nx.Graph()
 
+    @property
+    def nlp(self):
+        # spaCy is only needed for entity extraction, so it is loaded on first use
+        if self._nlp is None:
+            self._nlp = get_spacy_model(settings.nlp_model, owner=self)
+        return self._nlp
+
+    def chunk_hits(self, ids) -> RankedHits:
+        return [(int(i), str(self.db_content[i].strip())) for i in ids]
+
     def lexical_search(self, query: str) -> List[str]:
+        return [text for _, text in self.lexical_hits(query)]
+
+    def lexical_hits(self, query: str) -> RankedHits:
         if not settings.enable_lexical_search:
             return []
         
-        query_words = set(re.findall(r'\w+', query.lower()))
-        overlap_scores = []
-        for context in self.db_content:
-            context_words = set(re.findall(r'\w+', context.lower()))
-            overlap = len(query_words.intersection(context_words))
-            overlap_scores.append(overlap)
-        top_indices = sorted(range(len(overlap_scores)), key=lambda i: overlap_scores[i], reverse=True)[:settings.top_k]
-        return [str(self.db_content[i].strip()) for i in top_indices]
+        top_hits = self.get_inverted_index().search(query, settings.top_k)
+        return self.chunk_hits(i for i, _ in top_hits)
 
     def semantic_search(self, query: str) -> List[str]:
+        return [text for _, text in self.semantic_hits(query)]
+
+    def semantic_hits(self, query: str) -> RankedHits:
         if not settings.enable_semantic_search:
             return []
         
-        if isinstance(self.db_embeddings, torch.Tensor):
-            self.db_embeddings = self.db_embeddings.numpy()
-        
         if hasattr(self.model, 'encode'):
             # For SentenceTransformer models
-            with torch.no_grad():
-                input_embedding = self.model.encode([query], convert_to_tensor=True, show_progress_bar=False)
-            cos_scores = util.cos_sim(input_embedding, torch.from_numpy(self.db_embeddings))[0]
-            top_indices = torch.topk(cos_scores, k=min(settings.top_k, len(cos_scores)))[1].tolist()
+            input_embedding = self.model.encode([query], show_progress_bar=False)
+            top_indices, _ = self.get_vector_index().search(input_embedding, settings.top_k)
+            top_indices = top_indices.tolist()
         else:
             # For LLM models (Ollama, Llama), we'll use a simple keyword matching as a fallback
-            query_words = set(query.lower().split())
-            scores = [sum(word in content.lower() for word in query_words) for content in self.db_content]
-            top_indices = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:settings.top_k]
+            top_indices = [i for i, _ in self.get_inverted_index().match(query, settings.top_k)]
         
-        return [str(self.db_content[idx].strip()) for idx in top_indices]
+        return self.chunk_hits(top_indices)
+
+    def get_vector_index(self) -> VectorIndex:
+        with self.vector_index_lock:
+            self.db_embeddings = to_numpy(self.db_embeddings)
+
+            if self.vector_index is None or len(self.vector_index) > len(self.db_embeddings):
+                source = EmbeddingStore(self.embeddings_path).revision if self.vector_index_path else None
+                self.vector_index = load_or_build_vector_index(self.db_embeddings, self.vector_index_path, source)
+            elif len(self.vector_index) < len(self.db_embeddings):
+                # Embeddings were appended in place (e.g. WebRAG 'check'), so index only the new rows
+                self.vector_index.add(self.db_embeddings[len(self.vector_index):], self.db_embeddings)
+            return self.vector_index
+
+    def get_inverted_index(self) -> InvertedIndex:
+        with self.inverted_index_lock:
+            return self._get_inverted_index()
+
+    def _get_inverted_index(self) -> InvertedIndex:
+        if self.inverted_index_path:
+            index = load_or_build_inverted_index(settings.db_file_path, self.inverted_index_path, save=False)
+            if len(index) == len(self.db_content):
+                return index
+            # Answer from memory until they line up again, e.g. once a concurrent append to db.txt is complete
+            if self.inverted_index_mismatch != (len(index), len(self.db_content)):
+                self.inverted_index_mismatch = (len(index), len(self.db_content))
+                logging.warning(warning(f"Inverted index covers {len(index)} chunks but {len(self.db_content)} are loaded, indexing in memory"))
+
+        if self.inverted_index is None or len(self.inverted_index) > len(self.db_content):
+            self.inverted_index = build_inverted_index(self.db_content)
+        elif len(self.inverted_index) < len(self.db_content):
+            self.inverted_index.add_documents(self.db_content[len(self.inverted_index):])
+        return self.inverted_index
 
     def get_graph_context(self, query: str) -> List[str]:
+        return [text for _, text in self.graph_hits(query)]
+
+    def graph_hits(self, query: str) -> RankedHits:
         if not settings.enable_graph_search or not self.knowledge_graph.nodes():
             return []
 
-        query_entities = set(self.extract_entities(query))
-        node_scores = []
-
-        for node, data in self.knowledge_graph.nodes(data=True):
-            if data.get('type') == 'entity':
-                entity_name = node
-                entity_type = data.get('entity_type', 'Unknown')
-                confidence = data.get('confidence', 0.5)  # Default confidence if not set
-                connected_chunks = [n for n in self.knowledge_graph.neighbors(node) if self.knowledge_graph.nodes[n]['type'] == 'chunk']
-                connected_docs = set([self.get_parent_document(chunk) for chunk in connected_chunks])
-                
-                relevance_score = 1 if entity_name.lower() in query.lower() else 0
-                relevance_score += len(connected_chunks) * 0.1
-                relevance_score += len(connected_docs) * 0.2
-                relevance_score *= confidence  # Adjust relevance based on confidence
-                
-                if relevance_score >= settings.entity_relevance_threshold:
-                    node_scores.append((node, entity_type, connected_chunks, relevance_score))
-
-        top_entities = sorted(node_scores, key=lambda x: x[3], reverse=True)[:settings.top_k]
-        
-        context = []
-        for entity, entity_type, connected_chunks, _ in top_entities:
-            entity_info = f"Entity: {entity} (Type: {entity_type})"
-            chunk_contexts = []
-            for chunk in connected_chunks[:3]:
-                chunk_text = self.knowledge_graph.nodes[chunk].get('text', '')
-                chunk_contexts.append(chunk_text)
-            
-            related_entities = [n for n in self.knowledge_graph.neighbors(entity) if self.knowledge_graph.nodes[n]['type'] == 'entity']
-            related_info = f"Related Entities: {', '.join(related_entities[:5])}"
-            
-            context_text = f"{entity_info}\n{related_info}\nRelevant Chunks:\n" + "\n".join(chunk_contexts)
-            context.append(context_text)
-
-        return context
+        # Relevance = (name in query + 0.1 * chunks + 0.2 * documents) * confidence, from the precomputed table
+        entity_index = self.get_entity_index()
+        top_rows = entity_index.top_entities(query, settings.top_k, settings.entity_relevance_threshold)
+        return [(f"entity:{row}", entity_index.context(row)) for row in top_rows]
+
+    def get_entity_index(self) -> EntityIndex:
+        with self.entity_index_lock:
+            if self.entity_index is None or not self.entity_index.is_current(self.knowledge_graph):
+                self.entity_index = load_or_build_entity_index(self.knowledge_graph, settings.entity_index_file_path)
+            return self.entity_index
 
     def text_search(self, query: str) -> List[str]:
+        return [text for _, text in self.text_hits(query)]
+
+    def text_hits(self, query: str) -> RankedHits:
         if not settings.enable_text_search:
             return []
         
-        query_terms = query.lower().split()
-        results = []
-        for content in self.db_content:
-            if any(term in content.lower() for term in query_terms):
-                results.append(content.strip())
-        return sorted(results, key=lambda x: sum(term in x.lower() for term in query_terms), reverse=True)[:settings.top_k]
+        top_hits = self.get_inverted_index().match(query, settings.top_k)
+        return self.chunk_hits(i for i, _ in top_hits)
 
     def extract_entities(self, text: str) -> List[str]:
         doc = self.nlp(text)
@@ -149,7 +189,41 @@ class SearchUtils:
                 return neighbor
         return None
     
+    def get_reranker(self) -> Optional[Reranker]:
+        """The local reranker for settings.rerank_method (None for the LLM), rebuilt when the setting changes."""
+        with self.reranker_lock:
+            if self.reranker_method != settings.rerank_method:
+                self.reranker = create_reranker(self.model, method=settings.rerank_method, owner=self)
+                self.reranker_method = settings.rerank_method
+            return self.reranker
+
     def rerank_results(self, query: str, initial_results: List[str], top_k: int) -> List[str]:
+        """
+        Re-rank the initial results with the local reranker selected by settings.rerank_method,
+        falling back to the LLM when it is set to "llm". The scores are kept in last_rerank_scores.
+        """
+        if not initial_results:
+            self.last_rerank_scores = []
+            return []
+
+        try:
+            reranker = self.get_reranker()
+        except Exception as e:
+            logging.warning(warning(f"Could not load the {settings.rerank_method} reranker, using the LLM: {str(e)}"))
+            reranker = None
+        if reranker is not None:
+            try:
+                self.last_rerank_scores = reranker.rerank(query, initial_results, top_k)
+                return [result for result, _ in self.last_rerank_scores]
+            except Exception as e:
+                logging.warning(warning(f"Local re-ranking failed, keeping the retrieval order: {str(e)}"))
+                self.last_rerank_scores = []
+                return initial_results[:top_k]
+
+        self.last_rerank_scores = []
+        return self.rerank_results_with_llm(query, initial_results, top_k)
+
+    def rerank_results_with_llm(self, query: str, initial_results: List[str], top_k: int) -> List[str]:
         """
         Re-rank the initial results using the rerank_model from EragAPI.
         """
@@ -186,42 +260,59 @@ class SearchUtils:
         
         return ranked_results
 
-    def get_relevant_context(self, user_input: str, conversation_context: List[str]) -> Tuple[List[str], List[str], List[str], List[str]]:
+    @staticmethod
+    def get_retriever_weights() -> Dict[str, float]:
+        return {"lexical": settings.lexical_weight, "semantic": settings.semantic_weight,
+                "graph": settings.graph_weight, "text": settings.text_weight}
+
+    def retrieve(self, user_input: str, conversation_context: List[str]) -> List[FusedResult]:
+        """
+        Run the retrievers, merge their hits with weighted reciprocal rank fusion and re-rank the
+        best settings.fusion_candidates of them, returning the top settings.rerank_top_k results.
+        Each result records which retrievers found it and at what rank.
+        """
         logging.info(info(f"DB Embeddings shape: {self.db_embeddings.shape if hasattr(self.db_embeddings, 'shape') else 'No shape attribute'}"))
         logging.info(info(f"DB Content length: {len(self.db_content)}"))
 
-        if isinstance(self.db_embeddings, torch.Tensor) and self.db_embeddings.dim() > 1:
-            self.db_embeddings = self.db_embeddings.numpy()
+        self.db_embeddings = to_numpy(self.db_embeddings)
 
         if self.db_embeddings.size == 0 or len(self.db_content) == 0:
             logging.warning(warning("DB Embeddings or DB Content is empty"))
-            return [], [], [], []
+            self.last_results = []
+            return []
 
         search_query = " ".join(list(conversation_context) + [user_input])
 
-        lexical_results = self.lexical_search(search_query)
-        semantic_results = self.semantic_search(search_query)
-        graph_results = self.get_graph_context(search_query)
-        text_results = self.text_search(search_query)
+        hits, timings = run_retrievers({
+            "lexical": lambda: self.lexical_hits(search_query),
+            "semantic": lambda: self.semantic_hits(search_query),
+            "graph": lambda: self.graph_hits(search_query),
+            "text": lambda: self.text_hits(search_query),
+        })
+        for name, name_hits in hits.items():
+            logging.info(success(f"Number of {name} results: {len(name_hits)}"))
 
-        logging.info(success(f"Number of lexical results: {len(lexical_results)}"))
-        logging.info(success(f"Number of semantic results: {len(semantic_results)}"))
-        logging.info(success(f"Number of graph results: {len(graph_results)}"))
-        logging.info(success(f"Number of text search results: {len(text_results)}"))
+        fusion_start = time.perf_counter()
+        fused = reciprocal_rank_fusion(hits, self.get_retriever_weights())
+        # The same text under different keys (e.g. a repeated chunk) only needs to be sent once
+        candidates: Dict[str, FusedResult] = {}
+        for result in fused:
+            candidates.setdefault(result.text, result)
+            if len(candidates) >= settings.fusion_candidates:
+                break
+        timings["fusion"] = time.perf_counter() - fusion_start
 
-        # Combine all search results
-        all_results = lexical_results + semantic_results + graph_results + text_results
-
-        # Remove duplicates while preserving order
-        unique_results = []
-        seen = set()
-        for result in all_results:
-            if result not in seen:
-                unique_results.append(result)
-                seen.add(result)
-
-        # Re-rank the unique results
-        reranked_results = self.rerank_results(user_input, unique_results, settings.rerank_top_k)
+        rerank_start = time.perf_counter()
+        reranked = self.rerank_results(user_input, list(candidates), settings.rerank_top_k)
+        rerank_scores = dict(self.last_rerank_scores)
+        results = []
+        for text in reranked:
+            result = candidates[text]
+            result.rerank_score = rerank_scores.get(text)
+            results.append(result)
+        timings["rerank"] = time.perf_counter() - rerank_start
+        self.last_timings = timings
+        log_timings(timings)
 
-        # For consistency with the existing return structure, we'll return the reranked results for all four categories
-        return reranked_results, reranked_results, reranked_results, reranked_results
+        self.last_results = results
+        return results
@@ -23,25 +23,72 @@ class Settings:
         # Upload Settings
         self.file_chunk_size: int = 500
         self.file_overlap_size: int = 200
+        self.ingest_workers: int = 0  # Processes extracting and chunking files, 0 = one per CPU core
+        self.ingest_buffer_size: int = 8 * 1024 * 1024  # Bytes buffered per write to db.txt
 
         # Embeddings Settings
         self.batch_size: int = 32
+        # Base name of the embedding store (db_embeddings.npy, db_embeddings_text.bin, ...); a legacy .pt is converted on load
         self.embeddings_file_path: str = ensure_output_path("db_embeddings.pt")
+        self.embedding_dtype: str = "float32"  # float32 or float16 (half the disk and page cache)
+        self.embedding_compaction_ratio: float = 0.25  # Compact once this fraction of stored rows is garbage
+        self.embedding_max_segments: int = 64  # ...or once this many appended segments accumulate
+        self.ollama_embedding_batch_size: int = 64  # Texts sent per Ollama embeddings request
+        self.ollama_embedding_workers: int = 4  # Ollama embeddings requests kept in flight
+        self.embedding_max_retries: int = 3
+        self.embedding_retry_delay: float = 1.0  # Seconds before the first retry, doubled on each attempt
+        self.embedding_cache_enabled: bool = True
+        self.embedding_cache_file_path: str = ensure_output_path("embedding_cache.db")
+        self.embedding_cache_max_entries: int = 500000  # Least recently used entries are evicted beyond this
         self.db_file_path: str = ensure_output_path("db.txt")
 
+        # Vector Index Settings
+        self.vector_index_type: str = "ivf"  # exact, ivf or hnsw
+        self.vector_index_min_size: int = 20000  # Below this many embeddings, exact search is used
+        self.ivf_nlist: int = 0  # 0 = derive from corpus size
+        self.ivf_nprobe: int = 0  # 0 = a quarter of the lists, at least 16
+        self.hnsw_m: int = 16
+        self.hnsw_ef_construction: int = 200
+        self.hnsw_ef_search: int = 64
+
         # Graph Settings
         self.graph_chunk_size: int = 5000
         self.graph_overlap_size: int = 200
         self.nlp_model: str = "en_core_web_sm"
+        self.nlp_batch_size: int = 256  # Texts per nlp.pipe batch when extracting entities
+        self.nlp_n_process: int = 0  # Processes for entity extraction, 0 = one per CPU core
         self.similarity_threshold: float = 0.7
         self.min_entity_occurrence: int = 1
         self.enable_semantic_edges: bool = True
+        self.similarity_block_size: int = 2048  # Documents per tile when computing semantic edges
+        # Base name of the compact graph store (knowledge_graph_store/); a node-link JSON here is converted on load
         self.knowledge_graph_file_path: str = ensure_output_path("knowledge_graph.json")
+        self.export_graph_json: bool = False  # Also write node-link JSON for external tools
+        self.entity_index_file_path: str = ensure_output_path("knowledge_graph_entities.json")
 
         # Model Settings
         self.max_history_length: int = 5
         self.conversation_context_size: int = 3
         self.update_threshold: int = 10
+        self.stream_output: bool = True  # Print chat answers token by token as they are generated
+        self.llm_cache_enabled: bool = True  # Persistent cache for call sites that opt in (summaries, questions, datasets, analyses)
+        self.llm_cache_file_path: str = ensure_output_path("llm_response_cache.db")
+        self.llm_cache_max_entries: int = 50000  # Least recently used responses are evicted beyond this
+        self.llm_cache_max_temperature: float = 0.3  # Highest temperature cached by the low_temperature policy
+        # Async clients (EragAPI.achat/acomplete/aembed): requests in flight and requests per minute per backend, 0 = unlimited
+        self.async_max_concurrency: Dict[str, int] = {"ollama": 4, "llama": 2, "groq": 8, "gemini": 8, "cohere": 8, "ollama_embeddings": 4}
+        self.async_requests_per_minute: Dict[str, float] = {"ollama": 0, "llama": 0, "groq": 30, "gemini": 60, "cohere": 100, "ollama_embeddings": 0}
+        self.query_cache_enabled: bool = True  # Reuse Talk2Doc answers to repeated questions
+        self.query_cache_size: int = 256
+        self.query_cache_ttl: float = 3600.0  # Seconds, 0 = answers never expire
+        self.query_cache_similarity: float = 0.95  # Cosine similarity for a near-duplicate question to reuse an answer, 1 = exact only
+        self.model_idle_timeout: float = 0  # Seconds an unused shared model stays loaded, 0 = keep for the whole session
+        self.route_prewarm: bool = False  # Load every Route Query target before the first query
+        self.route_prerouter_enabled: bool = True  # Route confident queries locally, ask the LLM only for ambiguous ones
+        self.route_local_threshold: float = 0.55  # Relevance score at or above which queries go to the local documents
+        self.route_web_threshold: float = 0.3  # ...and at or below which they go to the web
+        self.route_semantic_weight: float = 0.7  # Share of TOC similarity in the relevance score, the rest is term overlap
+        self.route_deep_query_words: int = 25  # Queries at least this long count as deep
         self.ollama_model: str = "qwen2:1.5b-instruct-q8_0"
         self.llama_model: str = "llama-default"
         self.groq_model: str = "llama3-groq-8b-8192-tool-use-preview"
@@ -77,21 +124,35 @@ class Settings:
         # Search Settings
         self.top_k: int = 5
         self.rerank_top_k: int = 2  # Add this line
+        self.rerank_method: str = "embedding"  # "embedding", "cross_encoder" (both local) or "llm"
+        self.cross_encoder_model: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+        self.rerank_lexical_weight: float = 0.2  # Share of query term overlap in embedding rerank scores
+        self.rerank_batch_size: int = 32
+        self.rerank_cache_size: int = 10000  # Passage vectors / pair scores kept in memory per reranker
         self.entity_relevance_threshold: float = 0.5
         self.lexical_weight: float = 1.0
         self.semantic_weight: float = 1.0
         self.graph_weight: float = 1.0
         self.text_weight: float = 1.0
+        self.rrf_k: int = 60  # Reciprocal rank fusion constant; larger values flatten the rank differences
+        self.fusion_candidates: int = 20  # Fused results passed to the re-ranker
         self.enable_lexical_search: bool = True
         self.enable_semantic_search: bool = True
         self.enable_graph_search: bool = True
         self.enable_text_search: bool = True
+        self.bm25_k1: float = 1.5
+        self.bm25_b: float = 0.75
+        self.inverted_index_file_path: str = ensure_output_path("db_inverted_index.pkl")
+        self.retrieval_workers: int = 4
+        self.retrieval_timeout: float = 10.0  # Seconds, for retrievers without their own deadline
+        self.retriever_timeouts: Dict[str, float] = {"lexical": 5.0, "semantic": 10.0, "graph": 5.0, "text": 5.0}
 
         # Summarization settings
         self.summarization_chunk_size: int = 3000
         self.summarization_summary_size: int = 200
         self.summarization_combining_number: int = 3
         self.summarization_final_chunk_size: int = 300
+        self.summarization_workers: int = 4  # Chunks or groups summarized at once
 
         # File Settings
         self.results_file_path: str = ensure_output_path("results.txt")
@@ -101,6 +162,7 @@ class Settings:
         self.question_chunk_levels: int = 3
         self.excluded_question_levels: List[int] = []
         self.questions_per_chunk: int = 3
+        self.question_workers: int = 4  # Chunks sent to the model at once
 
         # Talk2URL Settings
         self.talk2url_limit_content_size: bool = True
@@ -0,0 +1,90 @@
+# Standard library imports
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, Optional, Tuple, Type, TypeVar
+
+# Local imports
+from src.look_and_feel import info, warning
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def _sentence_case(label: str) -> str:
+    return label[:1].upper() + label[1:]
+
+class SQLiteCache:
+    """
+    Base of the on-disk caches: a SQLite file in WAL mode, so several processes can share
+    it, with a `last_used` column refreshed on each hit and least recently used eviction
+    once the table grows past `max_entries`.
+
+    Subclasses define the table (SCHEMA must include a REAL `last_used` column), its key
+    columns and a label for log lines, and implement their own lookups and inserts,
+    calling `_evict()` after inserting under `lock`.
+    """
+
+    LABEL = "cache"
+    TABLE = ""
+    KEY_COLUMNS: Tuple[str, ...] = ()
+    SCHEMA = ""
+
+    def __init__(self, db_path: str, max_entries: int):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(self.SCHEMA)
+        self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.TABLE}_last_used ON {self.TABLE} (last_used)")
+        self.conn.commit()
+
+    def _evict(self):
+        count = self.conn.execute(f"SELECT COUNT(*) FROM {self.TABLE}").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        # Evict down to 90% so eviction does not run on every insert
+        excess = count - int(self.max_entries * 0.9)
+        keys = ", ".join(self.KEY_COLUMNS)
+        self.conn.execute(f"DELETE FROM {self.TABLE} WHERE ({keys}) IN "
+                          f"(SELECT {keys} FROM {self.TABLE} ORDER BY last_used LIMIT ?)", (excess,))
+        self.conn.commit()
+        logging.info(info(f"Evicted {excess} least recently used entries from the {self.LABEL}"))
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            entries = self.conn.execute(f"SELECT COUNT(*) FROM {self.TABLE}").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0, "entries": entries}
+
+    def log_stats(self):
+        if self.hits + self.misses:
+            stats = self.stats()
+            logging.info(info(f"{_sentence_case(self.LABEL)}: {stats['hits']} hits, {stats['misses']} misses "
+                              f"({stats['hit_rate']:.0%} hit rate), {stats['entries']} entries stored"))
+
+CacheType = TypeVar('CacheType', bound=SQLiteCache)
+
+_caches: Dict[Tuple[type, str], SQLiteCache] = {}
+_caches_lock = threading.Lock()
+
+def get_shared_cache(cache_class: Type[CacheType], enabled: bool, path: str, max_entries: int) -> Optional[CacheType]:
+    """The process-wide cache of `cache_class` at `path`, or None when it is disabled or cannot be opened."""
+    if not enabled:
+        return None
+    with _caches_lock:
+        key = (cache_class, path)
+        if key not in _caches:
+            try:
+                _caches[key] = cache_class(path, max_entries)
+            except sqlite3.Error as e:
+                logging.warning(warning(f"{_sentence_case(cache_class.LABEL)} {path} unavailable: {str(e)}"))
+                return None
+            atexit.register(_caches[key].log_stats)
+        return _caches[key]
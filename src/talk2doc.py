@@ -5,18 +5,22 @@ import logging
 from typing import List, Dict
 from collections import deque
 import json
+import time
 
 # Third-party imports
-import torch
 import numpy as np
-from sentence_transformers import SentenceTransformer
 import networkx as nx
 
 # Local imports
-from src.embeddings_utils import load_embeddings_and_data
+from src.embeddings_utils import encode_texts
+from src.embedding_store import EmbeddingStore, get_store_paths
 from src.search_utils import SearchUtils
+from src.result_fusion import FusedResult, format_results
+from src.vector_index import get_vector_index_path
+from src.model_registry import file_version, get_embeddings, get_knowledge_graph, get_sentence_transformer
+from src.query_cache import context_fingerprint, query_cache
 from src.settings import settings
-from src.api_model import EragAPI
+from src.api_model import EragAPI, is_error_response, print_token
 from src.look_and_feel import success, info, warning, error, colorize, MAGENTA, RESET
 
 # Set up logging
@@ -25,20 +29,24 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 class RAGSystem:
     def __init__(self, erag_api: EragAPI):
         self.erag_api = erag_api
-        self.embedding_model = SentenceTransformer(settings.sentence_transformer_model)
+        self.embedding_model = get_sentence_transformer(settings.sentence_transformer_model, owner=self)
         self.db_embeddings, _, _ = self.load_embeddings()
         self.db_content = self.load_db_content()
         self.conversation_history = []
         self.new_entries = []
+        self.last_response_failed = False
         self.conversation_context = deque(maxlen=settings.conversation_context_size * 2)
         self.knowledge_graph = self.load_knowledge_graph()
-        self.search_utils = SearchUtils(self.erag_api, self.embedding_model, self.db_embeddings, self.db_content, self.knowledge_graph)
+        self.search_utils = SearchUtils(self.erag_api, self.embedding_model, self.db_embeddings, self.db_content, self.knowledge_graph,
+                                        vector_index_path=get_vector_index_path(settings.embeddings_file_path),
+                                        inverted_index_path=settings.inverted_index_file_path)
     
     def load_embeddings(self):
-        embeddings, indexes, content = load_embeddings_and_data(settings.embeddings_file_path)
+        # Shared with other components until the store changes on disk
+        embeddings, indexes, content = get_embeddings(settings.embeddings_file_path, owner=self)
         if embeddings is None or indexes is None or content is None:
             logging.error(f"Failed to load data from {settings.embeddings_file_path}. Make sure the file exists and is properly formatted.")
-            return torch.tensor([]), torch.tensor([]), []
+            return np.empty((0, 0), dtype=np.float32), np.empty(0, dtype=np.int64), []
         return embeddings, indexes, content
     
     def load_db_content(self):
@@ -49,14 +57,11 @@ class RAGSystem:
 
     def load_knowledge_graph(self):
         try:
-            if not os.path.exists(settings.knowledge_graph_file_path):
+            G = get_knowledge_graph(settings.knowledge_graph_file_path, owner=self)
+            if G is None:
                 logging.warning(f"Knowledge graph file {settings.knowledge_graph_file_path} not found.")
                 return nx.Graph()
 
-            with open(settings.knowledge_graph_file_path, 'r') as file:
-                graph_data = json.load(file)
-            
-            G = nx.node_link_graph(graph_data)
             logging.info(f"Successfully loaded knowledge graph with {G.number_of_nodes()} nodes and {G.number_of_edges()} edges.")
             return G
         except json.JSONDecodeError as e:
@@ -66,21 +71,49 @@ class RAGSystem:
         
         return nx.Graph()
 
-    def get_response(self, query: str) -> str:
-        system_message = "You are a helpful assistant that is an expert at extracting the most useful information from a given text. Prioritize the most recent conversation context when answering questions, but also consider other relevant information if necessary. If the given context doesn't provide a suitable answer, rely on your general knowledge."
+    def get_data_version(self):
+        """Changes whenever the embedding store is rewritten or appended to, which invalidates cached answers."""
+        paths = get_store_paths(settings.embeddings_file_path)
+        return file_version([paths['manifest'], paths['legacy']])
 
-        lexical_results, semantic_results, graph_results, text_results = self.search_utils.get_relevant_context(query, list(self.conversation_context))
-        
-        # Combine all contexts for re-ranking
-        all_contexts = lexical_results + semantic_results + graph_results + text_results
+    def embed_query(self, query: str) -> np.ndarray:
+        return encode_texts(self.embedding_model, [query], settings.sentence_transformer_model)[0]
 
-        # Re-rank the combined contexts
-        reranked_contexts = self.search_utils.rerank_results(query, all_contexts, settings.rerank_top_k)
+    def get_response(self, query: str, on_token=None) -> str:
+        """The answer to query; with on_token, the answer is also passed to it as it is generated."""
+        if not settings.query_cache_enabled:
+            return self.generate_response(query, on_token)
+
+        started = time.perf_counter()
+        version = self.get_data_version()
+        fingerprint = context_fingerprint(self.conversation_context, self.erag_api.api_type, self.erag_api.model, settings.temperature)
+        try:
+            response, query_vector = query_cache.lookup(query, fingerprint, version, self.embed_query)
+        except Exception as e:
+            logging.warning(f"Query cache lookup failed: {str(e)}")
+            response, query_vector = None, None
+        if response is not None:
+            print(success(f"Answered from the query cache in {(time.perf_counter() - started) * 1000:.0f} ms"))
+            if on_token is not None:
+                on_token(response)
+            return response
+
+        response = self.generate_response(query, on_token)
+        if not self.last_response_failed:
+            query_cache.store(query, fingerprint, response, query_vector, version)
+        return response
+
+    def generate_response(self, query: str, on_token=None) -> str:
+        self.last_response_failed = False
+        system_message = "You are a helpful assistant that is an expert at extracting the most useful information from a given text. Prioritize the most recent conversation context when answering questions, but also consider other relevant information if necessary. If the given context doesn't provide a suitable answer, rely on your general knowledge."
+
+        # Fused across the retrievers and re-ranked once
+        results = self.search_utils.retrieve(query, list(self.conversation_context))
 
         combined_context = f"""Conversation Context:\n{' '.join(self.conversation_context)}
 
 Relevant Context (Re-ranked):
-{' '.join(reranked_contexts)}"""
+{format_results(results)}"""
 
         messages = [
             {"role": "system", "content": system_message},
@@ -89,15 +122,20 @@ Relevant Context (Re-ranked):
         ]
 
         try:
-            response = self.erag_api.chat(messages, temperature=settings.temperature)
+            response = self.erag_api.chat(messages, temperature=settings.temperature, on_token=on_token)
+            self.last_response_failed = is_error_response(response)
             print(success(f"Generated response for query: {query[:50]}..."))
-            self.save_debug_results(query, lexical_results, semantic_results, graph_results, text_results, reranked_contexts, response)
+            self.save_debug_results(query, results, response)
             return response
         except Exception as e:
             error_message = f"Error in API call: {str(e)}"
             print(error(error_message))
             logging.error(error_message)
-            return f"I'm sorry, but I encountered an error while processing your request: {str(e)}"
+            self.last_response_failed = True
+            response = f"I'm sorry, but I encountered an error while processing your request: {str(e)}"
+            if on_token is not None:
+                on_token(response)
+            return response
 
     def run(self):
         print(warning("Welcome to the RAG system. Type 'exit' to quit or 'clear' to clear conversation history."))
@@ -107,6 +145,7 @@ Relevant Context (Re-ranked):
 
             if user_input.lower() == 'exit':
                 print(warning("Thank you for using the RAG system. Goodbye!"))
+                self.print_cache_stats()
                 self.update_embeddings()
                 break
             elif user_input.lower() == 'clear':
@@ -119,8 +158,13 @@ Relevant Context (Re-ranked):
                 print(error("Please enter a valid question."))
                 continue
 
-            response = self.get_response(user_input)
-            print(colorize("Response: \n\n", MAGENTA) + f"{response}{RESET}")
+            if settings.stream_output:
+                print(colorize("Response: \n\n", MAGENTA) + MAGENTA, end="", flush=True)
+                response = self.get_response(user_input, on_token=print_token)
+                print(RESET)
+            else:
+                response = self.get_response(user_input)
+                print(colorize("Response: \n\n", MAGENTA) + f"{response}{RESET}")
 
             self.conversation_history.append({"role": "user", "content": user_input})
             self.conversation_history.append({"role": "assistant", "content": response})
@@ -131,63 +175,57 @@ Relevant Context (Re-ranked):
 
             self.append_to_db(self.conversation_history[-2:])
 
+    def print_cache_stats(self):
+        if not settings.query_cache_enabled:
+            return
+        stats = query_cache.stats()
+        print(info(f"Query cache: {stats['exact_hits']} exact and {stats['semantic_hits']} semantic hits, {stats['misses']} misses "
+                   f"({stats['hit_rate']:.0%} hit rate), {stats['entries']} answers cached"))
+
     def update_conversation_context(self, user_input: str, assistant_response: str):
         self.conversation_context.append(user_input)
         self.conversation_context.append(assistant_response)
 
     def append_to_db(self, new_entries: List[Dict[str, str]]):
+        # One line per entry, whitespace collapsed as file processing does, so db.txt lines,
+        # db_content and the persisted inverted index stay aligned
+        lines = [" ".join(f"{entry['role']}: {entry['content']}".split()) for entry in new_entries]
         with open(settings.db_file_path, "a", encoding="utf-8") as db_file:
-            for entry in new_entries:
-                db_file.write(f"{entry['role']}: {entry['content']}\n")
-        self.new_entries.extend([entry['content'] for entry in new_entries])
+            for line in lines:
+                db_file.write(f"{line}\n")
+        # Kept as the db.txt lines, so the next full embedding run recognizes them by content hash
+        self.new_entries.extend(lines)
         
         # Also update db_content
-        self.db_content.extend([f"{entry['role']}: {entry['content']}" for entry in new_entries])
+        self.db_content.extend(lines)
 
     def update_embeddings(self):
         if len(self.new_entries) >= settings.update_threshold:
             logging.info("Updating embeddings...")
-            new_embeddings = self.embedding_model.encode(self.new_entries, convert_to_tensor=True, show_progress_bar=False)
-            self.db_embeddings = torch.cat([self.db_embeddings, new_embeddings], dim=0)
-            
-            # Save updated embeddings
-            data_to_save = {
-                'embeddings': self.db_embeddings,
-                'indexes': torch.arange(len(self.db_content)),
-                'content': self.db_content
-            }
-            torch.save(data_to_save, settings.embeddings_file_path)
+            new_embeddings = encode_texts(self.embedding_model, self.new_entries, settings.sentence_transformer_model)
+
+            # Append only the new rows to the store instead of rewriting it
+            store = EmbeddingStore(settings.embeddings_file_path)
+            store.append(new_embeddings, self.new_entries)
+            self.db_embeddings, _ = store.open()
+
+            # Keep the ANN index in step with the appended rows
+            self.search_utils.db_embeddings = self.db_embeddings
+            self.search_utils.get_vector_index().save(get_vector_index_path(settings.embeddings_file_path), store.revision)
             
             self.new_entries.clear()
             logging.info("Embeddings updated successfully.")
 
     def save_debug_results(self, user_input: str, 
-                           lexical_results: List[str],
-                           semantic_results: List[str],
-                           graph_results: List[str],
-                           text_results: List[str],
-                           reranked_results: List[str],
+                           results: List[FusedResult],
                            response: str):
         with open(settings.results_file_path, "a", encoding='utf-8') as f:
             f.write(f"User Input: {user_input}\n\n")
             
-            f.write("Original Search Results:\n")
-            f.write("Lexical Search Results:\n")
-            for i, content in enumerate(lexical_results, 1):
-                f.write(f"{i}. {content}\n")
-            f.write("\nSemantic Search Results:\n")
-            for i, content in enumerate(semantic_results, 1):
-                f.write(f"{i}. {content}\n")
-            f.write("\nGraph Context Results:\n")
-            for i, content in enumerate(graph_results, 1):
-                f.write(f"{i}. {content}\n")
-            f.write("\nText Search Results:\n")
-            for i, content in enumerate(text_results, 1):
-                f.write(f"{i}. {content}\n")
-            
-            f.write("\nRe-ranked Results:\n")
-            for i, content in enumerate(reranked_results, 1):
-                f.write(f"{i}. {content}\n")
+            f.write("Re-ranked Results:\n")
+            for i, result in enumerate(results, 1):
+                rerank_score = f", re-rank score {result.rerank_score:.4f}" if result.rerank_score is not None else ""
+                f.write(f"{i}. [{result.provenance()}; fusion score {result.score:.4f}{rerank_score}] {result.text}\n")
             
             f.write("\nCombined Response:\n")
             f.write(f"{response}\n")
@@ -4,10 +4,13 @@ import os
 from collections import deque
 
 # Third-party imports
-from sentence_transformers import SentenceTransformer
+import torch
 
 # Local imports
 from src.settings import settings
+from src.api_model import print_token
+from src.embeddings_utils import encode_texts
+from src.model_registry import get_sentence_transformer
 from src.look_and_feel import error, success, warning, info, highlight
 
 class Talk2SD:
@@ -17,7 +20,7 @@ class Talk2SD:
         self.schema = self.fetch_schema()
         self.conversation_history = []
         self.conversation_context = deque(maxlen=settings.conversation_context_size * 2)
-        self.embedding_model = SentenceTransformer(settings.sentence_transformer_model)
+        self.embedding_model = get_sentence_transformer(settings.sentence_transformer_model, owner=self)
         self.system_prompt = self.generate_system_prompt()
 
     def fetch_schema(self):
@@ -101,8 +104,13 @@ class Talk2SD:
             if result is not None:
                 print(info(f"Generated SQL query: {sql_query}"))
                 print(info(f"Query result: {result}"))
-                response = self.generate_response(user_input, sql_query, result)
-                print(success(f"AI: {response}"))
+                if settings.stream_output:
+                    print(success("AI: "), end="", flush=True)
+                    response = self.generate_response(user_input, sql_query, result, on_token=print_token)
+                    print()
+                else:
+                    response = self.generate_response(user_input, sql_query, result)
+                    print(success(f"AI: {response}"))
                 self.update_conversation_context(user_input, response)
             else:
                 print(error("Failed to generate a valid SQL query after multiple attempts."))
@@ -157,7 +165,7 @@ class Talk2SD:
             print(error(f"Error executing SQL query: {str(e)}"))
             return None
 
-    def generate_response(self, user_input, sql_query, result):
+    def generate_response(self, user_input, sql_query, result, on_token=None):
         prompt = f"""
         User question: {user_input}
         SQL query: {sql_query}
@@ -169,7 +177,7 @@ class Talk2SD:
         
         Response:
         """
-        response = self.erag_api.chat([{"role": "system", "content": self.system_prompt}, {"role": "user", "content": prompt}])
+        response = self.erag_api.chat([{"role": "system", "content": self.system_prompt}, {"role": "user", "content": prompt}], on_token=on_token)
         return response.strip() if response else None
 
     def update_conversation_context(self, user_input: str, assistant_response: str):
@@ -182,4 +190,6 @@ class Talk2SD:
             self.conversation_history = self.conversation_history[-settings.max_history_length * 3:]
 
     def encode_text(self, text):
-        return self.embedding_model.encode(text, convert_to_tensor=True, show_progress_bar=False)
+        texts = [text] if isinstance(text, str) else list(text)
+        embeddings = torch.from_numpy(encode_texts(self.embedding_model, texts, settings.sentence_transformer_model))
+        return embeddings[0] if isinstance(text, str) else embeddings
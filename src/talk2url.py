@@ -10,7 +10,7 @@ import requests
 
 # Local imports
 from src.settings import settings
-from src.api_model import EragAPI, create_erag_api
+from src.api_model import EragAPI, create_erag_api, print_token
 from src.look_and_feel import success, info, warning, error
 
 class Talk2URL:
@@ -59,7 +59,7 @@ class Talk2URL:
         
         return f"Processed {len(self.url_contents)} URLs successfully."
 
-    def generate_response(self, user_input):
+    def generate_response(self, user_input, on_token=None):
         if settings.talk2url_limit_content_size:
             all_content = "\n\n".join([f"Content from {url}:\n{content[:settings.talk2url_content_size_per_url]}..." 
                                        for url, content in self.url_contents.items()])
@@ -91,7 +91,7 @@ class Talk2URL:
                 *self.conversation_history,
                 {"role": "user", "content": user_message}
             ]
-            response = self.erag_api.chat(messages, temperature=settings.temperature)
+            response = self.erag_api.chat(messages, temperature=settings.temperature, on_token=on_token)
 
             self.conversation_history.append({"role": "user", "content": user_input})
             self.conversation_history.append({"role": "assistant", "content": response})
@@ -99,8 +99,14 @@ class Talk2URL:
             return response
         except Exception as e:
             logging.error(f"Error generating response: {str(e)}")
-            return "I'm sorry, but I encountered an error while trying to answer your question."
+            return self.reply("I'm sorry, but I encountered an error while trying to answer your question.", on_token)
 
+    @staticmethod
+    def reply(message, on_token=None):
+        # Canned answers go to on_token too, so streaming callers print every answer the same way
+        if on_token is not None:
+            on_token(message)
+        return message
 
 
     def extract_urls(self, text):
@@ -173,8 +179,13 @@ class Talk2URL:
                 continue
 
             print(info("Generating response..."))
-            response = self.generate_response(user_input)
-            print(f"\n{success('Response:')}\n{response}")
+            if settings.stream_output:
+                print(f"\n{success('Response:')}")
+                response = self.generate_response(user_input, on_token=print_token)
+                print()
+            else:
+                response = self.generate_response(user_input)
+                print(f"\n{success('Response:')}\n{response}")
 
             with open(self.output_file, "a", encoding="utf-8") as f:
                 f.write(f"Question: {user_input}\n\n")
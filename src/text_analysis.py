@@ -1,7 +1,6 @@
 import os
 import re
 from collections import defaultdict
-import spacy
 import matplotlib.pyplot as plt
 import networkx as nx
 from PyPDF2 import PdfReader
@@ -12,6 +11,7 @@ from sklearn.decomposition import LatentDirichletAllocation
 import numpy as np
 from PIL import Image 
 from src.settings import settings
+from src.model_registry import get_spacy_model
 from src.api_model import EragAPI
 from src.look_and_feel import success, info, warning, error
 from src.print_pdf import PDFReportGenerator
@@ -20,8 +20,9 @@ from textblob import TextBlob
 from nltk.tokenize import sent_tokenize
 from collections import Counter
 
-# Load spaCy model
-nlp = spacy.load("en_core_web_sm")
+def nlp(text):
+    # spaCy model shared through the model registry, loaded on first use
+    return get_spacy_model("en_core_web_sm")(text)
 
 def read_file_content(file_path):
     _, file_extension = os.path.splitext(file_path)
@@ -8,40 +8,35 @@ from src.settings import settings
 from src.api_model import EragAPI
 from src.look_and_feel import success, info, warning, error
 from src.search_utils import SearchUtils
-from sentence_transformers import SentenceTransformer
+from src.result_fusion import format_results
+from src.model_registry import get_sentence_transformer
 from src.embeddings_utils import load_or_compute_embeddings
+from src.vector_index import get_vector_index_path
 
 class RagTextbookGenerator:
     def __init__(self, worker_erag_api: EragAPI, supervisor_erag_api: EragAPI, manager_erag_api: EragAPI = None):
         self.worker_erag_api = worker_erag_api
         self.supervisor_erag_api = supervisor_erag_api
         self.manager_erag_api = manager_erag_api
-        self.embedding_model = SentenceTransformer(settings.sentence_transformer_model)
+        self.embedding_model = get_sentence_transformer(settings.sentence_transformer_model, owner=self)
         self.db_embeddings, self.db_indexes, self.db_content = self.load_embeddings()
-        self.search_utils = SearchUtils(self.worker_erag_api, self.embedding_model, self.db_embeddings, self.db_content, None)  # Pass None for knowledge_graph
+        self.search_utils = SearchUtils(self.worker_erag_api, self.embedding_model, self.db_embeddings, self.db_content, None,  # Pass None for knowledge_graph
+                                        vector_index_path=get_vector_index_path(settings.embeddings_file_path),
+                                        inverted_index_path=settings.inverted_index_file_path)
         self.output_folder = None
         self.improved_output_folder = None
         self.textbook_file = None
         self.improved_textbook_file = None
 
     def load_embeddings(self):
-        embeddings, indexes, content = load_or_compute_embeddings(self.worker_erag_api, settings.db_file_path, settings.embeddings_file_path)
+        embeddings, indexes, content = load_or_compute_embeddings(self.worker_erag_api, settings.db_file_path, settings.embeddings_file_path, sync=False)
         return embeddings, indexes, content
 
     def get_rag_response(self, query: str, system_message: str, api: EragAPI) -> str:
-        lexical_context, semantic_context, graph_context, text_context = self.search_utils.get_relevant_context(query, "")
+        results = self.search_utils.retrieve(query, [])
         
-        combined_context = f"""Lexical Search Results:
-        {' '.join(lexical_context)}
-
-        Semantic Search Results:
-        {' '.join(semantic_context)}
-
-        Knowledge Graph Context:
-        {' '.join(graph_context)}
-
-        Text Search Results:
-        {' '.join(text_context)}"""
+        combined_context = f"""Relevant Context (Lexical, Semantic and Text Search, Re-ranked):
+        {format_results(results)}"""
 
         messages = [
             {"role": "system", "content": system_message},
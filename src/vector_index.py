@@ -0,0 +1,247 @@
+# Standard library imports
+import json
+import logging
+import os
+from typing import Optional, Tuple
+
+# Third-party imports
+import numpy as np
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+# Local imports
+from src.look_and_feel import info, success, warning
+from src.settings import settings
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+INDEX_TYPES = ("exact", "ivf", "hnsw")
+_BLOCK_SIZE = 65536
+
+def get_vector_index_path(embeddings_file_path: str) -> str:
+    """Return the path of the index file stored next to the given embeddings file."""
+    embeddings_file_path = os.path.join(settings.output_folder, os.path.basename(embeddings_file_path))
+    return f"{os.path.splitext(embeddings_file_path)[0]}_index.npz"
+
+def _as_float32(vectors) -> np.ndarray:
+    if hasattr(vectors, 'detach'):
+        vectors = vectors.detach().cpu().numpy()
+    vectors = np.asarray(vectors)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    return vectors if vectors.dtype == np.float32 else vectors.astype(np.float32)
+
+def _row_norms(vectors: np.ndarray) -> np.ndarray:
+    norms = np.empty(len(vectors), dtype=np.float32)
+    for start in range(0, len(vectors), _BLOCK_SIZE):
+        block = np.asarray(vectors[start:start + _BLOCK_SIZE], dtype=np.float32)
+        norms[start:start + len(block)] = np.linalg.norm(block, axis=1)
+    norms[norms == 0] = 1.0
+    return norms
+
+def _assign(vectors: np.ndarray, norms: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), _BLOCK_SIZE):
+        block = np.asarray(vectors[start:start + _BLOCK_SIZE], dtype=np.float32) / norms[start:start + _BLOCK_SIZE, None]
+        assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+def _train_centroids(vectors: np.ndarray, norms: np.ndarray, nlist: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on a sample of the corpus."""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), max(nlist * 64, 10000), 200000)
+    sample_ids = np.sort(rng.choice(len(vectors), sample_size, replace=False))
+    sample = np.asarray(vectors[sample_ids], dtype=np.float32) / norms[sample_ids, None]
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        counts = np.bincount(assignments, minlength=nlist)
+        order = np.argsort(assignments, kind='stable')
+        non_empty = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[non_empty]
+        centroids[non_empty] = np.add.reduceat(sample[order], starts, axis=0)
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = sample[rng.choice(sample_size, len(empty), replace=False)]
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+
+    return centroids
+
+class VectorIndex:
+    """
+    Cosine-similarity index over an embedding matrix.
+
+    Supports exact search, a NumPy IVF (inverted file) index and, when hnswlib
+    is installed, an HNSW graph. The IVF and exact variants score candidates
+    against the original embedding matrix, so only centroids, list assignments
+    and row norms are kept in the index itself.
+    """
+
+    def __init__(self, index_type: str, vectors: np.ndarray, norms: np.ndarray):
+        self.index_type = index_type
+        self.vectors = vectors
+        self.norms = norms
+        self.centroids: Optional[np.ndarray] = None
+        self.assignments: Optional[np.ndarray] = None
+        self.list_offsets: Optional[np.ndarray] = None
+        self.list_ids: Optional[np.ndarray] = None
+        self.hnsw = None
+
+    def __len__(self) -> int:
+        return len(self.norms)
+
+    @property
+    def dim(self) -> int:
+        return self.vectors.shape[1] if self.vectors.ndim == 2 else 0
+
+    @classmethod
+    def build(cls, vectors, index_type: Optional[str] = None) -> "VectorIndex":
+        vectors = _as_float32(vectors)
+        index_type = cls._resolve_type(index_type or settings.vector_index_type, len(vectors))
+        index = cls(index_type, vectors, _row_norms(vectors))
+
+        if index_type == "ivf":
+            nlist = settings.ivf_nlist or int(4 * np.sqrt(len(vectors)))
+            nlist = max(1, min(nlist, len(vectors)))
+            index.centroids = _train_centroids(vectors, index.norms, nlist)
+            index.assignments = _assign(vectors, index.norms, index.centroids)
+            index._build_lists()
+        elif index_type == "hnsw":
+            index.hnsw = hnswlib.Index(space='cosine', dim=vectors.shape[1])
+            index.hnsw.init_index(max_elements=len(vectors), ef_construction=settings.hnsw_ef_construction, M=settings.hnsw_m)
+            index._add_to_hnsw(vectors, 0)
+
+        logging.info(info(f"Built {index_type} vector index over {len(vectors)} embeddings"))
+        return index
+
+    @staticmethod
+    def _resolve_type(index_type: str, size: int) -> str:
+        if index_type not in INDEX_TYPES:
+            logging.warning(warning(f"Unknown vector index type '{index_type}', using exact search"))
+            return "exact"
+        if size < max(settings.vector_index_min_size, 1):
+            return "exact"
+        if index_type == "hnsw" and hnswlib is None:
+            logging.warning(warning("hnswlib is not installed, falling back to the IVF index"))
+            return "ivf"
+        return index_type
+
+    def _build_lists(self):
+        counts = np.bincount(self.assignments, minlength=len(self.centroids))
+        self.list_offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        self.list_ids = np.argsort(self.assignments, kind='stable').astype(np.int64)
+
+    def _add_to_hnsw(self, vectors: np.ndarray, start_id: int):
+        for start in range(0, len(vectors), _BLOCK_SIZE):
+            block = np.asarray(vectors[start:start + _BLOCK_SIZE], dtype=np.float32)
+            self.hnsw.add_items(block, np.arange(start_id + start, start_id + start + len(block)))
+
+    def add(self, new_vectors, all_vectors=None):
+        """
+        Append embeddings to the index; their ids continue after the existing rows.
+        Pass `all_vectors` when the caller already holds the combined matrix to avoid a copy.
+        """
+        new_vectors = _as_float32(new_vectors)
+        if len(new_vectors) == 0:
+            return
+        start_id = len(self)
+        new_norms = _row_norms(new_vectors)
+        if all_vectors is not None:
+            self.vectors = all_vectors
+        else:
+            self.vectors = np.concatenate([np.asarray(self.vectors, dtype=np.float32).reshape(-1, new_vectors.shape[1]), new_vectors])
+        self.norms = np.concatenate([self.norms, new_norms])
+
+        if self.index_type == "ivf":
+            self.assignments = np.concatenate([self.assignments, _assign(new_vectors, new_norms, self.centroids)])
+            self._build_lists()
+        elif self.index_type == "hnsw":
+            self.hnsw.resize_index(len(self))
+            self._add_to_hnsw(new_vectors, start_id)
+
+    def search(self, query, k: int, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the ids and cosine scores of the k nearest embeddings, best first."""
+        query = _as_float32(query)[0]
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        k = min(k, len(self))
+        if k <= 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+
+        if self.index_type == "hnsw":
+            self.hnsw.set_ef(max(settings.hnsw_ef_search, k))
+            labels, distances = self.hnsw.knn_query(query, k=k)
+            return labels[0].astype(np.int64), (1.0 - distances[0]).astype(np.float32)
+
+        if self.index_type == "ivf":
+            # A quarter of the lists by default: fewer probes lose recall on weakly clustered data
+            nprobe = nprobe or settings.ivf_nprobe or max(16, len(self.centroids) // 4)
+            nprobe = min(nprobe, len(self.centroids))
+            probes = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+            candidates = np.concatenate([self.list_ids[self.list_offsets[p]:self.list_offsets[p + 1]] for p in probes])
+            candidates.sort()
+            scores = np.asarray(self.vectors[candidates], dtype=np.float32) @ query / self.norms[candidates]
+        else:
+            candidates = None
+            scores = np.asarray(self.vectors, dtype=np.float32) @ query / self.norms
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind='stable')]
+        ids = candidates[top] if candidates is not None else top
+        return ids.astype(np.int64), scores[top]
+
+    def save(self, path: str, source: Optional[str] = None):
+        """`source` identifies the embeddings indexed (the store revision), so load() can spot a rewritten store."""
+        meta = {"index_type": self.index_type, "count": len(self), "dim": self.dim, "source": source}
+        arrays = {"norms": self.norms}
+        if self.index_type == "ivf":
+            arrays.update(centroids=self.centroids, assignments=self.assignments)
+        elif self.index_type == "hnsw":
+            hnsw_path = f"{os.path.splitext(path)[0]}.hnsw"
+            self.hnsw.save_index(hnsw_path)
+            meta["hnsw_file"] = os.path.basename(hnsw_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez(path, meta=np.array(json.dumps(meta)), **arrays)
+        logging.info(success(f"Saved {self.index_type} vector index to {path}"))
+
+    @classmethod
+    def load(cls, path: str, vectors, source: Optional[str] = None) -> Optional["VectorIndex"]:
+        """Load an index saved by `save`. Returns None if it is missing or does not match `vectors` or `source`."""
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                meta = json.loads(str(data["meta"]))
+                vectors = _as_float32(vectors) if not isinstance(vectors, np.ndarray) else vectors
+                if meta["count"] != len(vectors) or (len(vectors) and meta["dim"] != vectors.shape[1]):
+                    logging.warning(warning(f"Vector index {path} is stale ({meta['count']} entries, {len(vectors)} embeddings)"))
+                    return None
+                if source is not None and meta.get("source") != source:
+                    logging.warning(warning(f"Vector index {path} is stale (built over a different revision of the embeddings)"))
+                    return None
+                index = cls(meta["index_type"], vectors, data["norms"])
+                if index.index_type == "ivf":
+                    index.centroids = data["centroids"]
+                    index.assignments = data["assignments"]
+                    index._build_lists()
+            if index.index_type == "hnsw":
+                if hnswlib is None:
+                    logging.warning(warning("hnswlib is not installed, cannot load the HNSW index"))
+                    return None
+                index.hnsw = hnswlib.Index(space='cosine', dim=meta["dim"])
+                index.hnsw.load_index(os.path.join(os.path.dirname(path), meta["hnsw_file"]), max_elements=meta["count"])
+            logging.info(info(f"Loaded {index.index_type} vector index from {path}"))
+            return index
+        except Exception as e:
+            logging.warning(warning(f"Failed to load vector index {path}: {str(e)}"))
+            return None
+
+def load_or_build_vector_index(vectors, index_path: Optional[str] = None, source: Optional[str] = None) -> VectorIndex:
+    """Load the persisted index for `vectors` if it is current, otherwise build one in memory."""
+    index = VectorIndex.load(index_path, vectors, source) if index_path else None
+    return index if index is not None else VectorIndex.build(vectors)
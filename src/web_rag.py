@@ -9,13 +9,14 @@ from bs4 import BeautifulSoup
 import requests
 from duckduckgo_search import DDGS
 import numpy as np
-from sentence_transformers import SentenceTransformer
 
 # Local imports
 from src.settings import settings
 from src.search_utils import SearchUtils
+from src.embeddings_utils import encode_texts
+from src.model_registry import get_sentence_transformer
 from src.look_and_feel import success, info, warning, error
-from src.api_model import EragAPI, create_erag_api
+from src.api_model import EragAPI, create_erag_api, print_token
 
 class WebRAG:
     def __init__(self, erag_api: EragAPI):
@@ -26,7 +27,7 @@ class WebRAG:
             "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
             "Accept-Language": "en-US,en;q=0.5"
         })
-        self.model = SentenceTransformer(settings.sentence_transformer_model)
+        self.model = get_sentence_transformer(settings.sentence_transformer_model, owner=self)
         self.search_utils = None
         self.all_search_results = []
         self.conversation_history = []
@@ -46,7 +47,7 @@ class WebRAG:
         os.makedirs(settings.output_folder, exist_ok=True)
 
 
-    def search_and_process(self, query):
+    def search_and_process(self, query, on_token=None):
         logging.info(f"Performing search for query: {query}")
         self.current_query = query
         self.search_offset = 0
@@ -60,7 +61,7 @@ class WebRAG:
         self.current_question_file = self.summarize_query(query)
         self.process_relevant_urls(relevant_urls, self.current_question_file)
         
-        answer = self.generate_qa(query)
+        answer = self.generate_qa(query, on_token)
         
         with open(self.web_rag_file, "a", encoding="utf-8") as f:
             f.write(f"Question: {query}\n\n")
@@ -174,15 +175,16 @@ class WebRAG:
                     print(error(f"Failed to process content from {url}"))
 
         if all_content:
-            new_embeddings = self.model.encode(all_content, show_progress_bar=False)
+            new_embeddings = encode_texts(self.model, all_content, settings.sentence_transformer_model)
             self.search_utils.db_embeddings = np.vstack([self.search_utils.db_embeddings, new_embeddings])
             self.search_utils.db_content.extend(all_content)
 
         return True
         
     def _create_embeddings(self, all_content):
-        embeddings = self.model.encode(all_content, show_progress_bar=False)
-        self.search_utils = SearchUtils(self.model, embeddings, all_content, None)
+        # Pages crawled before are served from the embedding cache
+        embeddings = encode_texts(self.model, all_content, settings.sentence_transformer_model)
+        self.search_utils = SearchUtils(self.erag_api, self.model, embeddings, all_content, None)
 
     def create_chunks(self, text):
         chunks = []
@@ -211,10 +213,17 @@ class WebRAG:
             logging.error(f"Error crawling {url}: {str(e)}")
             return None
 
-    def generate_qa(self, query):
+    @staticmethod
+    def reply(message, on_token=None):
+        # Canned answers go to on_token too, so streaming callers print every answer the same way
+        if on_token is not None:
+            on_token(message)
+        return message
+
+    def generate_qa(self, query, on_token=None):
         if self.search_utils is None:
             logging.error("Search utils not initialized. Cannot generate Q&A.")
-            return "I'm sorry, but I don't have enough information to answer that question."
+            return self.reply("I'm sorry, but I don't have enough information to answer that question.", on_token)
 
         lexical_results = self.search_utils.lexical_search(query)[:self.context_size]
         text_results = self.search_utils.text_search(query)[:self.context_size]
@@ -223,7 +232,7 @@ class WebRAG:
         combined_results = lexical_results + text_results + semantic_results
         
         if not combined_results:
-            return "I'm sorry, but I don't have enough relevant information to answer that question."
+            return self.reply("I'm sorry, but I don't have enough relevant information to answer that question.", on_token)
         
         context = "\n\n".join(combined_results)
         
@@ -257,14 +266,14 @@ class WebRAG:
                 *self.conversation_history,
                 {"role": "user", "content": user_message}
             ]
-            response = self.erag_api.chat(messages, temperature=settings.temperature)
+            response = self.erag_api.chat(messages, temperature=settings.temperature, on_token=on_token)
 
             self.update_conversation_history(query, response)
 
             return response
         except Exception as e:
             logging.error(f"Error generating Q&A: {str(e)}")
-            return "I'm sorry, but I encountered an error while trying to answer your question."
+            return self.reply("I'm sorry, but I encountered an error while trying to answer your question.", on_token)
 
 
     def update_conversation_history(self, query, response):
@@ -276,14 +285,31 @@ class WebRAG:
         if len(self.conversation_history) > settings.max_history_length * 2:
             self.conversation_history = self.conversation_history[-settings.max_history_length * 2:]
 
-    def get_response(self, query: str) -> str:
+    def get_response(self, query: str, on_token=None) -> str:
         if not self.search_utils or not self.current_query:
             print(info("Searching and processing web content..."))
-            answer = self.search_and_process(query)
+            answer = self.search_and_process(query, on_token)
         else:
             print(info("Generating answer based on existing knowledge..."))
-            answer = self.generate_qa(query)
+            answer = self.generate_qa(query, on_token)
+
+        return answer
 
+    def print_answer(self, label, answer_func, query):
+        """Print label and the answer from answer_func, token by token when streaming is on."""
+        if not settings.stream_output:
+            answer = answer_func(query)
+            print(f"\n{success(label)}\n{answer}")
+            return answer
+        # Search progress is logged before the first token, so the label is printed with it
+        started = []
+        def on_token(delta):
+            if not started:
+                print(f"\n{success(label)}")
+                started.append(True)
+            print_token(delta)
+        answer = answer_func(query, on_token)
+        print()
         return answer
 
     def run(self):
@@ -314,8 +340,7 @@ class WebRAG:
                 print(info("Searching for new URLs and updating knowledge base..."))
                 if self.process_next_urls():
                     print(info("Generating new answer based on expanded information..."))
-                    new_answer = self.generate_qa(self.current_query)
-                    print(f"\n{success('Updated Answer:')}\n{new_answer}")
+                    new_answer = self.print_answer('Updated Answer:', self.generate_qa, self.current_query)
                     with open(self.web_rag_file, "a", encoding="utf-8") as f:
                         f.write(f"Updated Answer:\n{new_answer}\n\n")
                         f.write("-" * 50 + "\n\n")
@@ -324,13 +349,11 @@ class WebRAG:
 
             if not self.search_utils or not self.current_query:
                 print(info("Searching and processing web content..."))
-                answer = self.search_and_process(user_input)
-                print(f"\n{success('Answer:')}\n{answer}")
+                self.print_answer('Answer:', self.search_and_process, user_input)
                 print(success("Relevant content has been processed. You can now ask follow-up questions or use 'check' to process more URLs."))
             else:
                 print(info("Generating answer based on existing knowledge..."))
-                answer = self.generate_qa(user_input)
-                print(f"\n{success('Answer:')}\n{answer}")
+                self.print_answer('Answer:', self.generate_qa, user_input)
 
             print(success("You can ask follow-up questions, start a new search, or use 'check' to process more URLs and update the knowledge base."))
 
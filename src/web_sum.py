@@ -16,6 +16,7 @@ from duckduckgo_search import DDGS
 from src.settings import settings
 from src.look_and_feel import success, info, warning, error
 from src.api_model import EragAPI, create_erag_api
+from src.response_cache import CACHE_LOW_TEMPERATURE
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -146,7 +147,7 @@ class WebSum:
                 {"role": "system", "content": system_message},
                 {"role": "user", "content": user_message}
             ]
-            response = self.erag_api.chat(messages, temperature=settings.temperature)
+            response = self.erag_api.chat(messages, temperature=settings.temperature, cache=CACHE_LOW_TEMPERATURE)
 
             return f"Summary {index}:\n{response}\n\n{'='*50}\n\n"
         except Exception as e:
@@ -0,0 +1,56 @@
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("dotenv")
+
+from src.api_model import ChatStream, EragAPI, GroqClient, is_error_response
+
+
+class _FailingCompletions:
+    def create(self, **kwargs):
+        raise ConnectionError("connection refused")
+
+
+class _FailingClient:
+    """Stands in for the OpenAI-style SDK clients; every request fails to connect."""
+
+    def __init__(self):
+        self.chat = type("Chat", (), {"completions": _FailingCompletions()})()
+
+
+def _erag_api(api_type, client):
+    erag_api = EragAPI.__new__(EragAPI)
+    erag_api.api_type = api_type
+    erag_api.model = "test-model"
+    erag_api.client = client
+    return erag_api
+
+
+def _groq_client():
+    groq_client = GroqClient.__new__(GroqClient)
+    groq_client.client = _FailingClient()
+    groq_client.model = "test-model"
+    return groq_client
+
+
+@pytest.mark.parametrize("api_type, client", [("ollama", _FailingClient()), ("groq", _groq_client())])
+def test_streamed_chat_returns_connection_error_as_text(api_type, client):
+    erag_api = _erag_api(api_type, client)
+    tokens = []
+
+    response = erag_api.chat([{"role": "user", "content": "Hello"}], on_token=tokens.append)
+
+    assert is_error_response(response)
+    assert "connection refused" in response
+    assert "".join(tokens) == response
+
+
+@pytest.mark.parametrize("api_type, client", [("ollama", _FailingClient()), ("groq", _groq_client())])
+def test_chat_stream_defers_request_until_iterated(api_type, client):
+    erag_api = _erag_api(api_type, client)
+
+    chat_stream = erag_api.chat([{"role": "user", "content": "Hello"}], stream=True)
+
+    assert isinstance(chat_stream, ChatStream)
+    assert is_error_response(chat_stream.consume())
+    assert "connection refused" in chat_stream.error